@@ -0,0 +1,70 @@
+"""
+Cold archive of old consultations. api.tasks.archive_old_consultations moves
+the section texts (output_text_1 to 12, most of an LLMOutput row) of
+consultations older than LLM_OUTPUT_ARCHIVE_AFTER_DAYS into gzipped JSON in
+the GCS bucket. The row stays as a stub, with the patient, remarks and dates,
+archived_at and archive_path. Postgres reuses the freed TOAST space for new
+rows after autovacuum.
+
+Readers call hydrate_consultation (or load_archive for values() rows), which
+fetches the archive on demand and caches it for LLM_OUTPUT_ARCHIVE_CACHE_SECONDS.
+A text saved to the row after archiving, e.g. a reloaded section, takes
+precedence over the archived one.
+"""
+import gzip
+
+import orjson
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .gcs import get_bucket
+from .models import LLMOutput
+
+ARCHIVE_PREFIX = "archive/consultations/"
+ARCHIVED_FIELDS = [f"output_text_{prompt_id}" for prompt_id in range(1, 13)]
+
+def archive_object_path(output):
+    return f"{ARCHIVE_PREFIX}{output.created_at:%Y/%m}/{output.id}.json.gz"
+
+def archive_consultation(output):
+    """
+    Uploads the section texts of an LLMOutput and clears them from its row.
+    Returns False, leaving the row as it was, when the consultation changed
+    since it was read.
+    """
+    path = archive_object_path(output)
+    payload = {name: getattr(output, name) for name in ARCHIVED_FIELDS}
+    get_bucket().blob(path).upload_from_string(gzip.compress(orjson.dumps(payload)),
+                                               content_type="application/gzip")
+
+    # updated_at is left alone, archiving doesn't change the consultation
+    archived = LLMOutput.objects.filter(id=output.id, updated_at=output.updated_at, archived_at__isnull=True).update(
+        archived_at=timezone.now(), archive_path=path, **{name: None for name in ARCHIVED_FIELDS},
+    )
+    if not archived:
+        # Written to meanwhile, archive it on a later run
+        get_bucket().blob(path).delete()
+    return bool(archived)
+
+def load_archive(output_id, archive_path):
+    """
+    The archived section texts of a consultation, {field: text}.
+    """
+    cache_key = f"archive:consultation:{output_id}"
+    payload = cache.get(cache_key)
+    if payload is None:
+        payload = orjson.loads(gzip.decompress(get_bucket().blob(archive_path).download_as_bytes()))
+        cache.set(cache_key, payload, timeout=settings.LLM_OUTPUT_ARCHIVE_CACHE_SECONDS)
+    return payload
+
+def hydrate_consultation(output):
+    """
+    Fills in an archived LLMOutput's section texts, in place.
+    """
+    if output.archived_at is None:
+        return output
+    for name, text in load_archive(output.id, output.archive_path).items():
+        if getattr(output, name) is None:
+            setattr(output, name, text)
+    return output
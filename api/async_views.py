@@ -0,0 +1,287 @@
+"""
+Async versions of the I/O-bound endpoints, served instead of the sync views in
+api/views.py when ASYNC_VIEWS is on and the app runs under ASGI (see
+gloport_backend/gunicorn_asgi.py). While a request waits on the database, Redis
+or an LLM provider the worker's event loop serves other requests.
+
+Authentication, permissions and throttling are the sync DRF classes, adrf runs
+them in a thread.
+"""
+import asyncio
+import logging
+from functools import partial
+
+from adrf.views import APIView
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .archive import hydrate_consultation
+from .generate_jivi import asend_to_jivi
+from .idempotency import IDEMPOTENCY_HEADER, idempotent
+from .models import LLMOutput, PatientData, PatientDeviceData
+from .permissions import DeviceRegisteredPermission
+from .prompt_jivi import generate_initial_prompt, generate_system_prompt, generate_table_prompt
+from .redis_client import get_async_redis
+from .resilience import ProviderUnavailableError
+from .serializer import LLMOutputSerializer, PatientDataSerializer
+from .tasks import (PROMPT_IDS, SECTION_PROMPT_IDS, consultation_base_prompt, dispatch_sections,
+                    generate_combined_sections, generate_section, redis_key, save_section)
+from .throttling import LLMGenerationThrottle
+from .views import GenerateJiviResponse, consultation_status_data, provider_unavailable_response
+
+logger = logging.getLogger(__name__)
+
+class AsyncGenerateJiviResponse(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated, DeviceRegisteredPermission]
+    throttle_classes = [LLMGenerationThrottle]
+
+    FILE_CATEGORIES = GenerateJiviResponse.FILE_CATEGORIES
+    parse_consultation = GenerateJiviResponse.parse_consultation
+    upload_files = GenerateJiviResponse.upload_files
+
+    async def post(self, request):
+        if not request.headers.get(IDEMPOTENCY_HEADER):
+            return await self.generate(request)
+        # Retries with the same Idempotency-Key get the first request's response
+        handler = partial(async_to_sync(self.generate), request)
+        return await sync_to_async(idempotent, thread_sensitive=False)(request, handler)
+
+    async def generate(self, request):
+        try:
+            user = request.user
+            fields, error_response = self.parse_consultation(request)
+            if error_response is not None:
+                return error_response
+
+            sensor_data_id, phoneNumber = fields["sensor_data_id"], fields["phoneNumber"]
+
+            patient, created = await PatientData.objects.aget_or_create(
+                patient_mobile_number=phoneNumber,
+                defaults={'name': fields["patientName"], 'age': fields["age"], 'gender': fields["gender"]}
+            )
+
+            sensor_data = await PatientDeviceData.objects.filter(
+                id=sensor_data_id,
+                device_serial_number__in=user.device_serial_numbers
+            ).afirst()
+            if not sensor_data:
+                return Response({"message": "Sensor Data Not Found"}, status=status.HTTP_404_NOT_FOUND)
+
+            uploaded_files = await sync_to_async(self.upload_files, thread_sensitive=False)(
+                request, sensor_data_id, phoneNumber
+            )
+
+            output_text_10 = None
+            if not uploaded_files:
+                output_text_10 = "No files were uploaded"
+
+            system_prompt = generate_system_prompt()
+            base_prompt = consultation_base_prompt(
+                patient, sensor_data, fields["symptoms"], fields["history"], fields["notes"]
+            )
+
+            sections = {}
+            if settings.LLM_GENERATION_MODE == "combined":
+                sections = await sync_to_async(generate_combined_sections, thread_sensitive=False)(
+                    system_prompt, base_prompt, user.medication, user.id
+                )
+
+            # Sections 1 and 11 are needed before responding, request them side by side
+            jivi_response = sections.pop(1, None)
+            jivi_response_table = sections.pop(11, None)
+            calls = {}
+            if jivi_response is None:
+                calls[1] = asend_to_jivi(system_prompt, generate_initial_prompt(base_prompt),
+                                         prompt_id=1, doctor_id=user.id)
+            if jivi_response_table is None:
+                calls[11] = asend_to_jivi(system_prompt, generate_table_prompt(base_prompt),
+                                          prompt_id=11, doctor_id=user.id)
+            results = dict(zip(calls, await asyncio.gather(*calls.values())))
+            jivi_response = results.get(1, jivi_response)
+            jivi_response_table = results.get(11, jivi_response_table)
+
+            model_output = await LLMOutput.objects.acreate(
+                output_text_1=jivi_response,
+                output_text_10=output_text_10,
+                output_text_11=jivi_response_table,
+                sensor_data=sensor_data,
+                patient_mobile_number=phoneNumber,
+                symptoms=fields["symptoms"],
+                history=fields["history"],
+                notes=fields["notes"],
+                medication_type=user.medication,
+                file_urls=uploaded_files,
+                **{f"output_text_{prompt_id}": text for prompt_id, text in sections.items()}
+            )
+
+            await sync_to_async(dispatch_sections)(
+                model_output.id,
+                pending_ids=[prompt_id for prompt_id in PROMPT_IDS if prompt_id not in sections],
+                done_ids=[prompt_id for prompt_id in PROMPT_IDS if prompt_id in sections],
+            )
+
+            return Response({"model_output_id": model_output.id}, status=status.HTTP_200_OK)
+
+        except ProviderUnavailableError as e:
+            return provider_unavailable_response(e)
+
+        except RuntimeError as e:
+            return Response({"message": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+
+        except Exception as e:
+            logger.exception("Generating a consultation failed")
+            return Response({"message": f"Error Occurred. Error: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    async def put(self, request):
+        try:
+            user = request.user
+            output_id = request.data.get('output_id')
+            prompt_id = request.data.get('prompt_id')
+            reload = request.data.get('reload', False)
+
+            if not prompt_id:
+                return Response({"message": "prompt_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                prompt_id = int(prompt_id)
+            except ValueError:
+                return Response({"message": "Invalid prompt_id"}, status=status.HTTP_400_BAD_REQUEST)
+
+            status_val = await get_async_redis().get(redis_key(output_id, prompt_id))
+            if status_val:
+                status_decoded = status_val.decode()
+                if status_decoded in ("pending", "processing"):
+                    return Response({
+                        "status": status_decoded,
+                        "message": "Output is being generated. Please try again later.",
+                    }, status=status.HTTP_202_ACCEPTED)
+
+            model_output = await LLMOutput.objects.select_related("sensor_data").aget(id=output_id)
+            if model_output.archived_at is not None:
+                await sync_to_async(hydrate_consultation, thread_sensitive=False)(model_output)
+
+            check_updated_text = getattr(model_output, f"output_text_{prompt_id}", None)
+
+            if not reload and check_updated_text is not None and str(check_updated_text).strip() != "":
+                data = await sync_to_async(lambda: LLMOutputSerializer(model_output).data)()
+                return Response({
+                    "message": "Prompt output updated successfully",
+                    "model_output_id": model_output.id,
+                    "updatedText": check_updated_text,
+                    "data": data,
+                }, status=status.HTTP_200_OK)
+
+            sensor_data = model_output.sensor_data
+
+            if sensor_data.device_serial_number not in user.device_serial_numbers:
+                return Response({"message": "Data Does Not Match Your Device"}, status=status.HTTP_403_FORBIDDEN)
+
+            patient = await PatientData.objects.aget(patient_mobile_number=model_output.patient_mobile_number)
+
+            system_prompt = generate_system_prompt()
+            base_prompt = consultation_base_prompt(
+                patient, sensor_data, model_output.symptoms, model_output.history, model_output.notes
+            )
+
+            if prompt_id not in SECTION_PROMPT_IDS:
+                return Response({"message": "Invalid prompt_id"}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Sections go through the same coalescing and resilience as the Celery workers.
+            # Off the thread-sensitive executor, so a slow provider call doesn't hold up every
+            # other sync_to_async call in the process.
+            updated_text = await sync_to_async(generate_section, thread_sensitive=False)(
+                model_output, prompt_id, system_prompt, base_prompt, reload=bool(reload)
+            )
+            if updated_text is not None:
+                await sync_to_async(save_section, thread_sensitive=False)(model_output, prompt_id, updated_text)
+
+            data = await sync_to_async(lambda: LLMOutputSerializer(model_output).data)()
+
+            return Response({
+                "message": "Prompt output updated successfully",
+                "model_output_id": model_output.id,
+                "updatedText": getattr(model_output, f"output_text_{prompt_id}", None),
+                "data": data
+            }, status=status.HTTP_200_OK)
+
+        except LLMOutput.DoesNotExist:
+            return Response({"message": "Invalid prompt_id"}, status=status.HTTP_404_NOT_FOUND)
+
+        except ProviderUnavailableError as e:
+            return provider_unavailable_response(e)
+
+        except RuntimeError as e:
+            return Response({"message": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+
+        except Exception:
+            logger.exception("Regenerating a section failed")
+            return Response({"message": "Error Occurred"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class AsyncPromptStatusView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated, DeviceRegisteredPermission]
+
+    async def get(self, request):
+        output_id = request.GET.get("output_id")
+        prompt_id = request.GET.get("prompt_id")
+        if not output_id or not prompt_id:
+            return Response({"status": "invalid"}, status=400)
+        status_val = await get_async_redis().get(redis_key(output_id, prompt_id))
+        if status_val:
+            return Response({"status": status_val.decode()})
+        return Response({"status": "not_started"})
+
+class AsyncStatusView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated, DeviceRegisteredPermission]
+
+    async def get(self, request, id):
+        user = request.user
+
+        model_output = await LLMOutput.objects.select_related("sensor_data").filter(id=id).afirst()
+        if model_output is None:
+            return Response({"detail": "No LLMOutput matches the given query."}, status=status.HTTP_404_NOT_FOUND)
+
+        if model_output.sensor_data.device_serial_number not in user.device_serial_numbers:
+            return Response({"message": "Data Does Not Match Your Device"}, status=status.HTTP_403_FORBIDDEN)
+
+        if model_output.archived_at is not None:
+            await sync_to_async(hydrate_consultation, thread_sensitive=False)(model_output)
+
+        patient = await PatientData.objects.aget(patient_mobile_number=model_output.patient_mobile_number)
+
+        previous_visits = [
+            visit async for visit in LLMOutput.objects.filter(
+                patient_mobile_number=model_output.patient_mobile_number
+            ).exclude(id=id).values("id", "doctor_remark", "created_at").order_by("-created_at")
+        ]
+
+        visits_serializer = LLMOutputSerializer(previous_visits, many=True, fields=["id", "doctor_remark", "created_at"])
+        serializer = PatientDataSerializer(patient)
+
+        response_data = consultation_status_data(model_output, serializer.data, visits_serializer.data)
+
+        return Response(response_data, status=status.HTTP_200_OK)
+
+class AsyncLLMOutputCheck(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated, DeviceRegisteredPermission]
+
+    async def get(self, request, id):
+        try:
+            user = request.user
+            # Same responses as LLMOutputCheck, which also answers 500 when there is no output
+            output = await LLMOutput.objects.select_related("sensor_data").aget(sensor_data=id)
+
+            if output.sensor_data.device_serial_number not in user.device_serial_numbers:
+                return Response({"message": "Data Does Not Match Your Device"}, status=status.HTTP_403_FORBIDDEN)
+
+            return Response({"message": "Output exists"}, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response({"message": "Server Error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,89 @@
+"""
+Clients for the LLM providers and GCS, built on first use, once per process.
+Nothing here reads credentials or sets up connection pools at import, so
+gunicorn, Celery workers and manage.py commands start without paying for
+clients they may never use (see benchmarks/import_time.py).
+
+A client is never shared across a fork. With gunicorn --preload or Celery's
+prefork pool, a child that inherited its parent's client would share its
+pooled sockets, so each process builds its own.
+
+The Redis client (api.redis_client.REDIS_CONN) is not here: redis-py only
+connects on the first command and its pool already resets itself after a
+fork.
+
+asyncio clients are built once per event loop rather than per process:
+their connection pool is bound to the loop that first used it.
+"""
+import asyncio
+import os
+import weakref
+from functools import wraps
+
+from django.conf import settings
+
+def per_process(factory):
+    """
+    Decorator: the first call in each process runs factory(), later calls
+    return the same object.
+    """
+    instances = {}
+
+    @wraps(factory)
+    def get():
+        pid = os.getpid()
+        instance = instances.get(pid)
+        if instance is None:
+            instances.clear()  # The parent's, after a fork
+            instance = instances.setdefault(pid, factory())
+        return instance
+
+    get.cache_clear = instances.clear
+    return get
+
+def per_loop(factory):
+    """
+    Decorator for asyncio clients: the first call on each running event loop
+    runs factory(), later calls on that loop return the same object.
+    """
+    instances = weakref.WeakKeyDictionary()
+
+    @wraps(factory)
+    def get():
+        loop = asyncio.get_running_loop()
+        instance = instances.get(loop)
+        if instance is None:
+            instance = instances[loop] = factory()
+        return instance
+
+    get.cache_clear = instances.clear
+    return get
+
+# Retries are handled by api.resilience, not by the client library
+
+@per_process
+def openai_client():
+    from openai import OpenAI
+    return OpenAI(api_key=settings.GPT_KEY, base_url=settings.GPT_URL, max_retries=0)
+
+@per_process
+def grok_client():
+    from openai import OpenAI
+    return OpenAI(api_key=settings.GROK_KEY, base_url=settings.GROK_URL, max_retries=0)
+
+@per_loop
+def async_openai_client():
+    # Used by the async views (api/async_views.py) under ASGI, and by hedged calls
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=settings.GPT_KEY, base_url=settings.GPT_URL, max_retries=0)
+
+@per_loop
+def async_grok_client():
+    # Used by hedged calls (api.resilience)
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=settings.GROK_KEY, base_url=settings.GROK_URL, max_retries=0)
+
+@per_process
+def storage_client():
+    from google.cloud import storage
+    return storage.Client(credentials=settings.GS_CREDENTIALS)
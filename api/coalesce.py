@@ -0,0 +1,84 @@
+import json
+import math
+import time
+import uuid
+
+from .resilience import ProviderUnavailableError
+
+# Deletes the lock only if we still own it
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+def _unpack(payload):
+    result = json.loads(payload)
+    if "retry_after" in result:
+        raise ProviderUnavailableError(result["error"], retry_after=result["retry_after"])
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result["ok"]
+
+def _lead(conn, fn, lock_key, result_key, channel, token, result_ttl):
+    try:
+        try:
+            value = fn()
+        except Exception as e:
+            # Waiters fail with the same error, but it is not cached for later callers
+            error = {"error": str(e)}
+            if isinstance(e, ProviderUnavailableError):
+                error["retry_after"] = e.retry_after
+            conn.publish(channel, json.dumps(error))
+            raise
+
+        payload = json.dumps({"ok": value})
+        pipe = conn.pipeline()
+        pipe.setex(result_key, result_ttl, payload)
+        pipe.publish(channel, payload)
+        pipe.execute()
+        return value
+    finally:
+        conn.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+def single_flight(conn, key, fn, lock_ttl=300, wait_timeout=300, result_ttl=10, reuse_result=True):
+    """
+    Runs fn() at most once at a time across all processes for the same key.
+    The caller that takes the Redis lock runs fn and fans the result out over
+    pub/sub; concurrent callers wait for that result instead of repeating the
+    work. The result stays readable for result_ttl seconds to cover callers
+    arriving just after it was published, unless they pass reuse_result=False
+    to only join a call still in flight. fn must return a JSON-serialisable
+    value.
+
+    Raises RuntimeError if the leading call failed or no result arrived
+    within wait_timeout seconds.
+    """
+    lock_key, result_key, channel = f"{key}:lock", f"{key}:result", f"{key}:done"
+    token = uuid.uuid4().hex
+
+    # Subscribe before checking anything so a result published in between is not missed
+    pubsub = conn.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(channel)
+    try:
+        deadline = time.monotonic() + wait_timeout
+        while True:
+            payload = conn.get(result_key) if reuse_result else None
+            if payload is not None:
+                return _unpack(payload)
+
+            # Also taken over if the previous leader died and its lock expired
+            # Whole seconds, redis-py rejects a float `ex` (section timeouts are floats)
+            if conn.set(lock_key, token, nx=True, ex=math.ceil(lock_ttl)):
+                return _lead(conn, fn, lock_key, result_key, channel, token, result_ttl)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RuntimeError(f"Timed out waiting for in-flight result of {key}")
+
+            message = pubsub.get_message(timeout=min(1.0, remaining))
+            if message is not None:
+                return _unpack(message["data"])
+    finally:
+        pubsub.close()
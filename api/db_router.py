@@ -0,0 +1,152 @@
+"""
+Read replicas. ReplicaRouter sends reads to one of DATABASE_REPLICAS (see
+DB_REPLICA_HOSTS in settings) and every write to the primary, "default".
+
+Only reads made while ReplicaRoutingMiddleware handles a GET, HEAD or OPTIONS
+request go to a replica, the same one for the whole request. Everything else
+stays on the primary: requests that change data, reads after a write or inside
+a transaction, Celery tasks and management commands. After a doctor changes
+something (a remark, a new consultation) their reads stay on the primary for
+DB_PRIMARY_STICKY_SECONDS, so they see their own writes whatever the
+replication lag. Celery tasks writing on a doctor's behalf (a finished
+section) call stick_to_primary for the same effect.
+"""
+import contextvars
+import random
+
+import redis
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .redis_client import REDIS_CONN, get_async_redis
+
+READ_ONLY_METHODS = ("GET", "HEAD", "OPTIONS")
+
+class _Routing:
+    def __init__(self, replica):
+        self.replica = replica  # None: this request reads from the primary
+        self.wrote = False
+
+_routing = contextvars.ContextVar("db_routing", default=None)
+
+def sticky_key(user_id):
+    return f"db:primary:{user_id}"
+
+def stick_to_primary(user_id):
+    """
+    Sends the doctor's reads to the primary for DB_PRIMARY_STICKY_SECONDS, after
+    a write made outside their requests. Does nothing without DATABASE_REPLICAS.
+    """
+    if settings.DATABASE_REPLICAS:
+        REDIS_CONN.set(sticky_key(user_id), 1, ex=settings.DB_PRIMARY_STICKY_SECONDS)
+
+def request_user_id(request):
+    """
+    Doctor id from the request's access token, checked but without a database
+    query. None without a valid token.
+    """
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    try:
+        raw_token = header and auth.get_raw_token(header)
+        if not raw_token:
+            return None
+        return auth.get_validated_token(raw_token).get(jwt_settings.USER_ID_CLAIM)
+    except AuthenticationFailed:
+        return None
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if (routing is None or routing.replica is None or routing.wrote
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+class ReplicaRoutingMiddleware:
+    """
+    Picks the database for a request's reads and keeps a doctor on the primary
+    after they wrote. Does nothing without DATABASE_REPLICAS.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        user_id = request_user_id(request)
+        sticky = False
+        if request.method in READ_ONLY_METHODS and user_id is not None:
+            try:
+                sticky = REDIS_CONN.exists(sticky_key(user_id)) == 1
+            except redis.RedisError:
+                sticky = True  # Can't tell, the primary is always up to date
+        routing = _Routing(self.choose_replica(request, sticky))
+        token = _routing.set(routing)
+        try:
+            return self.get_response(request)
+        finally:
+            _routing.reset(token)
+            if routing.wrote and user_id is not None:
+                try:
+                    REDIS_CONN.set(sticky_key(user_id), 1, ex=settings.DB_PRIMARY_STICKY_SECONDS)
+                except redis.RedisError:
+                    pass  # The write is done, don't fail the response over it
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        user_id = request_user_id(request)
+        sticky = False
+        if request.method in READ_ONLY_METHODS and user_id is not None:
+            try:
+                sticky = await get_async_redis().exists(sticky_key(user_id)) == 1
+            except redis.RedisError:
+                sticky = True
+        # The ORM runs in sync_to_async threads, which get a copy of this context
+        # holding the same _Routing, so their writes are seen here
+        routing = _Routing(self.choose_replica(request, sticky))
+        token = _routing.set(routing)
+        try:
+            return await self.get_response(request)
+        finally:
+            _routing.reset(token)
+            if routing.wrote and user_id is not None:
+                try:
+                    await get_async_redis().set(sticky_key(user_id), 1, ex=settings.DB_PRIMARY_STICKY_SECONDS)
+                except redis.RedisError:
+                    pass
+
+    def choose_replica(self, request, sticky):
+        if sticky or request.method not in READ_ONLY_METHODS:
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
@@ -0,0 +1,109 @@
+import base64
+import hashlib
+import json
+import os
+import smtplib
+
+from cryptography.fernet import Fernet
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import render_to_string
+from django.utils.encoding import force_bytes
+from django.utils.html import strip_tags
+from django.utils.http import urlsafe_base64_encode
+
+User = get_user_model()
+
+_connection = None
+_connection_pid = None
+
+def _build(subject, template, context, to):
+    html_content = render_to_string(template, context)
+    plain_text_content = strip_tags(html_content)  # Fallback for email clients that don't support HTML
+
+    email = EmailMultiAlternatives(
+        subject=subject,
+        body=plain_text_content,
+        from_email=settings.EMAIL_HOST_USER,
+        to=to,
+    )
+    email.attach_alternative(html_content, "text/html")
+    return email
+
+def build_verification_email(user):
+    token = default_token_generator.make_token(user)
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    link = f"{settings.FRONTEND_URL}/verify-email/{uid}/{token}/"
+
+    return _build("Verify your email address", 'verify_email.html', {
+        'username': user.username,
+        'verify_url': link,
+    }, [user.email])
+
+def build_otp_email(user, otp):
+    return _build("One Time Password (OTP) for login", 'otp_login.html', {
+        'username': user.username,
+        'otp': otp,
+    }, [user.email])
+
+def _context_cipher():
+    key = hashlib.sha256(f"api.emails.context:{settings.SECRET_KEY}".encode()).digest()
+    return Fernet(base64.urlsafe_b64encode(key))
+
+def seal_context(context):
+    """
+    Encrypts an email's template context (e.g. the OTP) for the Redis outbox,
+    with a key derived from SECRET_KEY.
+    """
+    return _context_cipher().encrypt(json.dumps(context).encode()).decode()
+
+def open_context(sealed):
+    return json.loads(_context_cipher().decrypt(sealed.encode()))
+
+def build_email(payload):
+    """
+    Renders a queued email payload ({"kind", "user_id", "context"}, the context
+    sealed by seal_context). Returns None if the user no longer exists.
+    """
+    user = User.objects.filter(pk=payload["user_id"]).first()
+    if user is None:
+        return None
+    if payload["kind"] == "verification":
+        return build_verification_email(user)
+    if payload["kind"] == "otp":
+        return build_otp_email(user, open_context(payload["context"])["otp"])
+    raise ValueError(f"Unknown email kind {payload['kind']}")
+
+def get_smtp_connection():
+    """
+    SMTP connection kept open for the life of the worker process, so queued
+    emails don't pay the SSL handshake one by one. Re-created after a fork.
+    """
+    global _connection, _connection_pid
+    if _connection is None or _connection_pid != os.getpid():
+        _connection = get_connection()
+        _connection_pid = os.getpid()
+    _connection.open()  # No-op while the connection is already open
+    return _connection
+
+def close_smtp_connection():
+    global _connection
+    if _connection is not None and _connection_pid == os.getpid():
+        try:
+            _connection.close()
+        except Exception:
+            pass
+    _connection = None
+
+def send_email(message):
+    """
+    Sends a message over the persistent connection, reconnecting once if the
+    server dropped it while idle.
+    """
+    try:
+        get_smtp_connection().send_messages([message])
+    except smtplib.SMTPServerDisconnected:
+        close_smtp_connection()
+        get_smtp_connection().send_messages([message])
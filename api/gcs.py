@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .clients import storage_client
+
+UPLOAD_PREFIX = "uploads/"
+
+def get_bucket():
+    return storage_client().bucket(settings.GS_BUCKET_NAME)
+
+def upload_file(file_obj, object_path):
+    """
+    Uploads a file to the bucket and returns its object path.
+    """
+    blob = get_bucket().blob(object_path)
+    blob.upload_from_file(file_obj, content_type=file_obj.content_type)
+    return object_path
+
+def signed_url(object_path):
+    """
+    Returns a signed URL for an object path. URLs are cached by path and
+    evicted ahead of their expiry, so callers never receive a dead link.
+    """
+    cache_key = f"gcs:signed_url:{object_path}"
+    url = cache.get(cache_key)
+    if url is None:
+        lifetime = timedelta(hours=settings.GS_SIGNED_URL_EXPIRY_HOURS)
+        url = get_bucket().blob(object_path).generate_signed_url(expiration=lifetime)
+
+        refresh_margin = timedelta(minutes=settings.GS_SIGNED_URL_REFRESH_MARGIN_MINUTES)
+        cache_seconds = int((lifetime - refresh_margin).total_seconds())
+        if cache_seconds > 0:
+            cache.set(cache_key, url, timeout=cache_seconds)
+    return url
+
+def signed_urls(file_paths):
+    """
+    Maps a {category: object_path} dict to {category: signed_url}.
+    """
+    return {category: signed_url(path) for category, path in (file_paths or {}).items()}
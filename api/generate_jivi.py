@@ -1,14 +1,98 @@
+import json
+import time
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from openai import OpenAI
+import openai
+
+from .clients import async_grok_client, async_openai_client, grok_client, openai_client
+from .metrics import record_llm_call
+from .profiling import record_timing
+from .resilience import (ProviderUnavailableError, RETRYABLE_ERRORS, acall_with_resilience, call_with_resilience,
+                         section_timeout)
+
+def call_outcome(error):
+    if error is None:
+        return "ok"
+    if isinstance(error, ProviderUnavailableError):
+        return "circuit_open"
+    if isinstance(error, (TimeoutError, openai.APITimeoutError)):
+        return "timeout"
+    if isinstance(error, RETRYABLE_ERRORS):
+        return "provider_error"
+    return "error"
+
+def create_completion(provider, llm_client, async_client, prompt_id=None, doctor_id=None, **kwargs):
+    """
+    Creates a chat completion through the resilience layer, using the
+    section's timeout budget for prompt_id, and records its latency, token
+    usage and outcome. Hedged attempts use the AsyncOpenAI client returned by
+    async_client(), so the losing one can be cancelled.
+    """
+    def request(timeout):
+        return llm_client.with_options(timeout=timeout).chat.completions.create(**kwargs)
 
-client = OpenAI(api_key=settings.GPT_KEY)
+    async def arequest(timeout):
+        return await async_client().with_options(timeout=timeout).chat.completions.create(**kwargs)
 
-grok_client = OpenAI(
-  api_key=settings.GROK_KEY,
-  base_url=settings.GROK_URL,
-)
+    started = time.monotonic()
+    completion, error = None, None
+    try:
+        completion = call_with_resilience(provider, request, section_timeout(prompt_id), arequest)
+        return completion
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        latency = time.monotonic() - started
+        record_timing("llm", latency)
+        usage = getattr(completion, "usage", None)
+        prompt_details = getattr(usage, "prompt_tokens_details", None)
+        record_llm_call(
+            provider,
+            getattr(completion, "model", None) or kwargs.get("model"),
+            prompt_id,
+            doctor_id,
+            call_outcome(error),
+            latency,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0),
+            completion_tokens=getattr(usage, "completion_tokens", 0),
+            cached_tokens=getattr(prompt_details, "cached_tokens", 0),
+        )
 
-def send_to_jivi(system_prompt, user_prompt, images=None):
+async def acreate_completion(provider, llm_client, prompt_id=None, doctor_id=None, **kwargs):
+    """
+    Async version of create_completion for AsyncOpenAI clients.
+    """
+    async def request(timeout):
+        return await llm_client.with_options(timeout=timeout).chat.completions.create(**kwargs)
+
+    started = time.monotonic()
+    completion, error = None, None
+    try:
+        completion = await acall_with_resilience(provider, request, section_timeout(prompt_id))
+        return completion
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        latency = time.monotonic() - started
+        record_timing("llm", latency)
+        usage = getattr(completion, "usage", None)
+        prompt_details = getattr(usage, "prompt_tokens_details", None)
+        await sync_to_async(record_llm_call)(
+            provider,
+            getattr(completion, "model", None) or kwargs.get("model"),
+            prompt_id,
+            doctor_id,
+            call_outcome(error),
+            latency,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0),
+            completion_tokens=getattr(usage, "completion_tokens", 0),
+            cached_tokens=getattr(prompt_details, "cached_tokens", 0),
+        )
+
+def send_to_jivi(system_prompt, user_prompt, images=None, prompt_id=None, doctor_id=None):
     """
     Sends the generated prompt to OpenAI's ChatGPT API and retrieves the response.
     """
@@ -25,7 +109,12 @@ def send_to_jivi(system_prompt, user_prompt, images=None):
                     messages.append({"role": "user", "content": image["description"]})
                 messages.append(image_message)
 
-        completion = client.chat.completions.create(
+        completion = create_completion(
+            "openai",
+            openai_client(),
+            async_openai_client,
+            prompt_id=prompt_id,
+            doctor_id=doctor_id,
             model=settings.GPT_MODEL,
             messages=messages,
             stream=False
@@ -36,16 +125,85 @@ def send_to_jivi(system_prompt, user_prompt, images=None):
 
         return completion.choices[0].message.content
 
+    except ProviderUnavailableError:
+        raise  # Answered with a 503 and Retry-After
+    except Exception as e:
+        raise RuntimeError(f"ChatGPT API error: {str(e)}")
+
+async def asend_to_jivi(system_prompt, user_prompt, prompt_id=None, doctor_id=None):
+    """
+    Async version of send_to_jivi (text only).
+    """
+    try:
+        completion = await acreate_completion(
+            "openai",
+            async_openai_client(),
+            prompt_id=prompt_id,
+            doctor_id=doctor_id,
+            model=settings.GPT_MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            stream=False
+        )
+
+        if not completion.choices or not completion.choices[0].message or not completion.choices[0].message.content:
+            raise ValueError("Invalid response received from OpenAI API.")
+
+        return completion.choices[0].message.content
+
+    except ProviderUnavailableError:
+        raise  # Answered with a 503 and Retry-After
+    except Exception as e:
+        raise RuntimeError(f"ChatGPT API error: {str(e)}")
+
+def send_to_jivi_json(system_prompt, user_prompt, schema, schema_name, prompt_id=None, doctor_id=None):
+    """
+    Sends the prompt to OpenAI's ChatGPT API with a JSON-schema constrained
+    response format and returns the parsed JSON object.
+    """
+    try:
+        completion = create_completion(
+            "openai",
+            openai_client(),
+            async_openai_client,
+            prompt_id=prompt_id,
+            doctor_id=doctor_id,
+            model=settings.GPT_MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": schema_name, "strict": True, "schema": schema},
+            },
+            stream=False
+        )
+
+        if not completion.choices or not completion.choices[0].message or not completion.choices[0].message.content:
+            raise ValueError("Invalid response received from OpenAI API.")
+
+        result = json.loads(completion.choices[0].message.content)
+        if not isinstance(result, dict):
+            raise ValueError("Structured response is not a JSON object.")
+        return result
+
+    except ProviderUnavailableError:
+        raise  # Answered with a 503 and Retry-After
     except Exception as e:
         raise RuntimeError(f"ChatGPT API error: {str(e)}")
 
-def send_to_grok(user_prompt, images=None):
+def send_to_grok(user_prompt, images=None, prompt_id=10, doctor_id=None):
     """
     Sends the generated prompt along with optional images to Grok 3 API built by xAI.
     
     Args:
         user_prompt (str): The text prompt from the user
         images (dict, optional): Dictionary of category:image_url pairs
+        prompt_id (int, optional): Section whose timeout budget applies
+        doctor_id (optional): Doctor the call is made for, used for metrics
         
     Returns:
         str: Grok's response content
@@ -89,8 +247,13 @@ def send_to_grok(user_prompt, images=None):
                     }
                 })
 
-        # Call Grok API (assuming grok_client is properly initialized elsewhere)
-        completion = grok_client.chat.completions.create(
+        # Call Grok API
+        completion = create_completion(
+            "grok",
+            grok_client(),
+            async_grok_client,
+            prompt_id=prompt_id,
+            doctor_id=doctor_id,
             model=settings.GROK_MODEL,  # Updated to match current version
             messages=messages,
             stream=False,
@@ -108,6 +271,8 @@ def send_to_grok(user_prompt, images=None):
 
         return completion.choices[0].message.content.strip()
 
+    except ProviderUnavailableError:
+        raise  # Answered with a 503 and Retry-After
     except ValueError as ve:
         raise ValueError(f"Validation error: {str(ve)}")
     except AttributeError as ae:
@@ -0,0 +1,91 @@
+import hashlib
+import json
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+
+from .coalesce import single_flight
+from .redis_client import REDIS_CONN
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+class _NotStored(Exception):
+    """
+    Raised inside single_flight so unsuccessful responses are not recorded for replay.
+    """
+
+def idempotency_scope(request):
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return None
+    # Keys are only unique per client, so scope them to the user
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f"idempotency:{request.user.pk}:{digest}"
+
+def request_fingerprint(request):
+    """
+    Hash of the method, path and body, to tell a retry from a different request
+    reusing its key. The body is hashed from the parsed data, uploaded files by
+    name and size, since DRF has already consumed the raw stream.
+    """
+    data = request.data
+    if hasattr(data, "lists"):  # QueryDict, e.g. a multipart form with files
+        data = dict(data.lists())
+    body = json.dumps(data, sort_keys=True,
+                      default=lambda value: f"{getattr(value, 'name', value)}:{getattr(value, 'size', '')}")
+    return hashlib.sha256(f"{request.method}\0{request.path}\0{body}".encode()).hexdigest()
+
+def has_stored_response(request):
+    """
+    Whether this request is a retry of one that already completed.
+    """
+    scope = idempotency_scope(request)
+    return scope is not None and REDIS_CONN.exists(f"{scope}:result") == 1
+
+def idempotent(request, handler):
+    """
+    Runs handler() (returning a DRF Response) once per Idempotency-Key. A
+    successful (2xx) response is recorded for IDEMPOTENCY_KEY_TTL seconds and
+    replayed for retries with the same key; a retry arriving while the first
+    request is still running waits for its response. Other responses are not
+    recorded, so the client can fix the request or retry. A request reusing a
+    key with a different method, path or body gets a 422. Requests without
+    the header run as usual.
+    """
+    scope = idempotency_scope(request)
+    if scope is None:
+        return handler()
+
+    fingerprint = request_fingerprint(request)
+    handled = []
+
+    def run():
+        response = handler()
+        handled.append(response)
+        if not status.is_success(response.status_code):
+            raise _NotStored(response.data)
+        return {"status": response.status_code, "data": response.data, "fingerprint": fingerprint}
+
+    try:
+        stored = single_flight(
+            REDIS_CONN, scope, run,
+            lock_ttl=settings.IDEMPOTENCY_WAIT_TIMEOUT,
+            wait_timeout=settings.IDEMPOTENCY_WAIT_TIMEOUT,
+            result_ttl=settings.IDEMPOTENCY_KEY_TTL,
+        )
+    except _NotStored:
+        return handled[0]
+    except RuntimeError as e:
+        # The request we waited on failed or never finished
+        return Response({"message": f"Original request did not complete. Error: {e}"},
+                        status=status.HTTP_409_CONFLICT)
+
+    if handled:
+        return handled[0]
+    if stored.get("fingerprint") != fingerprint:
+        return Response({"message": f"{IDEMPOTENCY_HEADER} was already used for a different request"},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    response = Response(stored["data"], status=stored["status"])
+    response["Idempotent-Replayed"] = "true"
+    return response
@@ -0,0 +1,159 @@
+import logging
+import re
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import LLMCallDailyStat
+from .redis_client import REDIS_CONN
+
+logger = logging.getLogger(__name__)
+
+# Prometheus samples live in one Redis hash (field = sample name with labels) so
+# counts from gunicorn and every Celery worker end up in the same place.
+METRICS_KEY = "metrics:llm"
+
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+SECTION_READY_BUCKETS = (2, 5, 10, 15, 20, 30, 45, 60, 120, 300)
+
+METRIC_TYPES = {
+    "llm_request_duration_seconds": ("histogram", "LLM call latency by provider, model, section and outcome."),
+    "llm_requests_total": ("counter", "LLM calls by provider, model, section, doctor and outcome."),
+    "llm_prompt_tokens_total": ("counter", "Prompt tokens sent by provider, model, section and doctor."),
+    "llm_completion_tokens_total": ("counter", "Completion tokens received by provider, model, section and doctor."),
+    # Cached ratio = llm_cached_prompt_tokens_total / llm_prompt_tokens_total
+    "llm_cached_prompt_tokens_total": ("counter", "Prompt tokens served from the provider's prompt cache."),
+    # Time to the first useful section = the series of the first section in SECTION_PRIORITY_ORDER
+    "consultation_section_ready_seconds": ("histogram", "Time from the start of a consultation until a background section is done, by section."),
+}
+
+LE_LABEL = re.compile(r',?le="([^"]*)"')
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _sample(name, **labels):
+    label_str = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return f"{name}{{{label_str}}}"
+
+def _observe(pipe, name, buckets, value, **labels):
+    # Adds one observation to a histogram
+    for bucket in buckets:
+        if value <= bucket:
+            pipe.hincrby(METRICS_KEY, _sample(f"{name}_bucket", **labels, le=bucket), 1)
+    pipe.hincrby(METRICS_KEY, _sample(f"{name}_bucket", **labels, le="+Inf"), 1)
+    pipe.hincrbyfloat(METRICS_KEY, _sample(f"{name}_sum", **labels), value)
+    pipe.hincrby(METRICS_KEY, _sample(f"{name}_count", **labels), 1)
+
+def _record_prometheus(provider, model, prompt_id, doctor_id, outcome, latency, prompt_tokens, completion_tokens,
+                       cached_tokens):
+    labels = {"provider": provider, "model": model, "prompt_id": prompt_id}
+
+    pipe = REDIS_CONN.pipeline(transaction=False)
+    _observe(pipe, "llm_request_duration_seconds", LATENCY_BUCKETS, latency, **labels, outcome=outcome)
+
+    pipe.hincrby(METRICS_KEY, _sample("llm_requests_total", **labels, doctor_id=doctor_id, outcome=outcome), 1)
+    if prompt_tokens:
+        pipe.hincrby(METRICS_KEY, _sample("llm_prompt_tokens_total", **labels, doctor_id=doctor_id), prompt_tokens)
+    if completion_tokens:
+        pipe.hincrby(METRICS_KEY, _sample("llm_completion_tokens_total", **labels, doctor_id=doctor_id), completion_tokens)
+    if cached_tokens:
+        pipe.hincrby(METRICS_KEY, _sample("llm_cached_prompt_tokens_total", **labels, doctor_id=doctor_id), cached_tokens)
+    pipe.execute()
+
+def _record_daily(provider, model, prompt_id, doctor_id, outcome, latency, prompt_tokens, completion_tokens,
+                  cached_tokens):
+    latency_ms = int(latency * 1000)
+    lookup = {
+        "date": timezone.localdate(),
+        "provider": provider,
+        "model": model,
+        "prompt_id": prompt_id,
+        "doctor_id": doctor_id,
+        "outcome": outcome,
+    }
+    increments = {
+        "calls": F("calls") + 1,
+        "total_latency_ms": F("total_latency_ms") + latency_ms,
+        "max_latency_ms": Greatest(F("max_latency_ms"), latency_ms),
+        "prompt_tokens": F("prompt_tokens") + prompt_tokens,
+        "completion_tokens": F("completion_tokens") + completion_tokens,
+        "cached_tokens": F("cached_tokens") + cached_tokens,
+    }
+    if LLMCallDailyStat.objects.filter(**lookup).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            LLMCallDailyStat.objects.create(
+                **lookup,
+                calls=1,
+                total_latency_ms=latency_ms,
+                max_latency_ms=latency_ms,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                cached_tokens=cached_tokens,
+            )
+    except IntegrityError:
+        # Another process created today's row first
+        LLMCallDailyStat.objects.filter(**lookup).update(**increments)
+
+def record_llm_call(provider, model, prompt_id, doctor_id, outcome, latency, prompt_tokens=0, completion_tokens=0,
+                    cached_tokens=0):
+    """
+    Records one LLM call in the Prometheus samples and the daily aggregates.
+    Never raises, metrics must not fail the call being measured.
+    """
+    args = (provider, model or "", prompt_id or 0, str(doctor_id or ""), outcome, latency,
+            prompt_tokens or 0, completion_tokens or 0, cached_tokens or 0)
+    try:
+        _record_prometheus(*args)
+    except Exception:
+        logger.exception("Failed to record LLM call metrics")
+    try:
+        _record_daily(*args)
+    except Exception:
+        logger.exception("Failed to record LLM daily aggregates")
+
+def record_section_ready(prompt_id, seconds):
+    """
+    Records how long after the start of its consultation a section was done.
+    Never raises.
+    """
+    try:
+        pipe = REDIS_CONN.pipeline(transaction=False)
+        _observe(pipe, "consultation_section_ready_seconds", SECTION_READY_BUCKETS, seconds, prompt_id=prompt_id)
+        pipe.execute()
+    except Exception:
+        logger.exception("Failed to record section ready metrics")
+
+def _sort_key(line):
+    # Histogram buckets are listed in increasing order of their `le` bound
+    match = LE_LABEL.search(line)
+    if not match:
+        return (line, 0.0)
+    return (LE_LABEL.sub("", line, count=1), float(match.group(1)))
+
+def render_prometheus():
+    """
+    Renders all recorded samples in the Prometheus text exposition format.
+    """
+    families = defaultdict(list)
+    for field, value in REDIS_CONN.hgetall(METRICS_KEY).items():
+        sample = field.decode()
+        name = sample.split("{", 1)[0]
+        for suffix in ("_bucket", "_sum", "_count"):
+            if name.endswith(suffix) and name[:-len(suffix)] in METRIC_TYPES:
+                name = name[:-len(suffix)]
+                break
+        families[name].append(f"{sample} {value.decode()}")
+
+    lines = []
+    for name in sorted(families):
+        metric_type, help_text = METRIC_TYPES.get(name, ("untyped", ""))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.extend(sorted(families[name], key=_sort_key))
+    return "\n".join(lines) + "\n"
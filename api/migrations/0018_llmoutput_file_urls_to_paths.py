@@ -0,0 +1,51 @@
+# Generated by Django 5.0 on 2026-10-19 10:02
+
+from urllib.parse import unquote, urlparse
+
+from django.db import migrations
+
+
+def signed_url_to_path(value):
+    """
+    Converts a signed URL to its object path, path-style
+    (https://storage.googleapis.com/<bucket>/<path>?...) or virtual-hosted
+    (https://<bucket>.storage.googleapis.com/<path>?...). Values that are
+    already paths, or URLs of another host, are returned unchanged.
+    """
+    if not isinstance(value, str) or not value.startswith(("http://", "https://")):
+        return value
+    url = urlparse(value)
+    url_path = unquote(url.path).lstrip("/")
+    if url.hostname == "storage.googleapis.com":
+        # Drop the leading bucket segment
+        return url_path.split("/", 1)[1] if "/" in url_path else url_path
+    if url.hostname and url.hostname.endswith(".storage.googleapis.com"):
+        return url_path
+    return value
+
+
+def convert_file_urls_to_paths(apps, schema_editor):
+    LLMOutput = apps.get_model("api", "LLMOutput")
+    changed = []
+    for output in LLMOutput.objects.only("id", "file_urls").iterator(chunk_size=500):
+        if not isinstance(output.file_urls, dict) or not output.file_urls:
+            continue
+        paths = {category: signed_url_to_path(url) for category, url in output.file_urls.items()}
+        if paths != output.file_urls:
+            output.file_urls = paths
+            changed.append(output)
+        if len(changed) >= 500:
+            LLMOutput.objects.bulk_update(changed, ["file_urls"])
+            changed = []
+    if changed:
+        LLMOutput.objects.bulk_update(changed, ["file_urls"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0017_customuser_device_serial_numbers"),
+    ]
+
+    operations = [
+        migrations.RunPython(convert_file_urls_to_paths, migrations.RunPython.noop),
+    ]
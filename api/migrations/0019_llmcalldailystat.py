@@ -0,0 +1,57 @@
+# Generated by Django 5.0 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0018_llmoutput_file_urls_to_paths"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LLMCallDailyStat",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("provider", models.CharField(max_length=20)),
+                ("model", models.CharField(blank=True, default="", max_length=100)),
+                (
+                    "prompt_id",
+                    models.PositiveSmallIntegerField(
+                        default=0, help_text="0 when the call is not tied to a section"
+                    ),
+                ),
+                ("doctor_id", models.CharField(blank=True, default="", max_length=50)),
+                ("outcome", models.CharField(max_length=20)),
+                ("calls", models.PositiveIntegerField(default=0)),
+                ("total_latency_ms", models.BigIntegerField(default=0)),
+                ("max_latency_ms", models.IntegerField(default=0)),
+                ("prompt_tokens", models.BigIntegerField(default=0)),
+                ("completion_tokens", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=(
+                            "date",
+                            "provider",
+                            "model",
+                            "prompt_id",
+                            "doctor_id",
+                            "outcome",
+                        ),
+                        name="unique_llm_call_daily_stat",
+                    )
+                ],
+            },
+        ),
+    ]
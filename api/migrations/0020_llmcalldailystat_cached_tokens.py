@@ -0,0 +1,20 @@
+# Generated by Django 5.0 on 2026-10-19 14:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0019_llmcalldailystat"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="llmcalldailystat",
+            name="cached_tokens",
+            field=models.BigIntegerField(
+                default=0,
+                help_text="Prompt tokens served from the provider's prompt cache",
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0 on 2026-10-19 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0020_llmcalldailystat_cached_tokens"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="llmoutput",
+            name="generation_completed_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Time when every background section had finished",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="llmoutput",
+            name="generation_seconds",
+            field=models.FloatField(
+                blank=True,
+                help_text="Seconds from creation until every section had finished",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0 on 2026-10-19 14:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0021_llmoutput_generation_time"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="patientdevicedata",
+            index=models.Index(
+                fields=["patient_mobile_number", "-created_at"],
+                name="api_patient_patient_87e62c_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 5.0 on 2026-10-19 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0022_patientdevicedata_patient_created_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SensorReferenceRange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "sensor",
+                    models.CharField(
+                        help_text="PatientDeviceData field", max_length=50, unique=True
+                    ),
+                ),
+                ("label", models.CharField(max_length=100)),
+                ("unit", models.CharField(blank=True, max_length=20)),
+                (
+                    "low",
+                    models.DecimalField(
+                        blank=True,
+                        decimal_places=3,
+                        help_text="Lowest normal value, null for no lower bound",
+                        max_digits=10,
+                        null=True,
+                    ),
+                ),
+                (
+                    "high",
+                    models.DecimalField(
+                        blank=True,
+                        decimal_places=3,
+                        help_text="Highest normal value, null for no upper bound",
+                        max_digits=10,
+                        null=True,
+                    ),
+                ),
+                (
+                    "bit",
+                    models.PositiveSmallIntegerField(
+                        help_text="Bit set in abnormal_flags when the value is out of range",
+                        unique=True,
+                    ),
+                ),
+                (
+                    "weight",
+                    models.PositiveSmallIntegerField(
+                        default=1,
+                        help_text="Added to severity when the value is out of range",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="patientdevicedata",
+            name="abnormal_flags",
+            field=models.IntegerField(
+                blank=True,
+                help_text="Bits (SensorReferenceRange.bit) of the values outside their normal range, null until scored",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="patientdevicedata",
+            name="severity",
+            field=models.PositiveSmallIntegerField(
+                db_default=0,
+                help_text="Sum of the weights of the values outside their normal range, 0 until scored",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="patientdevicedata",
+            index=models.Index(
+                fields=["-severity", "-created_at"], name="api_reading_severity_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="patientdevicedata",
+            index=models.Index(
+                condition=models.Q(("abnormal_flags__isnull", True)),
+                fields=["id"],
+                name="api_reading_unscored_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0 on 2026-10-19 14:26
+
+from decimal import Decimal
+
+from django.db import migrations
+
+# The normal ranges listed in the base prompt (api.prompt_jivi.generate_base_prompt)
+REFERENCE_RANGES = [
+    # sensor, label, unit, low, high
+    ("co", "Carbon Monoxide (CO)", "ppm", Decimal("0"), Decimal("10")),
+    ("co2", "Carbon Dioxide (CO2)", "ppm", Decimal("20000"), Decimal("50000")),
+    ("o2", "Oxygen Level (O2)", "%Vol", Decimal("13"), Decimal("18")),
+    ("nh3", "Ammonia (NH3)", "ppm", Decimal("0"), Decimal("2")),
+    ("spo2", "Blood Oxygen Saturation (SpO2)", "%", Decimal("85"), None),
+    ("heart_rate", "Heart Rate", "bpm", Decimal("60"), Decimal("100")),
+    ("rq", "Respiratory Quotient (RQ)", "", Decimal("0.7"), Decimal("1.0")),
+    ("hydrogen", "Hydrogen (H2)", "ppm", Decimal("0"), Decimal("16")),
+    ("formaldehyde", "Formaldehyde", "ppm", Decimal("0"), Decimal("16")),
+]
+
+
+def seed_reference_ranges(apps, schema_editor):
+    SensorReferenceRange = apps.get_model("api", "SensorReferenceRange")
+    SensorReferenceRange.objects.bulk_create([
+        SensorReferenceRange(sensor=sensor, label=label, unit=unit, low=low, high=high, bit=bit)
+        for bit, (sensor, label, unit, low, high) in enumerate(REFERENCE_RANGES)
+    ])
+
+
+def remove_reference_ranges(apps, schema_editor):
+    SensorReferenceRange = apps.get_model("api", "SensorReferenceRange")
+    SensorReferenceRange.objects.filter(sensor__in=[sensor for sensor, *_ in REFERENCE_RANGES]).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0023_sensor_reference_range"),
+    ]
+
+    # Existing readings stay unscored until api.tasks.score_unscored_readings gets to them
+    operations = [
+        migrations.RunPython(seed_reference_ranges, remove_reference_ranges),
+    ]
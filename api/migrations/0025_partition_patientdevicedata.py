@@ -0,0 +1,105 @@
+# Generated by Django 5.0 on 2026-10-19 14:52
+
+from datetime import date
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+# Partitions created ahead of the current month, api.tasks.manage_reading_partitions keeps it up
+MONTHS_AHEAD = 3
+
+
+def month_start(day, months=0):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def rebuild_table(apps, schema_editor, partitioned):
+    """
+    Recreates api_patientdevicedata as a table partitioned by month of
+    created_at (or back as a plain table) and copies the readings over. The
+    table is locked until the migration commits, run it in a quiet hour.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    PatientDeviceData = apps.get_model("api", "PatientDeviceData")
+    table = PatientDeviceData._meta.db_table
+    old_table = f"{table}_old"
+    quote = schema_editor.quote_name
+    execute = schema_editor.execute
+
+    # Renamed out of the way so the new table's identity sequence gets the usual name
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence, = cursor.fetchone()
+    execute(f"ALTER SEQUENCE {sequence} RENAME TO {quote(f'{old_table}_id_seq')}")
+    execute(f"ALTER TABLE {quote(table)} RENAME TO {quote(old_table)}")
+    execute(
+        f"CREATE TABLE {quote(table)} (LIKE {quote(old_table)} "
+        f"INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS INCLUDING STORAGE)"
+        + (" PARTITION BY RANGE (created_at)" if partitioned else "")
+    )
+
+    if partitioned:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f"SELECT min(created_at) FROM {quote(old_table)}")
+            first, = cursor.fetchone()
+        this_month = month_start(timezone.now().date())
+        month = month_start(first.date()) if first else this_month
+        while month <= month_start(this_month, MONTHS_AHEAD):
+            # Same names and bounds as api.partitions. Months detached before a rollback are
+            # still there as standalone tables, their readings go to the default partition.
+            execute(
+                f"CREATE TABLE IF NOT EXISTS {quote(f'{table}_p{month:%Y%m}')} PARTITION OF {quote(table)} "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d} 00:00+00') TO ('{month_start(month, 1):%Y-%m-%d} 00:00+00')"
+            )
+            month = month_start(month, 1)
+        execute(f"CREATE TABLE {quote(f'{table}_default')} PARTITION OF {quote(table)} DEFAULT")
+
+    execute(f"INSERT INTO {quote(table)} SELECT * FROM {quote(old_table)}")
+    execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), coalesce(max(id), 0) + 1, false) "
+            f"FROM {quote(table)}")
+    # Takes the old partitions along when going back
+    execute(f"DROP TABLE {quote(old_table)} CASCADE")
+
+    # A partitioned table's unique indexes must include the partition key
+    execute(f"ALTER TABLE {quote(table)} ADD PRIMARY KEY ({'id, created_at' if partitioned else 'id'})")
+    for index in PatientDeviceData._meta.indexes:
+        schema_editor.add_index(PatientDeviceData, index)
+
+
+def partition_readings(apps, schema_editor):
+    rebuild_table(apps, schema_editor, partitioned=True)
+
+
+def unpartition_readings(apps, schema_editor):
+    rebuild_table(apps, schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0024_seed_sensor_reference_ranges"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="llmoutput",
+            name="sensor_data",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="api.patientdevicedata",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="modeloutput",
+            name="sensor_data",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="api.patientdevicedata",
+            ),
+        ),
+        migrations.RunPython(partition_readings, unpartition_readings),
+    ]
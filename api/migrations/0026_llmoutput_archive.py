@@ -0,0 +1,39 @@
+# Generated by Django 5.0 on 2026-10-19 14:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0025_partition_patientdevicedata"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="llmoutput",
+            name="archive_path",
+            field=models.CharField(
+                blank=True,
+                help_text="Object path of the archived section texts in the bucket",
+                max_length=255,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="llmoutput",
+            name="archived_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Time when the section texts were moved to the archive (api.archive)",
+                null=True,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="llmoutput",
+            index=models.Index(
+                condition=models.Q(("archived_at__isnull", True)),
+                fields=["created_at"],
+                name="api_llmoutput_unarchived_idx",
+            ),
+        ),
+    ]
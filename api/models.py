@@ -1,8 +1,8 @@
 from datetime import *
 from django.utils import timezone
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import AbstractUser
-from storages.backends.gcloud import GoogleCloudStorage
 
 class PatientDeviceData(models.Model):
     id = models.AutoField(primary_key=True)
@@ -20,10 +20,40 @@ class PatientDeviceData(models.Model):
     hydrogen = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     formaldehyde = models.DecimalField(max_digits=10, decimal_places=3, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, null=False)
+    abnormal_flags = models.IntegerField(null=True, blank=True, help_text="Bits (SensorReferenceRange.bit) of the values outside their normal range, null until scored")
+    severity = models.PositiveSmallIntegerField(db_default=0, help_text="Sum of the weights of the values outside their normal range, 0 until scored")
+
+    class Meta:
+        # On Postgres the table is partitioned by month of created_at, see api/partitions.py
+        indexes = [
+            # A patient's readings newest first (PatientTimelineView)
+            models.Index(fields=['patient_mobile_number', '-created_at']),
+            # Most severe first (PatientView ?sort=severity)
+            models.Index(fields=['-severity', '-created_at'], name='api_reading_severity_idx'),
+            # Readings left for api.tasks.score_unscored_readings
+            models.Index(fields=['id'], condition=Q(abnormal_flags__isnull=True), name='api_reading_unscored_idx'),
+        ]
 
     def __str__(self):
         return f"PatientDeviceData(id={self.id}, doctor_id={self.doctor_id}, device_serial_number={self.device_serial_number})"
 
+class SensorReferenceRange(models.Model):
+    """
+    Normal range of one PatientDeviceData value, as listed in the base prompt
+    (api.prompt_jivi.generate_base_prompt). Readings are scored against these
+    by api.triage.
+    """
+    sensor = models.CharField(max_length=50, unique=True, help_text="PatientDeviceData field")
+    label = models.CharField(max_length=100)
+    unit = models.CharField(max_length=20, blank=True)
+    low = models.DecimalField(max_digits=10, decimal_places=3, null=True, blank=True, help_text="Lowest normal value, null for no lower bound")
+    high = models.DecimalField(max_digits=10, decimal_places=3, null=True, blank=True, help_text="Highest normal value, null for no upper bound")
+    bit = models.PositiveSmallIntegerField(unique=True, help_text="Bit set in abnormal_flags when the value is out of range")
+    weight = models.PositiveSmallIntegerField(default=1, help_text="Added to severity when the value is out of range")
+
+    def __str__(self):
+        return f"SensorReferenceRange(sensor={self.sensor}, low={self.low}, high={self.high})"
+
 class PatientData(models.Model):
     name = models.CharField(max_length=250, null=False, blank=False)
     patient_mobile_number = models.CharField(max_length=15, unique=True)
@@ -38,7 +68,9 @@ class ModelOutput(models.Model):
     doctor_remark = models.TextField(help_text="Doctor's remark", null=True)
     doctor_comment = models.TextField(help_text="Doctor's comment", null=True)
     doctor_note = models.TextField(help_text="Doctor's note", null=True)
-    sensor_data = models.ForeignKey(PatientDeviceData, on_delete=models.CASCADE, null=False, blank=False)
+    # No constraint in the database, the partitioned readings table has no unique index on id alone
+    sensor_data = models.ForeignKey(PatientDeviceData, on_delete=models.CASCADE, null=False, blank=False,
+                                    db_constraint=False)
     patient_mobile_number = models.CharField(max_length=15, null=False, blank=False)
     created_at = models.DateTimeField(auto_now_add=True, help_text="Time when the record was created")
     updated_at = models.DateTimeField(auto_now=True, help_text="Time when the record was last updated")
@@ -94,13 +126,26 @@ class LLMOutput(models.Model):
     doctor_remark = models.TextField(help_text="Doctor's remark", null=True)
     doctor_comment = models.TextField(help_text="Doctor's comment", null=True)
     doctor_note = models.TextField(help_text="Doctor's note", null=True)
-    sensor_data = models.ForeignKey(PatientDeviceData, on_delete=models.CASCADE, null=False, blank=False)
+    # No constraint in the database, the partitioned readings table has no unique index on id alone
+    sensor_data = models.ForeignKey(PatientDeviceData, on_delete=models.CASCADE, null=False, blank=False,
+                                    db_constraint=False)
     patient_mobile_number = models.CharField(max_length=15, null=False, blank=False)
     file_urls = models.JSONField(default=list)
+    generation_completed_at = models.DateTimeField(null=True, blank=True, help_text="Time when every background section had finished")
+    generation_seconds = models.FloatField(null=True, blank=True, help_text="Seconds from creation until every section had finished")
+    archived_at = models.DateTimeField(null=True, blank=True, help_text="Time when the section texts were moved to the archive (api.archive)")
+    archive_path = models.CharField(max_length=255, null=True, blank=True, help_text="Object path of the archived section texts in the bucket")
     created_at = models.DateTimeField(auto_now_add=True, help_text="Time when the record was created")
     updated_at = models.DateTimeField(auto_now=True, help_text="Time when the record was last updated")
 
+    class Meta:
+        indexes = [
+            # Consultations left for api.tasks.archive_old_consultations
+            models.Index(fields=['created_at'], condition=Q(archived_at__isnull=True), name='api_llmoutput_unarchived_idx'),
+        ]
+
 class OneTimePassword(models.Model):
+    # No longer written to, login OTPs are kept in Redis by api.otp
     user = models.ForeignKey(
         CustomUser,
         on_delete=models.CASCADE,
@@ -146,3 +191,35 @@ class OneTimePassword(models.Model):
 
         expiry_time = timezone.now() + timedelta(minutes=validity_minutes)
         return OneTimePassword.objects.create(user=user, otp=otp_code, expiry=expiry_time)
+
+class LLMCallDailyStat(models.Model):
+    """
+    Daily aggregate of LLM calls per provider, model, section (prompt_id), doctor and outcome.
+    """
+    date = models.DateField()
+    provider = models.CharField(max_length=20)
+    model = models.CharField(max_length=100, blank=True, default="")
+    prompt_id = models.PositiveSmallIntegerField(default=0, help_text="0 when the call is not tied to a section")
+    doctor_id = models.CharField(max_length=50, blank=True, default="")
+    outcome = models.CharField(max_length=20)
+    calls = models.PositiveIntegerField(default=0)
+    total_latency_ms = models.BigIntegerField(default=0)
+    max_latency_ms = models.IntegerField(default=0)
+    prompt_tokens = models.BigIntegerField(default=0)
+    completion_tokens = models.BigIntegerField(default=0)
+    cached_tokens = models.BigIntegerField(default=0, help_text="Prompt tokens served from the provider's prompt cache")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'provider', 'model', 'prompt_id', 'doctor_id', 'outcome'],
+                name='unique_llm_call_daily_stat',
+            ),
+        ]
+
+    @property
+    def cached_token_ratio(self):
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def __str__(self):
+        return f"LLMCallDailyStat({self.date}, {self.provider}, prompt_id={self.prompt_id}, calls={self.calls})"
@@ -0,0 +1,72 @@
+import secrets
+
+from django.conf import settings
+
+from .redis_client import REDIS_CONN
+
+OTP_VALID = "valid"
+OTP_INVALID = "invalid"
+OTP_MISSING = "missing"
+OTP_LOCKED = "locked"
+
+# Deletes the code if it matches (one use only), otherwise counts a failure.
+# The failure counter belongs to the email, not to the code: re-issuing an OTP
+# keeps it, so the email stays locked until the counter expires ARGV[3]
+# seconds after the first failure. A match resets it.
+VERIFY_OTP_SCRIPT = """
+local max_attempts = tonumber(ARGV[2])
+if tonumber(redis.call('GET', KEYS[2]) or '0') >= max_attempts then
+    redis.call('DEL', KEYS[1])
+    return 'locked'
+end
+
+local stored = redis.call('GET', KEYS[1])
+if not stored then
+    return 'missing'
+end
+if stored == ARGV[1] then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 'valid'
+end
+
+local attempts = redis.call('INCR', KEYS[2])
+if attempts == 1 then
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+end
+if attempts >= max_attempts then
+    redis.call('DEL', KEYS[1])
+    return 'locked'
+end
+return 'invalid'
+"""
+
+_verify_otp_script = REDIS_CONN.register_script(VERIFY_OTP_SCRIPT)
+
+def otp_key(email):
+    return f"otp:{email.lower()}"
+
+def attempts_key(email):
+    return f"otp:attempts:{email.lower()}"
+
+def issue_otp(email, length=None, validity_minutes=None):
+    """
+    Creates a new OTP for the email, replacing any previous one, and returns it.
+    The code expires on its own after `validity_minutes`. Earlier wrong codes
+    still count against the new one.
+    """
+    length = length or settings.OTP_LENGTH
+    validity_minutes = validity_minutes or settings.OTP_VALIDITY_MINUTES
+    otp = 10**(length-1) + secrets.randbelow(9 * 10**(length-1))
+
+    REDIS_CONN.set(otp_key(email), otp, ex=validity_minutes * 60)
+    return otp
+
+def verify_otp(email, otp):
+    """
+    Checks and consumes the email's OTP. Returns OTP_VALID, OTP_INVALID,
+    OTP_MISSING (expired or never issued) or OTP_LOCKED (OTP_MAX_ATTEMPTS wrong
+    codes within OTP_LOCKOUT_MINUTES, the code has been discarded).
+    """
+    result = _verify_otp_script(keys=[otp_key(email), attempts_key(email)],
+                                args=[str(otp), settings.OTP_MAX_ATTEMPTS, settings.OTP_LOCKOUT_MINUTES * 60])
+    return result.decode() if isinstance(result, bytes) else result
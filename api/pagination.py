@@ -1,4 +1,4 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 class StandardResultsSetPagination(PageNumberPagination):
     """
@@ -8,4 +8,14 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_query_param = 'page'
     page_size = 20
     page_size_query_param = 'page_size'
-    max_page_size = 100
\ No newline at end of file
+    max_page_size = 100
+
+class TimelinePagination(CursorPagination):
+    """
+    Newest readings first. Cursors stay valid while new readings come in, and
+    a page costs the same however far back it is.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
@@ -0,0 +1,125 @@
+"""
+Monthly range partitions of PatientDeviceData on created_at (Postgres only, see
+migration 0025). Each month is a table named api_patientdevicedata_pYYYYMM, and
+readings outside every month go to api_patientdevicedata_default, so inserts
+never fail when a month is missing.
+
+api.tasks.manage_reading_partitions creates READING_PARTITIONS_AHEAD months
+ahead. With READING_RETENTION_MONTHS set, it also detaches the months older
+than that. A detached month stays in the database as a standalone table until
+it is dumped to cold storage and dropped by hand, or it is dropped right away
+with READING_RETENTION_DROP. Readings a consultation refers to are kept in the
+default partition.
+
+The table's primary key is (id, created_at), a partitioned table can't have
+a unique index without the partition key. So LLMOutput.sensor_data has no
+foreign key constraint in the database, and ids stay unique through the
+identity sequence.
+"""
+import logging
+from datetime import date
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from .models import PatientDeviceData
+
+logger = logging.getLogger(__name__)
+
+TABLE = PatientDeviceData._meta.db_table
+PARTITION_PREFIX = f"{TABLE}_p"
+
+def month_start(day, months=0):
+    """
+    First day of the month `months` after the month of `day`.
+    """
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month):
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+def create_partition_sql(month):
+    quote = connection.ops.quote_name
+    # created_at is a timestamptz, months are UTC like TIME_ZONE
+    return (f"CREATE TABLE {quote(partition_name(month))} PARTITION OF {quote(TABLE)} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d} 00:00+00') TO ('{month_start(month, 1):%Y-%m-%d} 00:00+00')")
+
+def is_partitioned():
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [TABLE])
+        return cursor.fetchone() is not None
+
+def month_partitions():
+    """
+    Months with an attached partition, oldest first.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname FROM pg_inherits JOIN pg_class ON pg_class.oid = inhrelid WHERE inhparent = to_regclass(%s)",
+            [TABLE],
+        )
+        names = [name for name, in cursor.fetchall()]
+    return sorted(
+        date(int(name[-6:-2]), int(name[-2:]), 1)
+        for name in names if name.startswith(PARTITION_PREFIX) and name[len(PARTITION_PREFIX):].isdigit()
+    )
+
+def create_partitions():
+    """
+    Creates the partitions from this month to READING_PARTITIONS_AHEAD months
+    ahead. Returns the months created.
+    """
+    this_month = month_start(timezone.now().date())
+    existing = set(month_partitions())
+    created = []
+    for offset in range(settings.READING_PARTITIONS_AHEAD + 1):
+        month = month_start(this_month, offset)
+        if month in existing:
+            continue
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(create_partition_sql(month))
+        except DatabaseError as e:
+            # E.g. readings of that month already in the default partition, move them out first
+            logger.error("Could not create reading partition %s: %s", partition_name(month), e)
+            continue
+        created.append(month)
+    if created:
+        logger.info("Created reading partitions %s", ", ".join(map(partition_name, created)))
+    return created
+
+def expire_partitions():
+    """
+    Detaches the months entirely older than READING_RETENTION_MONTHS, and drops
+    them with READING_RETENTION_DROP. Returns the months expired.
+    """
+    if not settings.READING_RETENTION_MONTHS:
+        return []
+    cutoff = month_start(timezone.now().date(), -settings.READING_RETENTION_MONTHS)
+    quote = connection.ops.quote_name
+    # Readings still referenced by a consultation (LLMOutput, ModelOutput)
+    referenced = " UNION ".join(
+        f"SELECT {quote(relation.field.column)} FROM {quote(relation.related_model._meta.db_table)}"
+        for relation in PatientDeviceData._meta.related_objects
+    )
+
+    expired = []
+    for month in month_partitions():
+        if month_start(month, 1) > cutoff:
+            break
+        name = quote(partition_name(month))
+        # Takes a short exclusive lock on the whole table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {quote(TABLE)} DETACH PARTITION {name}")
+            # Without a partition for their month these land in the default partition
+            cursor.execute(f"INSERT INTO {quote(TABLE)} SELECT * FROM {name} WHERE id IN ({referenced})")
+            kept = cursor.rowcount
+            if settings.READING_RETENTION_DROP:
+                cursor.execute(f"DROP TABLE {name}")
+        logger.info("Expired reading partition %s, kept %s readings with a consultation", name, kept)
+        expired.append(month)
+    return expired
@@ -1,3 +1,6 @@
+import hmac
+
+from django.conf import settings
 from rest_framework.exceptions import APIException
 from rest_framework import permissions
 
@@ -25,3 +28,14 @@ class DeviceRegisteredPermission(permissions.BasePermission):
 
         return True
 
+class MetricsPermission(permissions.BasePermission):
+    """
+    Allows admin users, or scrapers sending "Authorization: Bearer <METRICS_TOKEN>".
+    """
+    def has_permission(self, request, view):
+        if request.user and request.user.is_authenticated and request.user.is_staff:
+            return True
+
+        token = settings.METRICS_TOKEN
+        header = request.META.get("HTTP_AUTHORIZATION", "")
+        return bool(token) and hmac.compare_digest(header, f"Bearer {token}")
@@ -0,0 +1,203 @@
+"""
+Per-request profiling. ProfilingMiddleware profiles a PROFILING_SAMPLE_RATE
+share of requests, plus any request whose X-Profile header matches
+PROFILING_HEADER_SECRET. For those it records SQL queries, Redis round trips
+(api.redis_client) and LLM calls (api.generate_jivi), with their count and
+time, and the request's total time. They are sent back in a Server-Timing
+header, which browser dev tools show next to the request, and logged as one
+JSON line. A slow request can then be looked up by doctor, route and time.
+
+With PROFILING_TRACE_MS set, a profiled request slower than that also logs a
+pyinstrument sampling trace of where the time went. pyinstrument is optional,
+install it where traces are wanted.
+
+Requests that aren't profiled only pay for a context variable lookup per query
+and Redis command.
+"""
+import contextvars
+import hmac
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import orjson
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+# Server-Timing metric name and what its count is of
+TIMINGS = {"db": "queries", "redis": "calls", "llm": "calls"}
+
+class _Profile:
+    def __init__(self):
+        # Added to from sync_to_async threads too, they get a copy of the context holding this object
+        self.lock = threading.Lock()
+        self.counts = dict.fromkeys(TIMINGS, 0)
+        self.seconds = dict.fromkeys(TIMINGS, 0.0)
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.counts[name] += 1
+            self.seconds[name] += seconds
+
+_profile = contextvars.ContextVar("request_profile", default=None)
+
+def record_timing(name, seconds):
+    """
+    Adds a call of `name` (a TIMINGS key) to the current request's profile,
+    if it is being profiled.
+    """
+    profile = _profile.get()
+    if profile is not None:
+        profile.add(name, seconds)
+
+@contextmanager
+def timed(name):
+    """
+    Times the block as a call of `name` in the current request's profile.
+    """
+    profile = _profile.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - started)
+
+def _time_query(execute, sql, params, many, context):
+    with timed("db"):
+        return execute(sql, params, many, context)
+
+def instrument_connection(connection, **kwargs):
+    # Once per connection object, they live as long as their thread
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+# Connections opened from now on, in any thread
+connection_created.connect(instrument_connection)
+
+def server_timing(profile, total):
+    metrics = [
+        f'{name};dur={profile.seconds[name] * 1000:.1f};desc="{profile.counts[name]} {unit}"'
+        for name, unit in TIMINGS.items()
+    ]
+    metrics.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(metrics)
+
+class ProfilingMiddleware:
+    """
+    Profiles sampled or requested requests, see the module docstring. Goes first
+    in MIDDLEWARE so the total covers the other middleware too. For a streamed
+    response, the total ends when streaming starts.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        self.profiler_class = None
+        if settings.PROFILING_TRACE_MS is not None:
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                logger.warning("PROFILING_TRACE_MS is set but pyinstrument is not installed, no traces are logged")
+            else:
+                self.profiler_class = Profiler
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        # Connections this thread opened before the signal receiver was connected
+        for connection in connections.all(initialized_only=True):
+            instrument_connection(connection)
+        profile = _Profile()
+        token = _profile.set(profile)
+        profiler = self.start_profiler(async_mode="disabled")
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            total = time.perf_counter() - started
+            _profile.reset(token)
+            if profiler is not None:
+                profiler.stop()
+        self.report(request, response, profile, total, profiler)
+        return response
+
+    async def __acall__(self, request):
+        if not self.should_profile(request):
+            return await self.get_response(request)
+
+        # The ORM runs in sync_to_async threads, whose connections are instrumented when opened
+        profile = _Profile()
+        token = _profile.set(profile)
+        profiler = self.start_profiler(async_mode="enabled")
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            total = time.perf_counter() - started
+            _profile.reset(token)
+            if profiler is not None:
+                profiler.stop()
+        self.report(request, response, profile, total, profiler)
+        return response
+
+    def should_profile(self, request):
+        secret = settings.PROFILING_HEADER_SECRET
+        header = request.headers.get(PROFILE_HEADER)
+        if secret and header and hmac.compare_digest(header.encode(), secret.encode()):
+            return True
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    def start_profiler(self, async_mode):
+        if self.profiler_class is None:
+            return None
+        profiler = self.profiler_class(async_mode=async_mode)
+        try:
+            profiler.start()
+        except RuntimeError:
+            # Another profiler is already running on this thread
+            return None
+        return profiler
+
+    def report(self, request, response, profile, total, profiler):
+        timing = server_timing(profile, total)
+        if response.has_header("Server-Timing"):
+            timing = f"{response['Server-Timing']}, {timing}"
+        response["Server-Timing"] = timing
+
+        # Imported here, api.db_router imports the Redis client, which imports this module
+        from .db_router import request_user_id
+
+        match = request.resolver_match
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "route": match.route if match else None,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "doctor_id": request_user_id(request),
+            "total_ms": round(total * 1000, 1),
+        }
+        for name, unit in TIMINGS.items():
+            record[f"{name}_{unit}"] = profile.counts[name]
+            record[f"{name}_ms"] = round(profile.seconds[name] * 1000, 1)
+        logger.info("Request profile %s", orjson.dumps(record).decode(), extra={"profile": record})
+
+        if profiler is not None and total * 1000 >= settings.PROFILING_TRACE_MS:
+            logger.warning("Slow request trace, %s %s took %.0f ms\n%s", request.method, request.path, total * 1000,
+                           profiler.output_text())
@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .redis_client import REDIS_CONN
+
+# Refills each bucket in KEYS for the time elapsed since its last update,
+# then takes `requested` (ARGV[1]) tokens from all of them if every one has
+# enough, or from none. ARGV[2], ARGV[3] are the first bucket's rate and
+# capacity, ARGV[4], ARGV[5] the second's and so on. Nothing is written when
+# `requested` is 0 or the request is denied. Uses the Redis clock so every
+# process agrees on time. Floats are returned as strings, Lua numbers would
+# be truncated to integers.
+TOKEN_BUCKET_SCRIPT = """
+local requested = tonumber(ARGV[1])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i])
+    local capacity = tonumber(ARGV[2 * i + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    levels[i] = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    if levels[i] < requested then
+        wait = math.max(wait, (requested - levels[i]) / rate)
+    end
+end
+
+local allowed = 0
+if wait == 0 then
+    allowed = 1
+    if requested > 0 then
+        for i, key in ipairs(KEYS) do
+            local rate = tonumber(ARGV[2 * i])
+            levels[i] = levels[i] - requested
+            redis.call('HSET', key, 'tokens', levels[i], 'ts', now)
+            redis.call('EXPIRE', key, math.ceil(tonumber(ARGV[2 * i + 1]) / rate) + 1)
+        end
+    end
+end
+
+local result = {allowed, tostring(wait)}
+for i, level in ipairs(levels) do
+    result[i + 2] = tostring(level)
+end
+return result
+"""
+
+_token_bucket_script = REDIS_CONN.register_script(TOKEN_BUCKET_SCRIPT)
+
+def _run(buckets, requested):
+    args = [requested]
+    for bucket in buckets:
+        args += [bucket.rate, bucket.capacity]
+    allowed, wait, *levels = _token_bucket_script(keys=[bucket.key for bucket in buckets], args=args)
+    return bool(allowed), float(wait), [float(level) for level in levels]
+
+def consume_all(buckets, tokens=1):
+    """
+    Takes tokens from every bucket, or from none of them if one is short.
+    Returns (allowed, retry_after_seconds), the wait being for the emptiest bucket.
+    """
+    allowed, wait, _ = _run(buckets, tokens)
+    return allowed, wait
+
+class TokenBucket:
+    """
+    Redis token bucket shared by all processes. `rate` tokens are added per
+    second up to `capacity`, both must be positive.
+    """
+    def __init__(self, key, rate, capacity):
+        if not rate > 0 or not capacity > 0:
+            raise ImproperlyConfigured(f"Token bucket {key} needs a positive rate and capacity, "
+                                       f"got rate={rate} capacity={capacity}")
+        self.key = f"ratelimit:{key}"
+        self.rate = rate
+        self.capacity = capacity
+
+    def consume(self, tokens=1):
+        """
+        Takes tokens from the bucket. Returns (allowed, retry_after_seconds).
+        """
+        return consume_all([self], tokens)
+
+    def level(self):
+        """
+        Current number of tokens. Read-only, the bucket and its expiry are left as they are.
+        """
+        return _run([self], 0)[2][0]
+
+def provider_bucket(provider):
+    """
+    Bucket limiting calls to an LLM provider ("openai" or "grok") from Celery workers.
+    """
+    limits = settings.LLM_PROVIDER_RATE_LIMITS[provider]
+    return TokenBucket(f"provider:{provider}", limits["rate"], limits["capacity"])
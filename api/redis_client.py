@@ -0,0 +1,53 @@
+import asyncio
+import weakref
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+from .profiling import timed
+
+class Redis(redis.Redis):
+    """
+    redis.Redis that counts its round trips in the request profile (api/profiling.py).
+    """
+    def execute_command(self, *args, **options):
+        with timed("redis"):
+            return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return Pipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+class Pipeline(redis.client.Pipeline):
+    # A pipeline is one round trip
+    def execute(self, raise_on_error=True):
+        with timed("redis"):
+            return super().execute(raise_on_error)
+
+class AsyncRedis(redis.asyncio.Redis):
+    async def execute_command(self, *args, **options):
+        with timed("redis"):
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return AsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+class AsyncPipeline(redis.asyncio.client.Pipeline):
+    async def execute(self, raise_on_error=True):
+        with timed("redis"):
+            return await super().execute(raise_on_error)
+
+REDIS_CONN = Redis.from_url(settings.REDIS_URL)  # E.g. redis://localhost:6379/0
+
+_async_conns = weakref.WeakKeyDictionary()
+
+def get_async_redis():
+    """
+    asyncio Redis client for the running event loop. Connections can't be
+    shared between loops, so each loop (one per uvicorn worker) gets its own.
+    """
+    loop = asyncio.get_running_loop()
+    conn = _async_conns.get(loop)
+    if conn is None:
+        conn = _async_conns[loop] = AsyncRedis.from_url(settings.REDIS_URL)
+    return conn
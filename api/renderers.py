@@ -0,0 +1,57 @@
+"""
+orjson versions of DRF's JSON renderer and parser, set as the defaults in
+REST_FRAMEWORK. Responses are byte-for-byte what JSONRenderer produces for
+our payloads: orjson writes the dicts, lists, strings and numbers, and
+anything else (datetimes, Decimals, lazy strings, querysets) goes through
+DRF's own encoder. Known differences, none of which our serializers produce:
+floats below 1e-4 or from 1e16 up are written without the exponent's sign and
+zero padding (1e-07 becomes 1e-7, the same number to any JSON client), and
+NaN and Infinity become null.
+"""
+import io
+import re
+
+import orjson
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+# orjson reads integers past 64 bits as floats, json keeps them exact
+LONG_NUMBER = re.compile(rb'\d{20}')
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        # Indented output (the browsable API, ?indent=) keeps the stock formatting
+        if not self.compact or self.get_indent(accepted_media_type, renderer_context) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # Integers past 64 bits, circular data, errors raised by the encoder
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Escaped like JSONRenderer so the output stays a strict javascript subset
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        body = stream.read()
+        if encoding.lower().replace('-', '') == 'utf8' and not LONG_NUMBER.search(body):
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        # Other encodings, long numbers, NaN and Infinity (unless STRICT_JSON),
+        # and the stock error message for invalid JSON
+        return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,248 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+import openai
+from django.conf import settings
+
+# Errors worth another attempt: timeouts, dropped connections, throttling and 5xx.
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,  # Includes APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+    TimeoutError,
+)
+
+class ProviderUnavailableError(RuntimeError):
+    """
+    Raised without calling the provider while its circuit breaker is open.
+    retry_after is the number of seconds until the breaker lets a probe through.
+    """
+    def __init__(self, message, retry_after=0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Per-process circuit breaker. Opens after `failure_threshold` consecutive
+    failures and lets a single probe request through once `reset_timeout`
+    seconds have passed.
+    """
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.probing and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.probing = True
+                return True
+            return False
+
+    def retry_after(self):
+        """
+        Seconds until a probe request is let through, 0 while closed.
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return 0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+_hedge_loop = None
+_hedge_loop_pid = None
+_hedge_loop_lock = threading.Lock()
+
+def get_breaker(provider):
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(
+                provider,
+                failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+                reset_timeout=settings.LLM_BREAKER_RESET_TIMEOUT,
+            )
+        return _breakers[provider]
+
+def section_timeout(prompt_id):
+    """
+    Total time budget in seconds for one section, shared by all attempts.
+    """
+    return settings.LLM_SECTION_TIMEOUTS.get(prompt_id, settings.LLM_TIMEOUT)
+
+class _Attempts:
+    """
+    The breaker, deadline and backoff bookkeeping shared by
+    call_with_resilience and acall_with_resilience, which only differ in how
+    they wait.
+    """
+    def __init__(self, provider, timeout):
+        self.breaker = get_breaker(provider)
+        if not self.breaker.allow():
+            raise ProviderUnavailableError(f"{provider} is unavailable, please try again shortly.",
+                                           retry_after=self.breaker.retry_after())
+        self.deadline = time.monotonic() + timeout
+        self.attempt = 0
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def hedge_after(self, remaining):
+        """
+        Seconds before hedging the next attempt, None to not hedge it.
+        """
+        hedge_after = settings.LLM_HEDGE_AFTER
+        return hedge_after if hedge_after is not None and hedge_after < remaining else None
+
+    def succeeded(self):
+        self.breaker.record_success()
+
+    def rejected(self):
+        # The provider answered, the request itself was rejected
+        self.breaker.record_success()
+
+    def failed(self):
+        """
+        Records a retryable error. Returns the seconds to wait before the next
+        attempt, or None when the error should be raised.
+        """
+        self.breaker.record_failure()
+        self.attempt += 1
+        backoff = min(settings.LLM_RETRY_BACKOFF * (2 ** (self.attempt - 1)), settings.LLM_RETRY_BACKOFF_MAX)
+        backoff = random.uniform(0, backoff)  # Full jitter
+        if (self.attempt > settings.LLM_MAX_RETRIES or time.monotonic() + backoff >= self.deadline
+                or not self.breaker.allow()):
+            return None
+        return backoff
+
+def _get_hedge_loop():
+    """
+    The process's event loop for sync hedged calls, running in a daemon
+    thread. Started on first use and again in a forked child, which inherits
+    the loop but not its thread.
+    """
+    global _hedge_loop, _hedge_loop_pid
+    with _hedge_loop_lock:
+        if _hedge_loop is None or _hedge_loop_pid != os.getpid():
+            _hedge_loop = asyncio.new_event_loop()
+            _hedge_loop_pid = os.getpid()
+            threading.Thread(target=_hedge_loop.run_forever, name="llm-hedge", daemon=True).start()
+        return _hedge_loop
+
+def _hedged(arequest, timeout, hedge_after):
+    """
+    Sync entry to _ahedged, run on the hedge loop. The attempts are async so
+    the losing one can be cancelled, a blocking request in a thread could
+    only be left to finish.
+    """
+    future = asyncio.run_coroutine_threadsafe(_ahedged(arequest, timeout, hedge_after), _get_hedge_loop())
+    return future.result()
+
+def call_with_resilience(provider, request, timeout, arequest=None):
+    """
+    Calls `request(timeout)` against `provider` within a total budget of
+    `timeout` seconds, retrying retryable errors with jittered exponential
+    backoff and failing fast while the provider's circuit breaker is open.
+    Slow attempts are hedged when `arequest`, an async version of `request`,
+    is given.
+    """
+    attempts = _Attempts(provider, timeout)
+    while True:
+        remaining = attempts.remaining()
+        hedge_after = attempts.hedge_after(remaining)
+        try:
+            if hedge_after is not None and arequest is not None:
+                result = _hedged(arequest, remaining, hedge_after)
+            else:
+                result = request(remaining)
+        except RETRYABLE_ERRORS:
+            backoff = attempts.failed()
+            if backoff is None:
+                raise
+            time.sleep(backoff)
+        except Exception:
+            attempts.rejected()
+            raise
+        else:
+            attempts.succeeded()
+            return result
+
+async def _ahedged(request, timeout, hedge_after):
+    """
+    Runs `request`, and if it has not finished after `hedge_after` seconds
+    fires an identical second request. The first successful result wins and
+    the other attempt is cancelled.
+    """
+    deadline = time.monotonic() + timeout
+    pending = {asyncio.ensure_future(request(timeout))}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=min(hedge_after, timeout))
+        if not done:
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                pending.add(asyncio.ensure_future(request(remaining)))
+
+        error = None
+        while True:
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            remaining = deadline - time.monotonic()
+            if not pending or remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+
+        raise error or TimeoutError(f"No response within {timeout:.1f}s")
+    finally:
+        # The losing attempt is not needed any more
+        for task in pending:
+            task.cancel()
+
+async def acall_with_resilience(provider, request, timeout):
+    """
+    Async version of call_with_resilience for `await request(timeout)`. Shares
+    the circuit breakers and settings of the sync version.
+    """
+    attempts = _Attempts(provider, timeout)
+    while True:
+        remaining = attempts.remaining()
+        hedge_after = attempts.hedge_after(remaining)
+        try:
+            if hedge_after is not None:
+                result = await _ahedged(request, remaining, hedge_after)
+            else:
+                result = await request(remaining)
+        except RETRYABLE_ERRORS:
+            backoff = attempts.failed()
+            if backoff is None:
+                raise
+            await asyncio.sleep(backoff)
+        except Exception:
+            attempts.rejected()
+            raise
+        else:
+            attempts.succeeded()
+            return result
@@ -1,7 +1,12 @@
+import decimal
+
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.settings import ISO_8601, api_settings
 from .models import CustomUser, PatientDeviceData, PatientData, LLMOutput
 from django.contrib.auth import get_user_model
 from djoser import serializers as djoser_serializers
+from .gcs import signed_urls
 
 class PatientDeviceDataSerializer(serializers.ModelSerializer):
     patient_name = serializers.CharField(read_only=True)
@@ -28,6 +33,8 @@ class PatientDeviceDataSerializer(serializers.ModelSerializer):
             'hydrogen',
             'formaldehyde',
             'created_at',
+            'abnormal_flags',
+            'severity',
             'patient_name',
             'patient_age',
             'patient_gender',
@@ -35,6 +42,101 @@ class PatientDeviceDataSerializer(serializers.ModelSerializer):
             'model_output_id'
         ]
 
+class ValuesSerializer:
+    """
+    Read-only list serialization of .values() rows, with the same output as
+    `serializer_class(rows, many=True).data`. The serializer's fields are bound
+    once instead of per row, and every column gets a plain converter per call:
+    decimals are quantized and formatted directly and datetimes are shifted to
+    a timezone looked up once.
+    """
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self._fields = None
+
+    @property
+    def fields(self):
+        # Bound on first use, ModelSerializer fields need the app registry
+        if self._fields is None:
+            self._fields = [
+                (name, field) for name, field in self.serializer_class().fields.items()
+                if not field.write_only
+            ]
+        return self._fields
+
+    @staticmethod
+    def _converter(field):
+        if (isinstance(field, serializers.DecimalField) and field.decimal_places is not None
+                and getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+                and not field.localize and not field.normalize_output):
+            exponent = decimal.Decimal(".1") ** field.decimal_places
+            context = decimal.getcontext().copy()
+            if field.max_digits is not None:
+                context.prec = field.max_digits
+            rounding = field.rounding
+
+            def convert(value):
+                if not isinstance(value, decimal.Decimal):
+                    value = decimal.Decimal(str(value).strip())
+                return f"{value.quantize(exponent, rounding=rounding, context=context):f}"
+            return convert
+
+        output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+        if (isinstance(field, serializers.DateTimeField) and output_format
+                and output_format.lower() == ISO_8601):
+            field_timezone = field.timezone if hasattr(field, "timezone") else field.default_timezone()
+
+            def convert(value):
+                if field_timezone is None or isinstance(value, str) or timezone.is_naive(value):
+                    return field.to_representation(value)
+                value = value.astimezone(field_timezone).isoformat()
+                if value.endswith("+00:00"):
+                    value = value[:-6] + "Z"
+                return value
+            return convert
+
+        return field.to_representation
+
+    def to_representation(self, rows, fields=None):
+        """
+        `fields` limits the output to those of the serializer's fields.
+        """
+        rows = list(rows)
+        if not rows:
+            return []
+        # .values() rows share their keys. Fields missing from them come out as
+        # None when nullable and are left out otherwise, as in the serializer.
+        present = rows[0].keys()
+        columns = [
+            (name, self._converter(field)) for name, field in self.fields
+            if (name in present or field.allow_null) and (fields is None or name in fields)
+        ]
+        return [
+            {name: None if (value := row.get(name)) is None else convert(value) for name, convert in columns}
+            for row in rows
+        ]
+
+# PatientView's page of latest readings
+PATIENT_LIST_SERIALIZER = ValuesSerializer(PatientDeviceDataSerializer)
+
+class TimelineConsultationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LLMOutput
+        fields = [
+            'id',
+            'created_at',
+            'symptoms',
+            'history',
+            'notes',
+            'doctor_remark',
+            'doctor_comment',
+            'doctor_note',
+            *[f'output_text_{prompt_id}' for prompt_id in range(1, 12)],
+        ]
+
+# PatientTimelineView's readings and their consultations
+TIMELINE_CONSULTATION_SERIALIZER = ValuesSerializer(TimelineConsultationSerializer)
+
 class PatientDataSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -87,9 +189,12 @@ class DjoserUserSerializer(djoser_serializers.UserSerializer):
         fields = ['id', 'username', 'full_name', 'role']
 
 class LLMOutputSerializer(serializers.ModelSerializer):
+    # Stored values are object paths, clients receive signed URLs
+    file_urls = serializers.SerializerMethodField()
+
     class Meta:
         model = LLMOutput
-        fields = "__all__"  # Default to all fields
+        exclude = ["archive_path"]  # Default to all fields
 
     def __init__(self, *args, **kwargs):
         # Get requested fields from context
@@ -103,6 +208,9 @@ class LLMOutputSerializer(serializers.ModelSerializer):
             for field_name in existing - allowed:
                 self.fields.pop(field_name)
 
+    def get_file_urls(self, obj):
+        return signed_urls(obj.file_urls)
+
 class EmailSerializer(serializers.Serializer):
     email = serializers.EmailField()
 
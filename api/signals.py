@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from .gcs import signed_urls
+from .models import LLMOutput, PatientDeviceData, SensorReferenceRange
+from .triage import clear_reference_ranges, reading_score
+
+# Sent by api.tasks.finalize_consultation once every background section of a
+# consultation has finished, with `output_id` and `generation_seconds`.
+consultation_completed = Signal()
+
+@receiver(consultation_completed)
+def warm_signed_urls(sender, output_id, **kwargs):
+    # The app opens the finished report next, have its file links ready in the cache
+    file_urls = LLMOutput.objects.filter(id=output_id).values_list("file_urls", flat=True).first()
+    if file_urls:
+        signed_urls(file_urls)
+
+@receiver(pre_save, sender=PatientDeviceData)
+def score_reading(sender, instance, **kwargs):
+    instance.abnormal_flags, instance.severity = reading_score(instance)
+
+@receiver(post_save, sender=SensorReferenceRange)
+@receiver(post_delete, sender=SensorReferenceRange)
+def reference_range_changed(sender, **kwargs):
+    from .tasks import rescore_readings
+
+    clear_reference_ranges()
+    # Once every process's cached ranges have expired
+    transaction.on_commit(lambda: rescore_readings.apply_async(countdown=settings.REFERENCE_RANGES_CACHE_TTL))
@@ -1,83 +1,399 @@
 # tasks.py
-from celery import shared_task
+import hashlib
+import json
+import logging
+import random
+import time
+from datetime import timedelta
+
+from celery import chord, shared_task
+from celery.exceptions import Retry
 from django.conf import settings
-import redis
-from .models import LLMOutput, PatientData
+from django.db import transaction
+from django.utils import timezone
+from .models import LLMOutput, PatientData, PatientDeviceData
 from .serializer import PatientDeviceDataSerializer
 from .prompt_jivi import (
     generate_system_prompt, generate_base_prompt,
     generate_diagnosis_prompt, generate_organ_prompt, generate_summary_prompt,
     generate_analysis_prompt, generate_alerts_prompt, generate_actions_prompt,
     generate_medication_prompt, generate_insights_prompt, generate_table_prompt,
-    grok_image_prompt
+    grok_image_prompt, generate_initial_prompt, generate_combined_prompt, combined_response_schema,
+    section_key
 )
 
-from .generate_jivi import send_to_jivi, send_to_grok
-
-REDIS_CONN = redis.Redis.from_url(settings.REDIS_URL)  # E.g. redis://localhost:6379/0
+from .generate_jivi import send_to_jivi, send_to_grok, send_to_jivi_json
+from .gcs import signed_urls
+from .coalesce import single_flight
+from .resilience import section_timeout
+from .redis_client import REDIS_CONN
+from .ratelimit import provider_bucket
+from .emails import build_email, close_smtp_connection, seal_context, send_email
+from .metrics import record_section_ready
+from .signals import consultation_completed
+from .triage import load_reference_ranges, reference_ranges, score_readings
+from .partitions import create_partitions, expire_partitions, is_partitioned
+from .archive import archive_consultation
+from .db_router import stick_to_primary
 
 PROMPT_IDS = [2, 3, 4, 5, 6, 7, 8, 9, 10]  # Async prompts
+SECTION_PROMPT_IDS = [1, *PROMPT_IDS]  # Prompts handled by generate_section
+
+# Text sections the combined mode asks for in one call, prompt 10 (Grok vision) stays separate
+COMBINED_SECTION_IDS = [1, 2, 3, 4, 5, 6, 7, 8, 9, 11]
+COMBINED_PROMPT_ID = 0  # Metrics and timeout budget key of the combined call
+
+EMAIL_OUTBOX_KEY = "mail:outbox"
+EMAIL_RETRY_KEY = "mail:retry"  # Sorted set of failed emails, scored by when they are due again
+
+# Moves up to ARGV[2] retries that are due by ARGV[1] to the end of the outbox
+REQUEUE_DUE_EMAILS_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+    redis.call('RPUSH', KEYS[2], unpack(due))
+end
+return #due
+"""
+
+_requeue_due_emails = REDIS_CONN.register_script(REQUEUE_DUE_EMAILS_SCRIPT)
+
+logger = logging.getLogger(__name__)
 
 def redis_key(output_id, prompt_id):
     return f"llm:output:{output_id}:prompt:{prompt_id}"
 
-@shared_task
-def generate_prompt_in_background(output_id, prompt_id):
+def section_provider(prompt_id):
+    return "grok" if prompt_id == 10 else "openai"
+
+def section_priority(prompt_id):
+    """
+    Broker priority of a background section, 0 (first) to 9, from its place in
+    SECTION_PRIORITY_ORDER. Sections missing from the setting go last. None
+    when the setting is empty: every section is queued alike.
+    """
+    order = settings.SECTION_PRIORITY_ORDER
+    if not order:
+        return None
+    return min(order.index(prompt_id), 9) if prompt_id in order else 9
+
+def section_calls_provider(model_output, prompt_id):
+    """
+    Whether generate_section calls a provider for the section. It doesn't for
+    the medication section without a medication type, or for the image
+    analysis without uploaded files.
+    """
+    if prompt_id == 8:
+        return bool(model_output.medication_type)
+    if prompt_id == 10:
+        return bool(model_output.file_urls)
+    return True
+
+def consultation_base_prompt(patient, sensor_data, symptoms, history, notes):
+    """
+    Builds the base report shared by every section of a consultation. All
+    call sites go through here so section prompts share an identical prefix.
+    """
+    patient_data = {
+        "patientName": patient.name,
+        "age": patient.age,
+        "gender": patient.gender,
+        "symptoms": symptoms,
+        "medicalHistory": history,
+        "notes": notes,
+    }
+    return generate_base_prompt(patient_data, PatientDeviceDataSerializer(sensor_data).data, reference_ranges())
+
+def generate_section(model_output, prompt_id, system_prompt, base_prompt, reload=False):
+    """
+    Generates the text for one section of a consultation. Returns None when the
+    section has nothing to generate (no medication type selected for prompt 8).
+
+    Identical generations running at the same time, e.g. a reload racing the
+    background task, share a single provider call keyed on
+    (output_id, prompt_id, prompt hash). A reload only joins a call still in
+    flight, never the text of one that just finished.
+
+    Raises ValueError for an unknown prompt_id.
+    """
+    if not section_calls_provider(model_output, prompt_id):
+        return "No files were uploaded" if prompt_id == 10 else None
+
+    if prompt_id == 1:
+        user_prompt = generate_initial_prompt(base_prompt)
+    elif prompt_id == 2:
+        user_prompt = generate_diagnosis_prompt(base_prompt)
+    elif prompt_id == 3:
+        user_prompt = generate_organ_prompt(base_prompt)
+    elif prompt_id == 4:
+        user_prompt = generate_summary_prompt(base_prompt)
+    elif prompt_id == 5:
+        user_prompt = generate_analysis_prompt(base_prompt)
+    elif prompt_id == 6:
+        user_prompt = generate_alerts_prompt(base_prompt)
+    elif prompt_id == 7:
+        user_prompt = generate_actions_prompt(base_prompt)
+    elif prompt_id == 8:
+        user_prompt = generate_medication_prompt(base_prompt, model_output.medication_type)
+    elif prompt_id == 9:
+        user_prompt = generate_insights_prompt(base_prompt)
+    elif prompt_id == 10:
+        user_prompt = grok_image_prompt(base_prompt)
+    else:
+        raise ValueError(f"Invalid prompt_id {prompt_id}")
+
+    doctor_id = model_output.sensor_data.doctor_id
+    if prompt_id == 10:
+        call = lambda: send_to_grok(user_prompt, signed_urls(model_output.file_urls), prompt_id=prompt_id, doctor_id=doctor_id)
+    else:
+        call = lambda: send_to_jivi(system_prompt, user_prompt, prompt_id=prompt_id, doctor_id=doctor_id)
+
+    prompt_hash = hashlib.sha256(f"{system_prompt}\0{user_prompt}".encode()).hexdigest()[:16]
+    flight_timeout = section_timeout(prompt_id) + 30
+    return single_flight(
+        REDIS_CONN,
+        f"llm:flight:{model_output.id}:{prompt_id}:{prompt_hash}",
+        call,
+        lock_ttl=flight_timeout,
+        wait_timeout=flight_timeout,
+        result_ttl=settings.LLM_COALESCE_RESULT_TTL,
+        reuse_result=not reload,
+    )
+
+def generate_combined_sections(system_prompt, base_prompt, medication_type, doctor_id):
+    """
+    Generates all text sections with one JSON-schema constrained completion
+    (LLM_GENERATION_MODE = "combined"). Returns {prompt_id: text} for the
+    sections that came back valid. Callers generate anything missing with
+    the regular per-section calls.
+    """
+    prompt_ids = [prompt_id for prompt_id in COMBINED_SECTION_IDS if prompt_id != 8 or medication_type]
     try:
+        result = send_to_jivi_json(
+            system_prompt,
+            generate_combined_prompt(base_prompt, prompt_ids, medication_type),
+            combined_response_schema(prompt_ids),
+            "consultation_sections",
+            prompt_id=COMBINED_PROMPT_ID,
+            doctor_id=doctor_id,
+        )
+    except RuntimeError as e:
+        logger.warning("Combined generation failed, falling back to per-section calls: %s", e)
+        return {}
+
+    sections = {}
+    for prompt_id in prompt_ids:
+        text = result.get(section_key(prompt_id))
+        if isinstance(text, str) and text.strip():
+            sections[prompt_id] = text.strip()
+        else:
+            logger.warning("Combined generation returned no valid text for section %s", prompt_id)
+    return sections
+
+def save_section(model_output, prompt_id, text):
+    """
+    Stores a section's text without overwriting sections saved concurrently by other tasks.
+    """
+    setattr(model_output, f"output_text_{prompt_id}", text)
+    model_output.save(update_fields=[f"output_text_{prompt_id}", "updated_at"])
+
+@shared_task(bind=True)
+def generate_prompt_in_background(self, output_id, prompt_id):
+    try:
+        if prompt_id not in SECTION_PROMPT_IDS:
+            REDIS_CONN.setex(redis_key(output_id, prompt_id), 300, "invalid")
+            return
+
         model_output = LLMOutput.objects.get(id=output_id)
-        sensor_data = model_output.sensor_data
+
+        # Over the provider's rate limit: come back later instead of holding the worker slot.
+        # Sections without a provider call don't need a token.
+        if section_calls_provider(model_output, prompt_id):
+            allowed, retry_after = provider_bucket(section_provider(prompt_id)).consume()
+            if not allowed:
+                REDIS_CONN.setex(redis_key(output_id, prompt_id), 300, "pending")
+                raise self.retry(countdown=retry_after + random.uniform(0, 1), max_retries=None)
+
         patient = PatientData.objects.get(patient_mobile_number=model_output.patient_mobile_number)
-        patient_device_data = PatientDeviceDataSerializer(sensor_data).data
-        patient_data = {
-            "patientName": patient.name,
-            "age": patient.age,
-            "gender": patient.gender,
-            "symptoms": model_output.symptoms,
-            "medicalHistory": model_output.history,
-        }
         system_prompt = generate_system_prompt()
-        base_prompt = generate_base_prompt(patient_data, patient_device_data)
+        base_prompt = consultation_base_prompt(
+            patient, model_output.sensor_data, model_output.symptoms, model_output.history, model_output.notes
+        )
 
         # Mark as "processing"
         REDIS_CONN.setex(redis_key(output_id, prompt_id), 300, "processing")  # Expires in 15 min
 
-        if prompt_id == 2:
-            val = send_to_jivi(system_prompt, generate_diagnosis_prompt(base_prompt))
-            model_output.output_text_2 = val
-        elif prompt_id == 3:
-            val = send_to_jivi(system_prompt, generate_organ_prompt(base_prompt))
-            model_output.output_text_3 = val
-        elif prompt_id == 4:
-            val = send_to_jivi(system_prompt, generate_summary_prompt(base_prompt))
-            model_output.output_text_4 = val
-        elif prompt_id == 5:
-            val = send_to_jivi(system_prompt, generate_analysis_prompt(base_prompt))
-            model_output.output_text_5 = val
-        elif prompt_id == 6:
-            val = send_to_jivi(system_prompt, generate_alerts_prompt(base_prompt))
-            model_output.output_text_6 = val
-        elif prompt_id == 7:
-            val = send_to_jivi(system_prompt, generate_actions_prompt(base_prompt))
-            model_output.output_text_7 = val
-        elif prompt_id == 8:
-            if model_output.medication_type:
-                val = send_to_jivi(system_prompt, generate_medication_prompt(base_prompt, model_output.medication_type))
-                model_output.output_text_8 = val
-        elif prompt_id == 9:
-            val = send_to_jivi(system_prompt, generate_insights_prompt(base_prompt))
-            model_output.output_text_9 = val
-        elif prompt_id == 10:
-            if not model_output.file_urls:
-                val = "No files were uploaded"
-            else:
-                val = send_to_grok(grok_image_prompt(base_prompt), model_output.file_urls)
-            model_output.output_text_10 = val
-        else:
-            REDIS_CONN.setex(redis_key(output_id, prompt_id), 300, "invalid")
-            return
-
-        model_output.save()
+        val = generate_section(model_output, prompt_id, system_prompt, base_prompt)
+        if val is not None:
+            save_section(model_output, prompt_id, val)
+            # The doctor fetches the section once it is "done", from the primary while replicas catch up
+            stick_to_primary(model_output.sensor_data.doctor_id)
         REDIS_CONN.setex(redis_key(output_id, prompt_id), 300, "done")  # Expire in 5min after done
+        record_section_ready(prompt_id, (timezone.now() - model_output.created_at).total_seconds())
 
+    except Retry:
+        raise
     except Exception as e:
         REDIS_CONN.setex(redis_key(output_id, prompt_id), 300, f"error:{str(e)}")
+
+def dispatch_sections(output_id, pending_ids, done_ids=()):
+    """
+    Marks every section's status in one Redis round trip and starts the pending
+    ones as a chord, finalize_consultation runs once they have all finished.
+    Sections are sent in SECTION_PRIORITY_ORDER with their broker priority.
+    """
+    pipe = REDIS_CONN.pipeline(transaction=False)
+    for prompt_id in done_ids:
+        pipe.setex(redis_key(output_id, prompt_id), 300, "done")
+    for prompt_id in pending_ids:
+        pipe.setex(redis_key(output_id, prompt_id), 300, "pending")
+    pipe.execute()
+
+    if not pending_ids:
+        finalize_consultation.delay([], output_id)
+        return
+    pending_ids = sorted(pending_ids, key=lambda prompt_id: section_priority(prompt_id) or 0)
+    chord(
+        generate_prompt_in_background.s(output_id, prompt_id).set(priority=section_priority(prompt_id))
+        for prompt_id in pending_ids
+    )(finalize_consultation.s(output_id))
+
+@shared_task
+def finalize_consultation(results, output_id):
+    """
+    Chord callback: records when the consultation finished generating and
+    notifies consultation_completed receivers.
+    """
+    completed_at = timezone.now()
+    created_at = LLMOutput.objects.filter(id=output_id).values_list("created_at", flat=True).first()
+    if created_at is None:
+        return
+    generation_seconds = (completed_at - created_at).total_seconds()
+    LLMOutput.objects.filter(id=output_id).update(
+        generation_completed_at=completed_at,
+        generation_seconds=generation_seconds,
+    )
+    logger.info("Consultation %s generated in %.1fs", output_id, generation_seconds)
+    consultation_completed.send(sender=LLMOutput, output_id=output_id, generation_seconds=generation_seconds)
+
+def queue_email(kind, user_id, **context):
+    """
+    Queues an email ("verification" or "otp") for the housekeeping workers and
+    returns immediately. Delivery is triggered once the current transaction commits.
+    The context (e.g. the OTP) is stored encrypted.
+    """
+    payload = json.dumps({"kind": kind, "user_id": user_id, "context": seal_context(context)})
+
+    def enqueue():
+        REDIS_CONN.rpush(EMAIL_OUTBOX_KEY, payload)
+        deliver_queued_emails.delay()
+
+    transaction.on_commit(enqueue)
+
+@shared_task
+def deliver_queued_emails():
+    """
+    Sends up to EMAIL_BATCH_SIZE queued emails over this worker's persistent
+    SMTP connection. Failed emails wait in EMAIL_RETRY_KEY with exponential
+    backoff and are put back on the outbox once due, up to EMAIL_MAX_ATTEMPTS
+    attempts. LPOP with a count needs Redis 6.2 or newer.
+    """
+    _requeue_due_emails(keys=[EMAIL_RETRY_KEY, EMAIL_OUTBOX_KEY], args=[time.time(), settings.EMAIL_BATCH_SIZE])
+    payloads = REDIS_CONN.lpop(EMAIL_OUTBOX_KEY, settings.EMAIL_BATCH_SIZE) or []
+
+    retry = {}
+    for raw in payloads:
+        payload = json.loads(raw)
+        try:
+            message = build_email(payload)
+            if message is not None:
+                send_email(message)
+        except Exception as e:
+            close_smtp_connection()  # Start the next email on a fresh connection
+            payload["attempts"] = payload.get("attempts", 0) + 1
+            if payload["attempts"] >= settings.EMAIL_MAX_ATTEMPTS:
+                logger.error("Giving up on %s email for user %s: %s", payload["kind"], payload["user_id"], e)
+                continue
+            logger.warning("Failed to send %s email for user %s: %s", payload["kind"], payload["user_id"], e)
+            retry[json.dumps(payload)] = settings.EMAIL_RETRY_DELAY * 2 ** (payload["attempts"] - 1)
+
+    if retry:
+        now = time.time()
+        REDIS_CONN.zadd(EMAIL_RETRY_KEY, {raw: now + delay for raw, delay in retry.items()})
+        deliver_queued_emails.apply_async(countdown=min(retry.values()))
+    if len(payloads) == settings.EMAIL_BATCH_SIZE:
+        # A full batch, there may be more waiting
+        deliver_queued_emails.delay()
+
+@shared_task
+def score_unscored_readings():
+    """
+    Scores readings that were saved without pre_save (inserted by the devices
+    or bulk_create), READING_SCORE_BATCH_SIZE per UPDATE. Runs periodically
+    from celery beat.
+    """
+    scored = 0
+    while True:
+        ids = list(PatientDeviceData.objects.filter(abnormal_flags__isnull=True)
+                   .values_list("id", flat=True)[:settings.READING_SCORE_BATCH_SIZE])
+        if not ids:
+            break
+        scored += score_readings(PatientDeviceData.objects.filter(id__in=ids))
+    if scored:
+        logger.info("Scored %s readings", scored)
+    return scored
+
+@shared_task
+def rescore_readings():
+    """
+    Scores every reading again after a SensorReferenceRange changed, in id order
+    and READING_SCORE_BATCH_SIZE per UPDATE. Reads the ranges from the database,
+    the cache of this worker may not have expired yet.
+    """
+    ranges = load_reference_ranges()
+    last_id = 0
+    while True:
+        ids = list(PatientDeviceData.objects.filter(id__gt=last_id).order_by("id")
+                   .values_list("id", flat=True)[:settings.READING_SCORE_BATCH_SIZE])
+        if not ids:
+            break
+        score_readings(PatientDeviceData.objects.filter(id__in=ids), ranges)
+        last_id = ids[-1]
+
+@shared_task
+def manage_reading_partitions():
+    """
+    Creates the coming months' PatientDeviceData partitions and expires the
+    months past READING_RETENTION_MONTHS (api.partitions). Runs daily from
+    celery beat, does nothing unless the table is partitioned.
+    """
+    if not is_partitioned():
+        return
+    create_partitions()
+    expire_partitions()
+
+@shared_task
+def archive_old_consultations():
+    """
+    Moves the section texts of consultations older than
+    LLM_OUTPUT_ARCHIVE_AFTER_DAYS to the bucket (api.archive), oldest first and
+    LLM_OUTPUT_ARCHIVE_BATCH_SIZE per run. Runs periodically from celery beat.
+    """
+    if not settings.LLM_OUTPUT_ARCHIVE_AFTER_DAYS:
+        return 0
+    cutoff = timezone.now() - timedelta(days=settings.LLM_OUTPUT_ARCHIVE_AFTER_DAYS)
+    outputs = list(LLMOutput.objects.filter(created_at__lt=cutoff, archived_at__isnull=True)
+                   .order_by("created_at")[:settings.LLM_OUTPUT_ARCHIVE_BATCH_SIZE])
+
+    archived = 0
+    for output in outputs:
+        try:
+            archived += archive_consultation(output)
+        except Exception as e:
+            logger.warning("Failed to archive consultation %s: %s", output.id, e)
+    if archived:
+        logger.info("Archived %s consultations", archived)
+    if archived and len(outputs) == settings.LLM_OUTPUT_ARCHIVE_BATCH_SIZE:
+        # A full batch, there may be more waiting
+        archive_old_consultations.delay()
+    return archived
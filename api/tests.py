@@ -1,3 +1,1942 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import smtplib
+import sys
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import redis
+from asgiref.sync import async_to_sync, sync_to_async
+from celery.exceptions import Retry
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.contrib.auth.tokens import default_token_generator
+from django.db import connection
+from django.db.models import BooleanField, IntegerField, QuerySet, Value
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone as django_timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from django.utils.translation import gettext_lazy
+from redis.client import PubSub
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from gloport_backend.celery import LLM_TEXT_QUEUE, LLM_VISION_QUEUE, route_task
+
+from . import resilience
+from .archive import archive_consultation, hydrate_consultation
+from .async_views import AsyncGenerateJiviResponse, AsyncStatusView
+from .emails import build_email
+from .clients import async_openai_client, openai_client
+from .coalesce import single_flight
+from .db_router import ReplicaRouter, ReplicaRoutingMiddleware, stick_to_primary, sticky_key
+from .gcs import signed_url, signed_urls, upload_file
+from .generate_jivi import asend_to_jivi, send_to_jivi
+from .idempotency import idempotent
+from .metrics import LATENCY_BUCKETS, record_llm_call, render_prometheus
+from .models import CustomUser, LLMCallDailyStat, LLMOutput, PatientData, PatientDeviceData, SensorReferenceRange
+from .otp import (OTP_INVALID, OTP_LOCKED, OTP_MISSING, OTP_VALID, VERIFY_OTP_SCRIPT, attempts_key, issue_otp,
+                  otp_key, verify_otp)
+from .partitions import (create_partition_sql, create_partitions, expire_partitions, month_partitions, month_start,
+                         partition_name)
+from .profiling import ProfilingMiddleware, record_timing
+from .ratelimit import TOKEN_BUCKET_SCRIPT, TokenBucket, consume_all, provider_bucket
+from .redis_client import REDIS_CONN, Redis as ProfiledRedis
+from .renderers import ORJSONParser, ORJSONRenderer
+from .resilience import ProviderUnavailableError
+from .signals import consultation_completed
+from .throttling import LLMGenerationThrottle, throttle_bucket, throttle_levels
+from .triage import clear_reference_ranges, reading_score, reference_ranges, score_readings
+from .tasks import (COMBINED_SECTION_IDS, EMAIL_OUTBOX_KEY, EMAIL_RETRY_KEY, PROMPT_IDS, archive_old_consultations,
+                    consultation_base_prompt, deliver_queued_emails, dispatch_sections, finalize_consultation,
+                    generate_combined_sections, generate_prompt_in_background, queue_email, redis_key,
+                    rescore_readings, save_section, section_priority)
+from .serializer import (PATIENT_LIST_SERIALIZER, LLMOutputSerializer, PatientDataSerializer,
+                         PatientDeviceDataSerializer)
+from .views import consultation_status_data
+from .prompt_jivi import (SECTION_SEPARATOR, combined_response_schema, generate_actions_prompt, generate_alerts_prompt,
+                          generate_analysis_prompt, generate_base_prompt, generate_diagnosis_prompt,
+                          generate_initial_prompt, generate_insights_prompt, generate_medication_prompt,
+                          generate_organ_prompt, generate_summary_prompt, generate_system_prompt, generate_table_prompt,
+                          grok_image_prompt, section_key)
+
+PATIENT_DATA = {
+    "patientName": "Test Patient",
+    "age": 42,
+    "gender": "Female",
+    "symptoms": "Shortness of breath",
+    "medicalHistory": "Asthma",
+    "notes": "Follow-up visit",
+}
+
+SENSOR_DATA = {
+    "co": "3.20",
+    "co2": "31000.00",
+    "o2": "15.10",
+    "heart_rate": "88.00",
+    "spo2": "96.00",
+    "nh3": "0.80",
+    "rq": "0.85",
+    "hydrogen": None,
+    "formaldehyde": "0.012",
+}
+
+# SensorReferenceRange rows as api.triage.reference_ranges returns them
+REFERENCE_RANGES = [
+    {"sensor": "co", "label": "Carbon Monoxide (CO)", "unit": "ppm", "low": Decimal("0.000"),
+     "high": Decimal("10.000"), "bit": 0, "weight": 1},
+    {"sensor": "spo2", "label": "Blood Oxygen Saturation (SpO2)", "unit": "%", "low": Decimal("85.000"),
+     "high": None, "bit": 4, "weight": 1},
+]
+
+class PromptPrefixTests(SimpleTestCase):
+    """
+    The system prompt + base report must be byte-identical across every section
+    of a consultation, otherwise provider-side prompt caching never applies.
+    """
+    def section_prompts(self, base):
+        return {
+            1: generate_initial_prompt(base),
+            2: generate_diagnosis_prompt(base),
+            3: generate_organ_prompt(base),
+            4: generate_summary_prompt(base),
+            5: generate_analysis_prompt(base),
+            6: generate_alerts_prompt(base),
+            7: generate_actions_prompt(base),
+            8: generate_medication_prompt(base, "Allopathy"),
+            9: generate_insights_prompt(base),
+            10: grok_image_prompt(base),
+            11: generate_table_prompt(base),
+        }
+
+    def test_base_prompt_is_deterministic(self):
+        first = generate_base_prompt(PATIENT_DATA, SENSOR_DATA, REFERENCE_RANGES)
+        second = generate_base_prompt(dict(PATIENT_DATA), dict(SENSOR_DATA), list(REFERENCE_RANGES))
+        self.assertEqual(first, second)
+
+    def test_system_prompt_is_stable(self):
+        self.assertEqual(generate_system_prompt(), generate_system_prompt())
+        self.assertEqual(generate_system_prompt(), generate_system_prompt().strip())
+
+    def test_every_section_starts_with_the_shared_prefix(self):
+        base = generate_base_prompt(PATIENT_DATA, SENSOR_DATA, REFERENCE_RANGES)
+        prefix = base + SECTION_SEPARATOR
+        for prompt_id, prompt in self.section_prompts(base).items():
+            with self.subTest(prompt_id=prompt_id):
+                self.assertTrue(prompt.startswith(prefix))
+                self.assertGreater(len(prompt), len(prefix))
+
+class ORJSONRendererTests(TestCase):
+    """
+    ORJSONRenderer must produce exactly the bytes of DRF's JSONRenderer, and
+    ORJSONParser the same data as JSONParser.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = PatientData.objects.create(name="Zoë Ångström", patient_mobile_number="9000000001", age=42,
+                                                 gender="Female")
+        cls.reading = PatientDeviceData.objects.create(
+            doctor_id="1", patient_mobile_number=cls.patient.patient_mobile_number, device_serial_number="SN-1",
+            **SENSOR_DATA,
+        )
+        cls.output = LLMOutput.objects.create(
+            sensor_data=cls.reading, patient_mobile_number=cls.patient.patient_mobile_number,
+            symptoms="Cough\tand \"wheeze\"", history="Asthma\u2028since 2019", notes="Line 1\nLine 2 \u2014 ok \U0001f600",
+            medication_type="Allopathy", file_urls={}, generation_seconds=12.345,
+            **{f"output_text_{prompt_id}": f"**Section {prompt_id}**\n- 90 % \\ \x1f \u2029" for prompt_id in range(1, 12)},
+        )
+
+    def assertRendersIdentically(self, data, accepted_media_type=None, renderer_context=None):
+        expected = JSONRenderer().render(data, accepted_media_type, renderer_context)
+        self.assertEqual(ORJSONRenderer().render(data, accepted_media_type, renderer_context), expected)
+
+    def test_model_serializers(self):
+        output = LLMOutput.objects.select_related("sensor_data").get(id=self.output.id)
+        self.assertRendersIdentically(PatientDeviceDataSerializer(self.reading).data)
+        self.assertRendersIdentically(PatientDataSerializer(self.patient).data)
+        self.assertRendersIdentically(LLMOutputSerializer(output).data)
+        self.assertRendersIdentically(
+            consultation_status_data(output, PatientDataSerializer(self.patient).data, [])
+        )
+
+    def test_patient_list_page(self):
+        rows = PatientDeviceData.objects.values(
+            "id", "doctor_id", "patient_mobile_number", "device_serial_number", "co", "co2", "o2", "heart_rate",
+            "spo2", "nh3", "created_at",
+        )
+        self.assertRendersIdentically(PATIENT_LIST_SERIALIZER.to_representation(rows))
+
+    def test_values_the_encoder_handles(self):
+        self.assertRendersIdentically({
+            "aware": datetime(2024, 5, 1, 8, 30, 15, 123456, tzinfo=timezone.utc),
+            "offset": datetime(2024, 5, 1, 8, 30, tzinfo=timezone(timedelta(hours=5, minutes=30))),
+            "naive": datetime(2024, 5, 1, 8, 30),
+            "date": date(2024, 5, 1),
+            "duration": timedelta(minutes=90),
+            "decimal": Decimal("31000.25"),
+            "uuid": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+            "lazy": gettext_lazy("This field is required."),
+            "queryset": PatientData.objects.values_list("name", flat=True),
+            "numbers": [0, -1, 2 ** 63 - 1, 1.5, 0.1, 12.345, True, False, None],
+            1: "integer key",
+        })
+
+    def test_falls_back_to_the_stock_renderer(self):
+        self.assertRendersIdentically({"big": 2 ** 70})
+        self.assertRendersIdentically({"id": 1, "text": "a\u2028b"}, "application/json; indent=4")
+        self.assertRendersIdentically({"id": 1, "text": "a\u2028b"}, renderer_context={"indent": 2})
+        self.assertEqual(ORJSONRenderer().render(None), b"")
+
+    def test_parser(self):
+        bodies = [
+            b'{"id": 1, "text": "Zo\xc3\xab \\u2028", "values": [1.5, null, true, "3.20"]}',
+            b'{"big": 100000000000000000000000}',
+        ]
+        for body in bodies:
+            with self.subTest(body=body):
+                self.assertEqual(ORJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+
+        for body in (b'{"id": 1,', b'{"value": NaN}'):
+            with self.subTest(body=body), self.assertRaises(ParseError):
+                ORJSONParser().parse(io.BytesIO(body))
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(SimpleTestCase):
+    """
+    Which database ReplicaRouter picks for reads during a request handled by
+    ReplicaRoutingMiddleware. No queries are run.
+    """
+    doctor_ids = (9001, 9002)
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        REDIS_CONN.delete(*(sticky_key(doctor_id) for doctor_id in self.doctor_ids))
+
+    def request(self, method, doctor_id=None, write=False):
+        """
+        Runs a request through the middleware and returns the databases read
+        from before and after it writes.
+        """
+        headers = {}
+        if doctor_id is not None:
+            headers["HTTP_AUTHORIZATION"] = f"JWT {AccessToken.for_user(CustomUser(pk=doctor_id))}"
+        reads = []
+
+        def view(request):
+            reads.append(self.router.db_for_read(PatientData))
+            if write:
+                self.router.db_for_write(PatientData)
+                reads.append(self.router.db_for_read(PatientData))
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(getattr(RequestFactory(), method)("/", **headers))
+        return reads
+
+    def test_reads_outside_requests_use_the_primary(self):
+        self.assertEqual(self.router.db_for_read(PatientData), "default")
+        self.assertEqual(self.router.db_for_write(PatientData), "default")
+
+    def test_read_only_requests_use_a_replica_until_they_write(self):
+        self.assertEqual(self.request("get"), ["replica"])
+        self.assertEqual(self.request("get", doctor_id=9001, write=True), ["replica", "default"])
+
+    def test_requests_that_change_data_use_the_primary(self):
+        self.assertEqual(self.request("post", doctor_id=9001), ["default"])
+
+    def test_doctor_reads_from_the_primary_after_writing(self):
+        self.request("post", doctor_id=9001, write=True)
+        self.assertEqual(self.request("get", doctor_id=9001), ["default"])
+        self.assertEqual(self.request("get", doctor_id=9002), ["replica"])
+        self.assertTrue(0 < REDIS_CONN.ttl(sticky_key(9001)) <= settings.DB_PRIMARY_STICKY_SECONDS)
+
+        REDIS_CONN.delete(sticky_key(9001))
+        self.assertEqual(self.request("get", doctor_id=9001), ["replica"])
+
+    def test_writes_outside_requests_can_stick_a_doctor_to_the_primary(self):
+        stick_to_primary(9001)
+        self.assertEqual(self.request("get", doctor_id=9001), ["default"])
+        with override_settings(DATABASE_REPLICAS=[]):
+            stick_to_primary(9002)
+        self.assertFalse(REDIS_CONN.exists(sticky_key(9002)))
+
+@override_settings(PROFILING_SAMPLE_RATE=0, PROFILING_HEADER_SECRET="profile-secret", PROFILING_TRACE_MS=None)
+class ProfilingMiddlewareTests(TestCase):
+    """
+    Server-Timing headers and profile log lines from ProfilingMiddleware.
+    """
+    def view(self, request):
+        list(PatientData.objects.all())
+        list(PatientData.objects.all())
+        # A client of the instrumented class on the same pool as REDIS_CONN
+        conn = ProfiledRedis(connection_pool=REDIS_CONN.connection_pool)
+        conn.get("profiling-test")
+        pipe = conn.pipeline(transaction=False)
+        pipe.get("profiling-test")
+        pipe.get("profiling-test")
+        pipe.execute()
+        record_timing("llm", 0.25)
+        return HttpResponse()
+
+    def test_requests_are_not_profiled_by_default(self):
+        response = ProfilingMiddleware(self.view)(RequestFactory().get("/"))
+        self.assertFalse(response.has_header("Server-Timing"))
+
+        response = ProfilingMiddleware(self.view)(RequestFactory().get("/", HTTP_X_PROFILE="wrong"))
+        self.assertFalse(response.has_header("Server-Timing"))
+
+    def test_requests_with_the_header_are_profiled(self):
+        headers = {"HTTP_X_PROFILE": "profile-secret",
+                   "HTTP_AUTHORIZATION": f"JWT {AccessToken.for_user(CustomUser(pk=9001))}"}
+        with self.assertLogs("api.profiling", "INFO") as logs:
+            response = ProfilingMiddleware(self.view)(RequestFactory().get("/patient", **headers))
+
+        timing = response["Server-Timing"]
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="2 queries"', timing)
+        self.assertIn('redis;dur=', timing)
+        self.assertIn('desc="2 calls", llm;dur=250.0;desc="1 calls"', timing)
+        self.assertIn("total;dur=", timing)
+
+        record = logs.records[0].profile
+        self.assertEqual((record["path"], record["status"], record["doctor_id"]), ("/patient", 200, "9001"))
+        self.assertEqual((record["db_queries"], record["redis_calls"], record["llm_calls"]), (2, 2, 1))
+        self.assertEqual(record["llm_ms"], 250.0)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled_requests_are_profiled(self):
+        response = ProfilingMiddleware(self.view)(RequestFactory().get("/"))
+        self.assertIn('desc="2 queries"', response["Server-Timing"])
+
+class ReadingPartitionTests(TestCase):
+    """
+    Monthly partitions of the readings table (api.partitions), created by
+    migration 0025 on Postgres.
+    """
+    def test_month_start(self):
+        self.assertEqual(month_start(date(2026, 10, 19)), date(2026, 10, 1))
+        self.assertEqual(month_start(date(2026, 10, 19), 3), date(2027, 1, 1))
+        self.assertEqual(month_start(date(2026, 1, 31), -13), date(2024, 12, 1))
+
+    @skipUnless(connection.vendor == "postgresql", "Partitioning is Postgres only")
+    def test_creates_the_coming_months(self):
+        next_month = month_start(django_timezone.now().date(), 1)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {partition_name(next_month)}")
+        self.assertEqual(create_partitions(), [next_month])
+        self.assertIn(next_month, month_partitions())
+
+    @skipUnless(connection.vendor == "postgresql", "Partitioning is Postgres only")
+    @override_settings(READING_RETENTION_MONTHS=12)
+    def test_expired_months_keep_readings_with_a_consultation(self):
+        old_month = month_start(django_timezone.now().date(), -24)
+        with connection.cursor() as cursor:
+            cursor.execute(create_partition_sql(old_month))
+        kept, expired = [
+            PatientDeviceData.objects.create(doctor_id="1", patient_mobile_number="9000000001",
+                                             device_serial_number="SN-1", **SENSOR_DATA)
+            for _ in range(2)
+        ]
+        PatientDeviceData.objects.filter(id__in=[kept.id, expired.id]).update(
+            created_at=datetime(old_month.year, old_month.month, 15, tzinfo=timezone.utc)
+        )
+        output = LLMOutput.objects.create(sensor_data=kept, patient_mobile_number="9000000001", file_urls={})
+
+        self.assertEqual(expire_partitions(), [old_month])
+        self.assertNotIn(old_month, month_partitions())
+        self.assertTrue(PatientDeviceData.objects.filter(id=kept.id).exists())
+        self.assertFalse(PatientDeviceData.objects.filter(id=expired.id).exists())
+        self.assertEqual(LLMOutput.objects.get(id=output.id).sensor_data.id, kept.id)
+
+def fake_bucket():
+    """
+    In-memory stand-in for the GCS bucket, objects are kept in bucket.objects.
+    """
+    bucket = mock.Mock(objects={}, signed=[])
+
+    def generate_signed_url(path, expiration):
+        bucket.signed.append(path)
+        return f"https://storage.googleapis.com/bucket/{path}?X-Goog-Expires={int(expiration.total_seconds())}"
+
+    bucket.blob.side_effect = lambda path: mock.Mock(
+        upload_from_string=lambda data, **kwargs: bucket.objects.__setitem__(path, data),
+        upload_from_file=lambda file_obj, **kwargs: bucket.objects.__setitem__(path, file_obj.read()),
+        download_as_bytes=lambda: bucket.objects[path],
+        delete=lambda: bucket.objects.pop(path),
+        generate_signed_url=lambda expiration: generate_signed_url(path, expiration),
+    )
+    return bucket
+
+class SignedURLTests(SimpleTestCase):
+    """
+    Uploads stored as object paths (api.gcs) and signed on demand.
+    """
+    def setUp(self):
+        cache.clear()
+        self.bucket = fake_bucket()
+        patcher = mock.patch("api.gcs.get_bucket", return_value=self.bucket)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_upload_returns_the_object_path(self):
+        file_obj = mock.Mock(content_type="image/png", read=lambda: b"png")
+        self.assertEqual(upload_file(file_obj, "uploads/scan.png"), "uploads/scan.png")
+        self.assertEqual(self.bucket.objects, {"uploads/scan.png": b"png"})
+
+    @override_settings(GS_SIGNED_URL_EXPIRY_HOURS=72, GS_SIGNED_URL_REFRESH_MARGIN_MINUTES=60)
+    def test_signed_urls_are_cached(self):
+        url = signed_url("uploads/scan.png")
+        self.assertEqual(url, f"https://storage.googleapis.com/bucket/uploads/scan.png?X-Goog-Expires={72 * 3600}")
+        self.assertEqual(signed_url("uploads/scan.png"), url)
+        self.assertEqual(self.bucket.signed, ["uploads/scan.png"])
+
+    @override_settings(GS_SIGNED_URL_EXPIRY_HOURS=1, GS_SIGNED_URL_REFRESH_MARGIN_MINUTES=60)
+    def test_urls_expiring_within_the_refresh_margin_are_not_cached(self):
+        signed_url("uploads/scan.png")
+        signed_url("uploads/scan.png")
+        self.assertEqual(self.bucket.signed, ["uploads/scan.png", "uploads/scan.png"])
+
+    def test_signed_urls_by_category(self):
+        urls = signed_urls({"images": "uploads/a.png", "pdfs": "uploads/b.pdf"})
+        self.assertEqual(set(urls), {"images", "pdfs"})
+        self.assertTrue(urls["pdfs"].startswith("https://storage.googleapis.com/bucket/uploads/b.pdf?"))
+        self.assertEqual(signed_urls(None), {})
+
+class FileURLMigrationTests(SimpleTestCase):
+    """
+    Migration 0018, signed URLs saved in LLMOutput.file_urls back to object paths.
+    """
+    signed_url_to_path = staticmethod(
+        import_module("api.migrations.0018_llmoutput_file_urls_to_paths").signed_url_to_path
+    )
+
+    def test_path_style_urls(self):
+        self.assertEqual(
+            self.signed_url_to_path("https://storage.googleapis.com/gloport/uploads/a%20b.png?X-Goog-Signature=abc"),
+            "uploads/a b.png",
+        )
+
+    def test_virtual_hosted_urls(self):
+        self.assertEqual(
+            self.signed_url_to_path("https://gloport.storage.googleapis.com/uploads/scan.png?X-Goog-Signature=abc"),
+            "uploads/scan.png",
+        )
+
+    def test_other_values_are_left_alone(self):
+        for value in ("uploads/scan.png", "https://example.com/scan.png", None, ["uploads/scan.png"]):
+            with self.subTest(value=value):
+                self.assertEqual(self.signed_url_to_path(value), value)
+
+@override_settings(LLM_OUTPUT_ARCHIVE_AFTER_DAYS=90)
+class ConsultationArchiveTests(TestCase):
+    """
+    Section texts of old consultations moved to the bucket (api.archive) and
+    read back by the endpoints.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = CustomUser.objects.create_user(
+            username="archive-doctor", email="archive-doctor@example.com", email_verified=True,
+            device_serial_numbers=["ARCHIVE-SN"],
+        )
+        PatientData.objects.create(name="Archived Patient", patient_mobile_number="9100000000", age=50, gender="Male")
+        cls.old, cls.recent = [
+            LLMOutput.objects.create(
+                sensor_data=PatientDeviceData.objects.create(
+                    doctor_id=str(cls.doctor.id), patient_mobile_number="9100000000",
+                    device_serial_number="ARCHIVE-SN", **SENSOR_DATA,
+                ),
+                patient_mobile_number="9100000000", symptoms="Cough", file_urls={},
+                **{f"output_text_{prompt_id}": f"Section {prompt_id}" for prompt_id in range(1, 12)},
+            )
+            for _ in range(2)
+        ]
+        LLMOutput.objects.filter(id=cls.old.id).update(created_at=django_timezone.now() - timedelta(days=120))
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch("api.archive.get_bucket", return_value=fake_bucket())
+        self.bucket = patcher.start()()
+        self.addCleanup(patcher.stop)
+
+    def test_old_consultations_are_archived_and_read_back(self):
+        self.assertEqual(archive_old_consultations(), 1)
+
+        old = LLMOutput.objects.get(id=self.old.id)
+        self.assertIsNotNone(old.archived_at)
+        self.assertEqual(list(self.bucket.objects), [old.archive_path])
+        self.assertIsNone(old.output_text_4)
+        self.assertEqual(old.symptoms, "Cough")
+        self.assertEqual(LLMOutput.objects.get(id=self.recent.id).output_text_4, "Section 4")
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"JWT {RefreshToken.for_user(self.doctor).access_token}")
+        response = client.get(f"/status/{old.id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["model_output"]["output_text_4"], "Section 4")
+
+        response = client.get("/patient/9100000000/timeline?fields=output_text_1")
+        self.assertEqual([entry["consultation"]["output_text_1"] for entry in response.data["results"]],
+                         ["Section 1", "Section 1"])
+
+    def test_consultations_changed_meanwhile_are_left_alone(self):
+        stale = LLMOutput.objects.get(id=self.old.id)
+        save_section(LLMOutput.objects.get(id=self.old.id), 4, "Reloaded")
+
+        self.assertFalse(archive_consultation(stale))
+        self.assertEqual(self.bucket.objects, {})
+        self.assertIsNone(LLMOutput.objects.get(id=self.old.id).archived_at)
+
+    def test_sections_saved_after_archiving_take_precedence(self):
+        archive_old_consultations()
+        save_section(LLMOutput.objects.get(id=self.old.id), 4, "Reloaded")
+
+        old = hydrate_consultation(LLMOutput.objects.get(id=self.old.id))
+        self.assertEqual(old.output_text_4, "Reloaded")
+        self.assertEqual(old.output_text_5, "Section 5")
+
+# Most a single request to each endpoint may cost: SQL queries (JWT user lookup
+# included), Redis round trips (a pipeline counts as one) and wall time in ms.
+# Lower a budget when an endpoint gets cheaper, never raise one to make a test pass
+# without understanding where the extra work comes from. Wall time depends on the
+# machine, it is only reported unless ENFORCE_MS_BUDGETS=1 is set (e.g. on a quiet
+# runner before a release).
+Budget = namedtuple("Budget", "queries redis ms")
+ENFORCE_MS_BUDGETS = os.environ.get("ENFORCE_MS_BUDGETS") == "1"
+
+ENDPOINT_BUDGETS = {
+    "GET /check": Budget(queries=1, redis=0, ms=200),
+    "POST /generate": Budget(queries=5, redis=3, ms=500),
+    "PUT /generate (cached)": Budget(queries=3, redis=1, ms=200),
+    "PUT /generate (reload)": Budget(queries=6, redis=3, ms=300),
+    "GET /patient": Budget(queries=3, redis=0, ms=300),
+    "GET /patient/<id>": Budget(queries=2, redis=0, ms=200),
+    "GET /patient/<id>/timeline": Budget(queries=2, redis=0, ms=200),
+    "GET /status/<id>": Budget(queries=5, redis=0, ms=300),
+    "GET /login": Budget(queries=2, redis=0, ms=200),
+    "POST /user": Budget(queries=2, redis=0, ms=300),
+    "PUT /user": Budget(queries=2, redis=0, ms=200),
+    "POST /doctor-remark": Budget(queries=3, redis=0, ms=200),
+    "POST /device-register": Budget(queries=2, redis=0, ms=300),
+    "POST /device-login": Budget(queries=1, redis=0, ms=300),
+    "GET /output/<id>": Budget(queries=3, redis=0, ms=200),
+    "GET /verify-email": Budget(queries=2, redis=0, ms=200),
+    "POST /resend-verification-email": Budget(queries=1, redis=0, ms=200),
+    "GET /admin-dashboard": Budget(queries=6, redis=0, ms=300),
+    "GET /doctor": Budget(queries=2, redis=0, ms=200),
+    "POST /request-otp": Budget(queries=1, redis=1, ms=200),
+    "POST /verify-otp": Budget(queries=1, redis=1, ms=200),
+    "GET /prompt-status": Budget(queries=1, redis=1, ms=200),
+    "GET /metrics": Budget(queries=1, redis=1, ms=200),
+    # One SCAN page plus a call per bucket still active from other requests
+    "GET /throttle-status": Budget(queries=1, redis=20, ms=300),
+}
+
+TEST_PASSWORD = "budget-test-password"
+
+# Large buckets so repeated runs against the same Redis are never throttled
+UNTHROTTLED = {
+    "generate": {"rate": 1000, "capacity": 1000},
+    "reload": {"rate": 1000, "capacity": 1000},
+}
+
+class RedisCallCounter:
+    count = 0
+
+@contextmanager
+def count_redis_calls():
+    """
+    Counts Redis round trips made through redis-py: commands, pipelines and pub/sub.
+    """
+    counter = RedisCallCounter()
+    command, pipeline_execute, pubsub_command = (
+        redis.Redis.execute_command, redis.client.Pipeline.execute, PubSub.execute_command
+    )
+
+    def counted(original):
+        def wrapper(*args, **kwargs):
+            counter.count += 1
+            return original(*args, **kwargs)
+        return wrapper
+
+    with mock.patch.object(redis.Redis, "execute_command", counted(command)), \
+            mock.patch.object(redis.client.Pipeline, "execute", counted(pipeline_execute)), \
+            mock.patch.object(PubSub, "execute_command", counted(pubsub_command)):
+        yield counter
+
+@override_settings(
+    LLM_THROTTLE_RATES=UNTHROTTLED,
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+)
+class EndpointBudgetTests(TestCase):
+    """
+    Every endpoint in api/urls.py against seeded data, within its ENDPOINT_BUDGETS
+    entry. LLM providers, GCS and the Celery broker are mocked out. /testemail is
+    left out, it is a manual check of the SMTP setup.
+    """
+    timings = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = CustomUser.objects.create_user(
+            username="budget-doctor", email="budget-doctor@example.com", password=TEST_PASSWORD,
+            full_name="Budget Doctor", email_verified=True, medication="Allopathy",
+            device_serial_numbers=["BUDGET-SN"],
+        )
+        cls.admin = CustomUser.objects.create_user(
+            username="budget-admin", email="budget-admin@example.com", password=TEST_PASSWORD,
+            email_verified=True, is_staff=True, role="admin", device_serial_numbers=["BUDGET-ADMIN-SN"],
+        )
+        cls.unverified = CustomUser.objects.create_user(
+            username="budget-unverified", email="budget-unverified@example.com", password=TEST_PASSWORD,
+        )
+
+        cls.patients = [
+            PatientData.objects.create(name=f"Patient {i}", patient_mobile_number=f"90000000{i:02d}", age=30 + i,
+                                       gender="Female")
+            for i in range(15)
+        ]
+        cls.readings = [
+            PatientDeviceData.objects.create(
+                doctor_id=str(cls.doctor.id), patient_mobile_number=patient.patient_mobile_number,
+                device_serial_number="BUDGET-SN", **SENSOR_DATA,
+            )
+            for patient in cls.patients for _ in range(2)
+        ]
+        cls.outputs = [
+            LLMOutput.objects.create(
+                sensor_data=reading, patient_mobile_number=reading.patient_mobile_number,
+                symptoms="Cough", history="Asthma", notes="Follow-up", medication_type="Allopathy",
+                doctor_remark="Good", file_urls={},
+                **{f"output_text_{prompt_id}": f"Section {prompt_id}" for prompt_id in range(1, 12)},
+            )
+            for reading in cls.readings[:20]
+        ]
+        cls.free_reading = cls.readings[-1]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Scripts are loaded once per Redis server, measure the steady state
+        for script in (TOKEN_BUCKET_SCRIPT, VERIFY_OTP_SCRIPT):
+            REDIS_CONN.script_load(script)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if cls.timings:
+            width = max(len(name) for name in cls.timings)
+            sys.stderr.write("\nEndpoint timings (ms):\n")
+            for name, elapsed_ms in sorted(cls.timings.items()):
+                over = "  over budget" if elapsed_ms > ENDPOINT_BUDGETS[name].ms else ""
+                sys.stderr.write(f"  {name:<{width}} {elapsed_ms:8.1f} / {ENDPOINT_BUDGETS[name].ms}{over}\n")
+
+    def client_for(self, user=None):
+        client = APIClient()
+        if user is not None:
+            client.credentials(HTTP_AUTHORIZATION=f"JWT {RefreshToken.for_user(user).access_token}")
+        return client
+
+    def assertWithinBudget(self, name, method, path, data=None, user=None, status_code=200):
+        budget = ENDPOINT_BUDGETS[name]
+        client = self.client_for(user)
+
+        with CaptureQueriesContext(connection) as queries, count_redis_calls() as redis_calls:
+            start = time.perf_counter()
+            response = getattr(client, method)(path, data, format="json")
+            elapsed_ms = (time.perf_counter() - start) * 1000
+        self.timings[name] = elapsed_ms
+
+        self.assertEqual(response.status_code, status_code, getattr(response, "data", response.content))
+        sql = "\n".join(query["sql"] for query in queries.captured_queries)
+        self.assertLessEqual(len(queries), budget.queries, f"{name} ran {len(queries)} queries:\n{sql}")
+        self.assertLessEqual(redis_calls.count, budget.redis, f"{name} made {redis_calls.count} Redis calls")
+        if ENFORCE_MS_BUDGETS:
+            self.assertLessEqual(elapsed_ms, budget.ms, f"{name} took {elapsed_ms:.0f}ms")
+        return response
+
+    def test_check(self):
+        self.assertWithinBudget("GET /check", "get", "/check", user=self.doctor)
+
+    @mock.patch("api.tasks.chord")
+    @mock.patch("api.views.upload_file")
+    @mock.patch("api.views.send_to_jivi", return_value="Generated section")
+    def test_generate(self, send_to_jivi, upload_file, chord):
+        patient = self.patients[-1]
+        self.assertWithinBudget("POST /generate", "post", "/generate", {
+            "id": self.free_reading.id,
+            "name": patient.name,
+            "phone": patient.patient_mobile_number,
+            "age": patient.age,
+            "gender": patient.gender,
+            "majorsymptoms": "Cough",
+            "medicalHistory": "Asthma",
+            "notes": "Follow-up",
+        }, user=self.doctor)
+
+    def test_reload_cached_section(self):
+        self.assertWithinBudget("PUT /generate (cached)", "put", "/generate", {
+            "output_id": self.outputs[0].id, "prompt_id": 2,
+        }, user=self.doctor)
+
+    @mock.patch("api.views.generate_section", return_value="Regenerated section")
+    def test_reload_section(self, generate_section):
+        self.assertWithinBudget("PUT /generate (reload)", "put", "/generate", {
+            "output_id": self.outputs[0].id, "prompt_id": 2, "reload": True,
+        }, user=self.doctor)
+
+    def test_patient_list(self):
+        self.assertWithinBudget("GET /patient", "get", "/patient", {"page": 1}, user=self.doctor)
+
+    def test_single_patient(self):
+        self.assertWithinBudget("GET /patient/<id>", "get", f"/patient/{self.patients[0].patient_mobile_number}",
+                                user=self.doctor)
+
+    def test_patient_timeline(self):
+        response = self.assertWithinBudget(
+            "GET /patient/<id>/timeline", "get", f"/patient/{self.patients[0].patient_mobile_number}/timeline",
+            user=self.doctor,
+        )
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_status(self):
+        self.assertWithinBudget("GET /status/<id>", "get", f"/status/{self.outputs[0].id}", user=self.doctor)
+
+    def test_login_stats(self):
+        self.assertWithinBudget("GET /login", "get", "/login")
+
+    def test_register(self):
+        self.assertWithinBudget("POST /user", "post", "/user", {
+            "full_name": "New Doctor",
+            "username": "budget-new-doctor",
+            "email": "budget-new-doctor@example.com",
+            "password": TEST_PASSWORD,
+            "medication": "Allopathy",
+        }, status_code=201)
+
+    def test_update_user(self):
+        self.assertWithinBudget("PUT /user", "put", "/user", {"full_name": "Renamed Doctor"}, user=self.doctor)
+
+    def test_doctor_remark(self):
+        self.assertWithinBudget("POST /doctor-remark", "post", "/doctor-remark", {
+            "output_id": self.outputs[0].id, "remark": "Excellent", "comment": "Accurate",
+        }, user=self.doctor)
+
+    def test_device_register(self):
+        self.assertWithinBudget("POST /device-register", "post", "/device-register", {
+            "username": self.doctor.username, "password": TEST_PASSWORD, "device_serial_number": "BUDGET-SN-2",
+        })
+
+    def test_device_login(self):
+        self.assertWithinBudget("POST /device-login", "post", "/device-login", {
+            "username": self.doctor.username, "password": TEST_PASSWORD,
+        })
+
+    def test_output_check(self):
+        self.assertWithinBudget("GET /output/<id>", "get", f"/output/{self.outputs[0].sensor_data_id}",
+                                user=self.doctor)
+
+    def test_verify_email(self):
+        uid = urlsafe_base64_encode(force_bytes(self.unverified.pk))
+        token = default_token_generator.make_token(self.unverified)
+        self.assertWithinBudget("GET /verify-email", "get", f"/verify-email/{uid}/{token}")
+
+    def test_resend_verification_email(self):
+        self.assertWithinBudget("POST /resend-verification-email", "post", "/resend-verification-email",
+                                user=self.unverified)
+
+    def test_admin_dashboard(self):
+        self.assertWithinBudget("GET /admin-dashboard", "get", "/admin-dashboard", {"filter": "last_week"},
+                                user=self.admin)
+
+    def test_doctor_list(self):
+        self.assertWithinBudget("GET /doctor", "get", "/doctor", user=self.admin)
+
+    def test_request_otp(self):
+        self.assertWithinBudget("POST /request-otp", "post", "/request-otp", {"email": self.doctor.email})
+
+    def test_verify_otp(self):
+        otp = issue_otp(self.doctor.email)
+        self.assertWithinBudget("POST /verify-otp", "post", "/verify-otp", {"email": self.doctor.email, "otp": otp})
+
+    def test_prompt_status(self):
+        self.assertWithinBudget("GET /prompt-status", "get", "/prompt-status",
+                                {"output_id": self.outputs[0].id, "prompt_id": 2}, user=self.doctor)
+
+    def test_metrics(self):
+        self.assertWithinBudget("GET /metrics", "get", "/metrics", user=self.admin)
+
+    def test_throttle_status(self):
+        self.assertWithinBudget("GET /throttle-status", "get", "/throttle-status", user=self.admin)
+
+def create_doctor(username, **fields):
+    return CustomUser.objects.create_user(
+        username=username, email=f"{username}@example.com", password=TEST_PASSWORD, email_verified=True,
+        **{"medication": "Allopathy", "device_serial_numbers": [f"{username}-SN"], **fields},
+    )
+
+def create_consultation(doctor, phone, **fields):
+    """
+    A patient, a reading from the doctor's device and an LLMOutput with every
+    section done.
+    """
+    PatientData.objects.get_or_create(patient_mobile_number=phone,
+                                      defaults={"name": "Patient", "age": 40, "gender": "Female"})
+    reading = PatientDeviceData.objects.create(doctor_id=str(doctor.id), patient_mobile_number=phone,
+                                               device_serial_number=doctor.device_serial_numbers[0], **SENSOR_DATA)
+    return LLMOutput.objects.create(**{
+        "sensor_data": reading, "patient_mobile_number": phone, "symptoms": "Cough", "history": "Asthma",
+        "notes": "Follow-up", "medication_type": "Allopathy", "file_urls": {},
+        **{f"output_text_{prompt_id}": f"Section {prompt_id}" for prompt_id in range(1, 12)},
+        **fields,
+    })
+
+def jwt_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"JWT {RefreshToken.for_user(user).access_token}")
+    return client
+
+@contextmanager
+def fake_provider(*replies):
+    """
+    Local OpenAI-compatible provider behind GPT_URL. /chat/completions answers
+    with `replies` in turn, (status, delay in seconds) pairs, the last one
+    repeating. A 200 says "Reply <n>" for the n-th call. Yields the statuses
+    sent so far.
+    """
+    calls = []
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with lock:
+                status_code, delay = replies[min(len(calls), len(replies) - 1)]
+                calls.append(status_code)
+                number = len(calls)
+            time.sleep(delay)
+            if status_code == 200:
+                body = {"id": f"chatcmpl-{number}", "object": "chat.completion", "created": 0, "model": "fake-model",
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": f"Reply {number}"}}]}
+            else:
+                body = {"error": {"message": "Fake provider error", "type": "server_error"}}
+            data = json.dumps(body).encode()
+            try:
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The client gave up on this call, e.g. a cancelled hedged attempt
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    openai_client.cache_clear()
+    async_openai_client.cache_clear()
+    try:
+        with override_settings(GPT_URL=f"http://127.0.0.1:{server.server_port}/v1"):
+            yield calls
+    finally:
+        server.shutdown()
+        server.server_close()
+        openai_client.cache_clear()
+        async_openai_client.cache_clear()
+
+# Fast retries, no hedging and a breaker opening after 3 failures, for tests against fake_provider
+RESILIENCE_SETTINGS = dict(
+    LLM_TIMEOUT=10, LLM_SECTION_TIMEOUTS={}, LLM_MAX_RETRIES=2, LLM_RETRY_BACKOFF=0, LLM_RETRY_BACKOFF_MAX=0,
+    LLM_HEDGE_AFTER=None, LLM_BREAKER_FAILURE_THRESHOLD=3, LLM_BREAKER_RESET_TIMEOUT=30,
+    LLM_THROTTLE_RATES=UNTHROTTLED,
+)
+
+@override_settings(**RESILIENCE_SETTINGS)
+class ProviderResilienceTests(TestCase):
+    """
+    Retries, the circuit breaker and hedging (api.resilience) against a local
+    fake provider.
+    """
+    def setUp(self):
+        patcher = mock.patch.dict(resilience._breakers, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self):
+        return send_to_jivi("System", "Prompt", prompt_id=4)
+
+    def test_retryable_errors_are_retried(self):
+        with fake_provider((503, 0), (503, 0), (200, 0)) as calls:
+            self.assertEqual(self.send(), "Reply 3")
+        self.assertEqual(calls, [503, 503, 200])
+
+    def test_retries_give_up_after_max_retries(self):
+        with fake_provider((503, 0)) as calls, self.assertRaises(RuntimeError):
+            self.send()
+        self.assertEqual(len(calls), 3)
+
+    def test_rejected_requests_are_not_retried(self):
+        with fake_provider((400, 0)) as calls, self.assertRaises(RuntimeError):
+            self.send()
+        self.assertEqual(calls, [400])
+        self.assertEqual(resilience.get_breaker("openai").failures, 0)
+
+    def test_open_breaker_fails_fast(self):
+        with fake_provider((503, 0)) as calls:
+            with self.assertRaises(RuntimeError):
+                self.send()
+            with self.assertRaises(ProviderUnavailableError) as raised:
+                self.send()
+        self.assertEqual(len(calls), 3)
+        self.assertTrue(29 < raised.exception.retry_after <= 30)
+
+    def test_breaker_states(self):
+        breaker = resilience.CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        # Half-open: one probe, which fails and opens it again
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        # A successful probe closes it
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.retry_after(), 0)
+
+    @override_settings(LLM_HEDGE_AFTER=0.2)
+    def test_slow_attempts_are_hedged(self):
+        with fake_provider((200, 1.5), (200, 0)) as calls:
+            started = time.monotonic()
+            self.assertEqual(self.send(), "Reply 2")
+            self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(calls, [200, 200])
+
+    @override_settings(LLM_HEDGE_AFTER=0.2)
+    def test_losing_attempt_is_cancelled(self):
+        async def running_attempts():
+            await asyncio.sleep(0.05)
+            return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+        with fake_provider((200, 1.5), (200, 0)):
+            self.assertEqual(self.send(), "Reply 2")
+            loop = resilience._get_hedge_loop()
+            self.assertEqual(asyncio.run_coroutine_threadsafe(running_attempts(), loop).result(), [])
+
+    def test_hedge_loop_is_started_once_per_process(self):
+        barrier = threading.Barrier(8)
+        loops = []
+
+        def get():
+            barrier.wait()
+            loops.append(resilience._get_hedge_loop())
+
+        with mock.patch.object(resilience, "_hedge_loop", None), mock.patch.object(resilience, "_hedge_loop_pid", None):
+            threads = [threading.Thread(target=get) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(set(map(id, loops))), 1)
+            self.assertTrue(loops[0].is_running())
+
+            # A forked child starts its own
+            with mock.patch("api.resilience.os.getpid", return_value=-1):
+                self.assertIsNot(resilience._get_hedge_loop(), loops[0])
+
+    def test_async_calls_are_retried(self):
+        async def send():
+            try:
+                return await asend_to_jivi("System", "Prompt", prompt_id=4)
+            finally:
+                await async_openai_client().close()  # Before its event loop is closed
+
+        with fake_provider((503, 0), (200, 0)) as calls:
+            self.assertEqual(async_to_sync(send)(), "Reply 2")
+        self.assertEqual(calls, [503, 200])
+
+    def test_open_breaker_is_answered_with_503(self):
+        doctor = create_doctor("breaker-doctor")
+        output = create_consultation(doctor, "9300000000", output_text_4=None)
+        breaker = resilience.get_breaker("openai")
+        for _ in range(settings.LLM_BREAKER_FAILURE_THRESHOLD):
+            breaker.record_failure()
+
+        response = jwt_client(doctor).put("/generate", {"output_id": output.id, "prompt_id": 4}, format="json")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "30")
+
+    def test_reload_calls_the_provider_again(self):
+        doctor = create_doctor("reload-doctor")
+        output = create_consultation(doctor, "9300000001", output_text_4=None)
+        client = jwt_client(doctor)
+        with fake_provider((200, 0)) as calls:
+            texts = [client.put("/generate", {"output_id": output.id, "prompt_id": 4, "reload": True},
+                                format="json").data["updatedText"] for _ in range(2)]
+        self.assertEqual(texts, ["Reply 1", "Reply 2"])
+        self.assertEqual(calls, [200, 200])
+
+class SingleFlightTests(SimpleTestCase):
+    """
+    api.coalesce.single_flight against Redis, callers in threads.
+    """
+    def setUp(self):
+        self.key = f"test:flight:{uuid.uuid4().hex}"
+
+    def run_in_thread(self, fn, **kwargs):
+        """
+        Starts a single_flight caller in a thread, returns a dict that gets its
+        "result" or "error".
+        """
+        outcome = {}
+
+        def call():
+            try:
+                outcome["result"] = single_flight(REDIS_CONN, self.key, fn, **kwargs)
+            except Exception as e:
+                outcome["error"] = e
+
+        thread = threading.Thread(target=call)
+        thread.start()
+        self.addCleanup(thread.join)
+        outcome["thread"] = thread
+        return outcome
+
+    def wait_for_subscriber(self):
+        deadline = time.monotonic() + 5
+        while dict(REDIS_CONN.pubsub_numsub(f"{self.key}:done")).get(f"{self.key}:done".encode(), 0) < 1:
+            self.assertLess(time.monotonic(), deadline, "The waiter never subscribed")
+            time.sleep(0.01)
+
+    def test_float_lock_ttl(self):
+        ttls = []
+        fn = lambda: ttls.append(REDIS_CONN.ttl(f"{self.key}:lock")) or "done"
+        self.assertEqual(single_flight(REDIS_CONN, self.key, fn, lock_ttl=30.5), "done")
+        self.assertEqual(ttls, [31])
+        self.assertFalse(REDIS_CONN.exists(f"{self.key}:lock"))
+
+    def test_waiters_get_the_leaders_result(self):
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {"text": "Generated"}
+
+        leader = self.run_in_thread(fn)
+        self.assertTrue(started.wait(5))
+        waiter = self.run_in_thread(fn)
+        self.wait_for_subscriber()
+        release.set()
+        leader["thread"].join(5)
+        waiter["thread"].join(5)
+
+        self.assertEqual(leader["result"], {"text": "Generated"})
+        self.assertEqual(waiter["result"], {"text": "Generated"})
+        self.assertEqual(calls, [1])
+
+    def test_leader_errors_reach_waiters(self):
+        started, release = threading.Event(), threading.Event()
+
+        def fn():
+            started.set()
+            release.wait(5)
+            raise ValueError("Provider failed")
+
+        leader = self.run_in_thread(fn)
+        self.assertTrue(started.wait(5))
+        waiter = self.run_in_thread(fn)
+        self.wait_for_subscriber()
+        release.set()
+        leader["thread"].join(5)
+        waiter["thread"].join(5)
+
+        self.assertIsInstance(leader["error"], ValueError)
+        self.assertIsInstance(waiter["error"], RuntimeError)
+        self.assertEqual(str(waiter["error"]), "Provider failed")
+        # Errors are not cached, the next caller tries again
+        self.assertEqual(single_flight(REDIS_CONN, self.key, lambda: "Retried"), "Retried")
+
+    def test_finished_result_is_not_reused_on_request(self):
+        self.assertEqual(single_flight(REDIS_CONN, self.key, lambda: "First"), "First")
+        self.assertEqual(single_flight(REDIS_CONN, self.key, lambda: "Cached"), "First")
+        self.assertEqual(single_flight(REDIS_CONN, self.key, lambda: "Fresh", reuse_result=False), "Fresh")
+
+    def test_lock_of_a_dead_leader_is_taken_over(self):
+        REDIS_CONN.set(f"{self.key}:lock", "dead-leader", ex=1)
+        started = time.monotonic()
+        self.assertEqual(single_flight(REDIS_CONN, self.key, lambda: "Taken over", wait_timeout=10), "Taken over")
+        self.assertLess(time.monotonic() - started, 5)
+
+class IdempotencyTests(SimpleTestCase):
+    """
+    api.idempotency.idempotent: replaying successful responses for retries
+    with the same Idempotency-Key.
+    """
+    def setUp(self):
+        self.key = uuid.uuid4().hex
+        self.user = mock.Mock(pk=1)
+        self.calls = []
+
+    def request(self, data):
+        request = Request(APIRequestFactory().post("/generate", data, format="json", HTTP_IDEMPOTENCY_KEY=self.key),
+                          parsers=[JSONParser()])
+        request.user = self.user
+        return request
+
+    def handler(self, status_code):
+        def handle():
+            self.calls.append(status_code)
+            return Response({"calls": len(self.calls)}, status=status_code)
+        return handle
+
+    def test_retry_gets_the_stored_response(self):
+        first = idempotent(self.request({"id": 1}), self.handler(200))
+        retry = idempotent(self.request({"id": 1}), self.handler(200))
+        self.assertEqual((retry.status_code, retry.data), (first.status_code, first.data))
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(self.calls, [200])
+
+    def test_key_reused_for_a_different_request(self):
+        idempotent(self.request({"id": 1}), self.handler(200))
+        response = idempotent(self.request({"id": 2}), self.handler(200))
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.calls, [200])
+
+    def test_unsuccessful_responses_are_not_stored(self):
+        self.assertEqual(idempotent(self.request({"id": 1}), self.handler(400)).status_code, 400)
+        self.assertEqual(idempotent(self.request({"id": 1}), self.handler(200)).status_code, 200)
+        self.assertEqual(self.calls, [400, 200])
+
+class LLMMetricsTests(TestCase):
+    """
+    LLM call metrics (api.metrics): the daily aggregates and the Prometheus
+    samples rendered for /metrics.
+    """
+    def setUp(self):
+        patcher = mock.patch("api.metrics.METRICS_KEY", f"test:metrics:{uuid.uuid4().hex}")
+        self.metrics_key = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: REDIS_CONN.delete(self.metrics_key))
+
+    def test_daily_aggregates_are_upserted(self):
+        record_llm_call("openai", "gpt", 4, 7, "ok", 0.5, prompt_tokens=100, completion_tokens=20, cached_tokens=64)
+        record_llm_call("openai", "gpt", 4, 7, "ok", 1.5, prompt_tokens=50, completion_tokens=10)
+        record_llm_call("openai", "gpt", 4, 7, "timeout", 45)
+
+        ok = LLMCallDailyStat.objects.get(outcome="ok")
+        self.assertEqual((ok.calls, ok.total_latency_ms, ok.max_latency_ms), (2, 2000, 1500))
+        self.assertEqual((ok.prompt_tokens, ok.completion_tokens, ok.cached_tokens), (150, 30, 64))
+        self.assertEqual((ok.prompt_id, ok.doctor_id, ok.date), (4, "7", django_timezone.localdate()))
+        self.assertEqual(LLMCallDailyStat.objects.get(outcome="timeout").calls, 1)
+
+    def test_daily_aggregate_created_concurrently(self):
+        record_llm_call("openai", "gpt", 4, 7, "ok", 1)
+        update = QuerySet.update
+        missed = []
+
+        def update_after_a_miss(queryset, **kwargs):
+            # Another process creates today's row between our update and create
+            if not missed:
+                missed.append(1)
+                return 0
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, "update", update_after_a_miss):
+            record_llm_call("openai", "gpt", 4, 7, "ok", 1)
+        self.assertEqual(LLMCallDailyStat.objects.get().calls, 2)
+
+    def test_prometheus_rendering(self):
+        record_llm_call("openai", "gpt", 4, 7, "ok", 0.5, prompt_tokens=100)
+        record_llm_call("openai", "gpt", 4, 7, "ok", 3)
+        with mock.patch("api.metrics._record_daily"):
+            record_llm_call("grok", 'model "x"', 10, 7, "error", 1)
+        lines = render_prometheus().splitlines()
+
+        self.assertIn("# TYPE llm_request_duration_seconds histogram", lines)
+        self.assertIn("# TYPE llm_requests_total counter", lines)
+        labels = 'provider="openai",model="gpt",prompt_id="4",outcome="ok"'
+        self.assertIn(f'llm_request_duration_seconds_bucket{{{labels},le="0.5"}} 1', lines)
+        self.assertIn(f'llm_request_duration_seconds_bucket{{{labels},le="2"}} 1', lines)
+        self.assertIn(f'llm_request_duration_seconds_bucket{{{labels},le="5"}} 2', lines)
+        self.assertIn(f'llm_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', lines)
+        self.assertIn(f"llm_request_duration_seconds_sum{{{labels}}} 3.5", lines)
+        self.assertIn(f"llm_request_duration_seconds_count{{{labels}}} 2", lines)
+        self.assertIn('llm_prompt_tokens_total{provider="openai",model="gpt",prompt_id="4",doctor_id="7"} 100', lines)
+        self.assertIn('llm_requests_total{provider="grok",model="model \\"x\\"",prompt_id="10",doctor_id="7",'
+                      'outcome="error"} 1', lines)
+
+        # Buckets of a series in increasing order of le, not as strings ("10" < "2")
+        bounds = [line.split('le="')[1].split('"')[0] for line in lines
+                  if line.startswith(f"llm_request_duration_seconds_bucket{{{labels}")]
+        self.assertEqual(bounds, [str(bucket) for bucket in LATENCY_BUCKETS] + ["+Inf"])
+
+@override_settings(LLM_GENERATION_MODE="combined", LLM_THROTTLE_RATES=UNTHROTTLED)
+class CombinedGenerationTests(TestCase):
+    """
+    All text sections from one JSON-schema constrained call (combined mode),
+    and the per-section fallback for whatever it misses.
+    """
+    def test_response_schema(self):
+        self.assertEqual(combined_response_schema([1, 8]), {
+            "type": "object",
+            "properties": {"section_1": {"type": "string"}, "section_8": {"type": "string"}},
+            "required": ["section_1", "section_8"],
+            "additionalProperties": False,
+        })
+
+    @mock.patch("api.tasks.send_to_jivi_json")
+    def test_medication_section_needs_a_medication_type(self, send_to_jivi_json):
+        send_to_jivi_json.return_value = {}
+        with self.assertLogs("api.tasks", "WARNING"):
+            generate_combined_sections("System", "Base", None, 7)
+        schema = send_to_jivi_json.call_args.args[2]
+        self.assertEqual(schema["required"], [section_key(prompt_id) for prompt_id in COMBINED_SECTION_IDS
+                                              if prompt_id != 8])
+
+    @mock.patch("api.tasks.send_to_jivi_json")
+    def test_missing_and_empty_sections_are_left_out(self, send_to_jivi_json):
+        send_to_jivi_json.return_value = {"section_1": "  Summary \n", "section_2": " ", "section_3": 42}
+        with self.assertLogs("api.tasks", "WARNING") as logs:
+            self.assertEqual(generate_combined_sections("System", "Base", "Allopathy", 7), {1: "Summary"})
+        self.assertEqual(len(logs.records), len(COMBINED_SECTION_IDS) - 1)
+
+    @override_settings(LLM_MAX_RETRIES=0)
+    def test_failed_calls_fall_back_to_per_section_calls(self):
+        # The fake provider's reply is not JSON
+        with fake_provider((200, 0)), self.assertLogs("api.tasks", "WARNING"):
+            self.assertEqual(generate_combined_sections("System", "Base", "Allopathy", 7), {})
+        with fake_provider((400, 0)), self.assertLogs("api.tasks", "WARNING"):
+            self.assertEqual(generate_combined_sections("System", "Base", "Allopathy", 7), {})
+
+    @mock.patch("api.views.dispatch_sections")
+    @mock.patch("api.views.send_to_jivi", return_value="Table")
+    @mock.patch("api.tasks.send_to_jivi_json")
+    def test_generate_fills_in_missing_sections(self, send_to_jivi_json, send_to_jivi, dispatch_sections):
+        send_to_jivi_json.return_value = {section_key(prompt_id): f"Combined {prompt_id}"
+                                          for prompt_id in COMBINED_SECTION_IDS if prompt_id not in (5, 11)}
+        doctor = create_doctor("combined-doctor")
+        reading = PatientDeviceData.objects.create(doctor_id=str(doctor.id), patient_mobile_number="9400000000",
+                                                   device_serial_number="combined-doctor-SN", **SENSOR_DATA)
+
+        with self.assertLogs("api.tasks", "WARNING"):
+            response = jwt_client(doctor).post("/generate", {
+                "id": reading.id, "name": "Patient", "phone": "9400000000", "age": 40, "gender": "Female",
+                "majorsymptoms": "Cough", "medicalHistory": "Asthma", "notes": "Follow-up",
+            }, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+
+        self.assertEqual([call.kwargs["prompt_id"] for call in send_to_jivi.call_args_list], [11])
+        output = LLMOutput.objects.get(id=response.data["model_output_id"])
+        self.assertEqual((output.output_text_1, output.output_text_5, output.output_text_11), ("Combined 1", None, "Table"))
+        dispatch_sections.assert_called_once_with(output.id, pending_ids=[5, 10], done_ids=[2, 3, 4, 6, 7, 8, 9])
+
+class ProviderRateLimitTests(TestCase):
+    """
+    The Redis token bucket limiting provider calls, and how section tasks wait
+    for it on their queues.
+    """
+    def setUp(self):
+        REDIS_CONN.delete("ratelimit:test", "ratelimit:provider:openai")
+
+    def test_bucket_drains_and_refills(self):
+        bucket = TokenBucket("test", rate=20, capacity=2)
+        self.assertEqual([bucket.consume()[0] for _ in range(2)], [True, True])
+        allowed, retry_after = bucket.consume()
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 1 / 20, delta=0.01)
+
+        time.sleep(retry_after + 0.01)
+        self.assertTrue(bucket.consume()[0])
+        self.assertLessEqual(REDIS_CONN.ttl("ratelimit:test"), 2)
+
+    def test_rate_and_capacity_must_be_positive(self):
+        for rate, capacity in ((0, 5), (-1, 5), (1, 0)):
+            with self.assertRaises(ImproperlyConfigured):
+                TokenBucket("test", rate, capacity)
+
+    def test_sections_are_routed_by_provider(self):
+        name = "api.tasks.generate_prompt_in_background"
+        self.assertEqual(route_task(name, (1, 3), {}, {}), {"queue": LLM_TEXT_QUEUE})
+        self.assertEqual(route_task(name, (1, 10), {}, {}), {"queue": LLM_VISION_QUEUE})
+        self.assertEqual(route_task(name, (), {"output_id": 1, "prompt_id": 10}, {}), {"queue": LLM_VISION_QUEUE})
+        self.assertIsNone(route_task("api.tasks.deliver_queued_emails", (), {}, {}))
+
+    @override_settings(LLM_PROVIDER_RATE_LIMITS={"openai": {"rate": 0.01, "capacity": 1}})
+    @mock.patch("api.tasks.send_to_jivi", return_value="Summary")
+    def test_throttled_section_is_retried(self, send_to_jivi):
+        output = create_consultation(create_doctor("throttled-doctor"), "9500000000", output_text_1=None)
+        self.assertTrue(provider_bucket("openai").consume()[0])
+
+        with mock.patch.object(generate_prompt_in_background, "retry", side_effect=Retry()) as retry:
+            with self.assertRaises(Retry):
+                generate_prompt_in_background(output.id, 1)
+        self.assertGreater(retry.call_args.kwargs["countdown"], 90)
+        self.assertEqual(REDIS_CONN.get(redis_key(output.id, 1)), b"pending")
+        send_to_jivi.assert_not_called()
+
+    @override_settings(LLM_PROVIDER_RATE_LIMITS={"openai": {"rate": 0.01, "capacity": 1}})
+    def test_sections_without_a_provider_call_take_no_token(self):
+        output = create_consultation(create_doctor("tokenless-doctor"), "9500000001", medication_type=None,
+                                     output_text_8=None, output_text_10=None)
+        for prompt_id in (8, 10):
+            generate_prompt_in_background(output.id, prompt_id)
+            self.assertEqual(REDIS_CONN.get(redis_key(output.id, prompt_id)), b"done")
+        self.assertEqual(provider_bucket("openai").level(), 1)
+        output.refresh_from_db()
+        self.assertEqual(output.output_text_10, "No files were uploaded")
+
+@override_settings(EMAIL_RETRY_DELAY=30, EMAIL_MAX_ATTEMPTS=3)
+@mock.patch.object(deliver_queued_emails, "delay")
+@mock.patch.object(deliver_queued_emails, "apply_async")
+class EmailOutboxTests(TestCase):
+    """
+    Emails queued in Redis for the housekeeping workers, and their retries.
+    """
+    def setUp(self):
+        REDIS_CONN.delete(EMAIL_OUTBOX_KEY, EMAIL_RETRY_KEY)
+        self.doctor = create_doctor("outbox-doctor")
+
+    def queue_otp(self, otp=482913):
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_email("otp", self.doctor.id, otp=otp)
+
+    def deliver_at(self, offset):
+        with mock.patch("api.tasks.time.time", return_value=time.time() + offset):
+            deliver_queued_emails()
+
+    def test_otp_is_queued_encrypted(self, apply_async, delay):
+        self.queue_otp()
+        delay.assert_called_once_with()
+        [raw] = REDIS_CONN.lrange(EMAIL_OUTBOX_KEY, 0, -1)
+        self.assertNotIn(b"482913", raw)
+        self.assertIn("482913", build_email(json.loads(raw)).body)
+
+        deliver_queued_emails()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.doctor.email])
+        self.assertIn("482913", mail.outbox[0].body)
+        self.assertEqual(REDIS_CONN.llen(EMAIL_OUTBOX_KEY), 0)
+
+    @mock.patch("api.tasks.send_email")
+    def test_failed_email_waits_for_its_backoff(self, send_email, apply_async, delay):
+        send_email.side_effect = smtplib.SMTPException("Unavailable")
+        self.queue_otp()
+        with self.assertLogs("api.tasks", "WARNING"):
+            deliver_queued_emails()
+        apply_async.assert_called_once_with(countdown=30)
+        self.assertEqual(REDIS_CONN.llen(EMAIL_OUTBOX_KEY), 0)
+        [(raw, due)] = REDIS_CONN.zrange(EMAIL_RETRY_KEY, 0, -1, withscores=True)
+        self.assertAlmostEqual(due, time.time() + 30, delta=5)
+        self.assertEqual(json.loads(raw)["attempts"], 1)
+
+        # Other emails are sent meanwhile, the failed one stays parked
+        send_email.side_effect = None
+        deliver_queued_emails()
+        self.assertEqual(send_email.call_count, 1)
+
+        self.deliver_at(31)
+        self.assertEqual(send_email.call_count, 2)
+        self.assertEqual(REDIS_CONN.zcard(EMAIL_RETRY_KEY), 0)
+        self.assertEqual(REDIS_CONN.llen(EMAIL_OUTBOX_KEY), 0)
+
+    @mock.patch("api.tasks.send_email", side_effect=smtplib.SMTPException("Unavailable"))
+    def test_gives_up_after_max_attempts(self, send_email, apply_async, delay):
+        self.queue_otp()
+        with self.assertLogs("api.tasks", "WARNING"):
+            deliver_queued_emails()
+            self.deliver_at(31)
+        self.assertEqual(apply_async.call_args.kwargs, {"countdown": 60})
+
+        with self.assertLogs("api.tasks", "ERROR") as logs:
+            self.deliver_at(31 + 61)
+        self.assertIn("Giving up on otp email", logs.output[0])
+        self.assertEqual(send_email.call_count, 3)
+        self.assertEqual(REDIS_CONN.zcard(EMAIL_RETRY_KEY), 0)
+        self.assertEqual(REDIS_CONN.llen(EMAIL_OUTBOX_KEY), 0)
+
+@override_settings(OTP_MAX_ATTEMPTS=5, OTP_LOCKOUT_MINUTES=30)
+class OTPTests(TestCase):
+    """
+    Login OTPs in Redis: one use per code, and a lockout after too many wrong
+    codes that re-issuing doesn't lift.
+    """
+    email = "otp-doctor@example.com"
+
+    def setUp(self):
+        REDIS_CONN.delete(otp_key(self.email), attempts_key(self.email))
+
+    def wrong_code(self, otp):
+        return 100000 if otp != 100000 else 100001
+
+    def test_code_is_used_once(self):
+        self.assertEqual(verify_otp(self.email, 123456), OTP_MISSING)
+        otp = issue_otp(self.email)
+        self.assertEqual(len(str(otp)), settings.OTP_LENGTH)
+        self.assertEqual(verify_otp(self.email.upper(), otp), OTP_VALID)
+        self.assertEqual(verify_otp(self.email, otp), OTP_MISSING)
+
+    def test_right_code_resets_the_failures(self):
+        otp = issue_otp(self.email)
+        for _ in range(4):
+            self.assertEqual(verify_otp(self.email, self.wrong_code(otp)), OTP_INVALID)
+        self.assertEqual(verify_otp(self.email, otp), OTP_VALID)
+        self.assertFalse(REDIS_CONN.exists(attempts_key(self.email)))
+
+    def test_lockout_outlives_the_code(self):
+        otp = issue_otp(self.email)
+        results = [verify_otp(self.email, self.wrong_code(otp)) for _ in range(5)]
+        self.assertEqual(results, [OTP_INVALID] * 4 + [OTP_LOCKED])
+        self.assertFalse(REDIS_CONN.exists(otp_key(self.email)))
+        self.assertAlmostEqual(REDIS_CONN.ttl(attempts_key(self.email)), 30 * 60, delta=5)
+
+        otp = issue_otp(self.email)
+        self.assertEqual(verify_otp(self.email, otp), OTP_LOCKED)
+        self.assertFalse(REDIS_CONN.exists(otp_key(self.email)))
+
+        # Once the failures expire, a new code works again
+        REDIS_CONN.expire(attempts_key(self.email), 1)
+        time.sleep(1.1)
+        self.assertEqual(verify_otp(self.email, issue_otp(self.email)), OTP_VALID)
+
+    @mock.patch.object(deliver_queued_emails, "delay")
+    def test_requesting_a_new_code_keeps_the_lockout(self, delay):
+        create_doctor("otp-doctor")
+        client = APIClient()
+        for _ in range(2):
+            self.assertEqual(client.post("/request-otp", {"email": self.email}, format="json").status_code, 200)
+            otp = int(REDIS_CONN.get(otp_key(self.email)))
+            statuses = [client.post("/verify-otp", {"email": self.email, "otp": self.wrong_code(otp)},
+                                    format="json").status_code for _ in range(5)]
+        self.assertEqual(statuses, [429] * 5)
+
+        self.assertEqual(client.post("/request-otp", {"email": self.email}, format="json").status_code, 200)
+        otp = int(REDIS_CONN.get(otp_key(self.email)))
+        response = client.post("/verify-otp", {"email": self.email, "otp": otp}, format="json")
+        self.assertEqual(response.status_code, 429)
+        self.assertNotIn("access", response.data)
+
+@override_settings(LLM_THROTTLE_RATES={"generate": {"rate": 0.01, "capacity": 2},
+                                       "reload": {"rate": 0.01, "capacity": 2}})
+class GenerationThrottleTests(TestCase):
+    """
+    The doctor and device buckets of LLMGenerationThrottle, and reading their
+    levels for /throttle-status.
+    """
+    def setUp(self):
+        REDIS_CONN.delete(*REDIS_CONN.keys("ratelimit:throttle:*"), "ratelimit:test")
+
+    def allow_generate(self, doctor, reading):
+        request = Request(APIRequestFactory().post("/generate", {"id": reading.id}, format="json"),
+                          parsers=[JSONParser()])
+        request.user = doctor
+        throttle = LLMGenerationThrottle()
+        return throttle.allow_request(request, None), throttle.wait()
+
+    def allow_reload(self, doctor, output, **data):
+        request = Request(APIRequestFactory().put("/generate", {"output_id": output.id, "prompt_id": 4, **data},
+                                                  format="json"), parsers=[JSONParser()])
+        request.user = doctor
+        return LLMGenerationThrottle().allow_request(request, None)
+
+    def reload_tokens(self, doctor):
+        return throttle_bucket("reload", "doctor", doctor.pk).level(), throttle_bucket(
+            "reload", "device", doctor.device_serial_numbers[0]).level()
+
+    def test_reload_takes_tokens_only_when_generating(self):
+        doctor = create_doctor("reload-throttle")
+        output = create_consultation(doctor, "9600000001")
+
+        # Answered with the stored text
+        self.assertTrue(self.allow_reload(doctor, output))
+        self.assertEqual(self.reload_tokens(doctor), (2, 2))
+
+        self.assertTrue(self.allow_reload(doctor, output, reload=True))
+        self.assertAlmostEqual(self.reload_tokens(doctor)[1], 1, delta=0.01)
+
+        # Polling a section the background task is still generating
+        LLMOutput.objects.filter(id=output.id).update(output_text_4=None)
+        REDIS_CONN.set(redis_key(output.id, 4), "pending", ex=60)
+        self.addCleanup(REDIS_CONN.delete, redis_key(output.id, 4))
+        self.assertTrue(self.allow_reload(doctor, output))
+        self.assertAlmostEqual(self.reload_tokens(doctor)[1], 1, delta=0.01)
+
+        REDIS_CONN.delete(redis_key(output.id, 4))
+        self.assertTrue(self.allow_reload(doctor, output))
+        self.assertAlmostEqual(self.reload_tokens(doctor)[1], 0, delta=0.01)
+
+    def test_reload_of_another_device_takes_no_token(self):
+        owner, other = create_doctor("reload-owner"), create_doctor("reload-other")
+        output = create_consultation(owner, "9600000002")
+
+        for _ in range(3):
+            self.assertTrue(self.allow_reload(other, output, reload=True))
+        self.assertEqual(self.reload_tokens(owner), (2, 2))
+        self.assertEqual(throttle_bucket("reload", "doctor", other.pk).level(), 2)
+
+    def test_denied_request_takes_no_token(self):
+        doctors = [create_doctor(f"shared-device-{n}", device_serial_numbers=["SHARED-SN"]) for n in range(2)]
+        readings = [PatientDeviceData.objects.create(doctor_id=str(doctor.id), patient_mobile_number="9600000000",
+                                                     device_serial_number="SHARED-SN", **SENSOR_DATA)
+                    for doctor in doctors]
+
+        self.assertEqual(self.allow_generate(doctors[0], readings[0]), (True, None))
+        self.assertEqual(self.allow_generate(doctors[0], readings[0]), (True, None))
+        allowed, wait = self.allow_generate(doctors[1], readings[1])
+        self.assertFalse(allowed)
+        self.assertGreaterEqual(wait, 99)
+
+        # The device ran out, the second doctor's own bucket is untouched
+        self.assertEqual(throttle_bucket("generate", "doctor", doctors[1].pk).level(), 2)
+        self.assertEqual({(level["kind"], level["id"]): level["tokens"] for level in throttle_levels()}, {
+            ("doctor", str(doctors[0].pk)): 0, ("device", "SHARED-SN"): 0,
+        })
+
+    def test_buckets_are_taken_from_together(self):
+        small, large = TokenBucket("test", 0.01, 1), TokenBucket("throttle:test", 0.01, 5)
+        self.assertEqual(consume_all([small, large]), (True, 0))
+        allowed, wait = consume_all([small, large])
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 100, delta=1)
+        self.assertAlmostEqual(large.level(), 4, delta=0.01)
+
+    def test_level_is_read_only(self):
+        bucket = TokenBucket("test", 0.01, 5)
+        self.assertEqual(bucket.level(), 5)
+        self.assertFalse(REDIS_CONN.exists("ratelimit:test"))
+
+        bucket.consume()
+        REDIS_CONN.expire("ratelimit:test", 50)
+        stored = REDIS_CONN.hgetall("ratelimit:test")
+        self.assertAlmostEqual(bucket.level(), 4, delta=0.01)
+        self.assertEqual(REDIS_CONN.hgetall("ratelimit:test"), stored)
+        self.assertLessEqual(REDIS_CONN.ttl("ratelimit:test"), 50)
+
+class FinalizeConsultationTests(TestCase):
+    """
+    The chord callback recording how long a consultation took to generate.
+    """
+    def setUp(self):
+        self.completed = []
+        consultation_completed.connect(self.record_completed)
+        self.addCleanup(consultation_completed.disconnect, self.record_completed)
+
+    def record_completed(self, sender, **kwargs):
+        self.completed.append(kwargs)
+
+    def test_records_generation_time_and_notifies(self):
+        output = create_consultation(create_doctor("finalize-doctor"), "9700000000")
+        LLMOutput.objects.filter(id=output.id).update(created_at=django_timezone.now() - timedelta(seconds=42))
+
+        with self.assertLogs("api.tasks", "INFO"):
+            finalize_consultation([None] * 9, output.id)
+        output.refresh_from_db()
+        self.assertAlmostEqual(output.generation_seconds, 42, delta=2)
+        self.assertAlmostEqual(output.generation_completed_at, django_timezone.now(), delta=timedelta(seconds=2))
+        self.assertEqual(self.completed, [{"signal": consultation_completed, "output_id": output.id,
+                                           "generation_seconds": output.generation_seconds}])
+
+    def test_deleted_consultation_is_skipped(self):
+        finalize_consultation([], 987654)
+        self.assertEqual(self.completed, [])
+
+    @mock.patch("api.tasks.chord")
+    @mock.patch.object(finalize_consultation, "delay")
+    def test_runs_after_every_pending_section(self, delay, chord):
+        dispatch_sections(7, pending_ids=[], done_ids=[2, 3])
+        delay.assert_called_once_with([], 7)
+        chord.assert_not_called()
+
+        dispatch_sections(7, pending_ids=[2, 3], done_ids=[])
+        chord.return_value.assert_called_once_with(finalize_consultation.s(7))
+        self.assertEqual(REDIS_CONN.get(redis_key(7, 3)), b"pending")
+
+@override_settings(**RESILIENCE_SETTINGS)
+class AsyncViewTests(TestCase):
+    """
+    The async views (api/async_views.py), called directly: the URLconf picks
+    them or the sync views once, at import time, from ASYNC_VIEWS.
+    """
+    def setUp(self):
+        patcher = mock.patch.dict(resilience._breakers, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.doctor = create_doctor("async-doctor")
+        self.output = create_consultation(self.doctor, "9800000000", output_text_4=None)
+        self.reading = PatientDeviceData.objects.create(doctor_id=str(self.doctor.id),
+                                                        patient_mobile_number="9800000000",
+                                                        device_serial_number="async-doctor-SN", **SENSOR_DATA)
+        self.authorization = f"JWT {RefreshToken.for_user(self.doctor).access_token}"
+
+    def request(self, method, path, data=None):
+        return getattr(APIRequestFactory(), method)(path, data, format="json", HTTP_AUTHORIZATION=self.authorization)
+
+    async def test_status_matches_the_sync_view(self):
+        path = f"/status/{self.output.id}"
+        response = await AsyncStatusView.as_view()(self.request("get", path), id=self.output.id)
+        self.assertEqual(response.status_code, 200)
+        expected = await sync_to_async(jwt_client(self.doctor).get)(path)
+        self.assertEqual(response.data, expected.data)
+
+    async def test_status_of_another_device_or_missing_output(self):
+        other = await sync_to_async(create_consultation)(await sync_to_async(create_doctor)("async-other"),
+                                                         "9800000001")
+        response = await AsyncStatusView.as_view()(self.request("get", f"/status/{other.id}"), id=other.id)
+        self.assertEqual(response.status_code, 403)
+        response = await AsyncStatusView.as_view()(self.request("get", "/status/987654"), id=987654)
+        self.assertEqual(response.status_code, 404)
+
+    @mock.patch("api.async_views.dispatch_sections")
+    async def test_generate_requests_both_sections(self, dispatch_sections):
+        with fake_provider((200, 0)) as calls:
+            response = await AsyncGenerateJiviResponse.as_view()(self.request("post", "/generate", {
+                "id": self.reading.id, "name": "Patient", "phone": "9800000000", "age": 40, "gender": "Female",
+                "majorsymptoms": "Cough", "medicalHistory": "Asthma", "notes": "Follow-up",
+            }))
+            await async_openai_client().close()  # Before the test's event loop is closed
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(calls, [200, 200])
+
+        output = await LLMOutput.objects.aget(id=response.data["model_output_id"])
+        self.assertEqual({output.output_text_1, output.output_text_11}, {"Reply 1", "Reply 2"})
+        self.assertEqual(output.output_text_10, "No files were uploaded")
+        dispatch_sections.assert_called_once_with(output.id, pending_ids=PROMPT_IDS, done_ids=[])
+
+    # The section is generated off the test's thread, outside its transaction
+    @mock.patch("api.generate_jivi.record_llm_call")
+    async def test_open_breaker_is_answered_with_503(self, record_llm_call):
+        breaker = resilience.get_breaker("openai")
+        for _ in range(settings.LLM_BREAKER_FAILURE_THRESHOLD):
+            breaker.record_failure()
+
+        response = await AsyncGenerateJiviResponse.as_view()(
+            self.request("put", "/generate", {"output_id": self.output.id, "prompt_id": 4}))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "30")
+
+    @mock.patch("api.async_views.generate_section", side_effect=ValueError("Broken prompt"))
+    async def test_section_errors_are_logged(self, generate_section):
+        with self.assertLogs("api.async_views", "ERROR") as logs:
+            response = await AsyncGenerateJiviResponse.as_view()(
+                self.request("put", "/generate", {"output_id": self.output.id, "prompt_id": 4}))
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("Broken prompt", logs.output[0])
+
+    @mock.patch("api.async_views.save_section")
+    @mock.patch("api.async_views.generate_section", side_effect=lambda *args, **kwargs: time.sleep(0.5) or "Reloaded")
+    async def test_reloads_run_concurrently(self, generate_section, save_section):
+        started = time.monotonic()
+        responses = await asyncio.gather(*(
+            AsyncGenerateJiviResponse.as_view()(
+                self.request("put", "/generate", {"output_id": self.output.id, "prompt_id": 4, "reload": True}))
+            for _ in range(2)
+        ))
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertLess(time.monotonic() - started, 0.9)
+        self.assertEqual(save_section.call_count, 2)
+
+    def test_async_client_is_built_once_per_event_loop(self):
+        async def client():
+            return async_openai_client(), async_openai_client()
+
+        with self.settings(GPT_KEY="key"):
+            first, again = async_to_sync(client)()
+            second, _ = asyncio.run(client())
+        self.assertIs(first, again)
+        self.assertIsNot(first, second)
+        async_openai_client.cache_clear()
+
+class ValuesSerializerTests(TestCase):
+    """
+    PATIENT_LIST_SERIALIZER must render .values() rows to exactly the bytes of
+    PatientDeviceDataSerializer(rows, many=True).
+    """
+    @classmethod
+    def setUpTestData(cls):
+        readings = [
+            PatientDeviceData.objects.create(doctor_id="1", patient_mobile_number="9900000000",
+                                             device_serial_number="VALUES-SN", **SENSOR_DATA),
+            # Null decimals, and values stored with fewer or more places than the field has
+            PatientDeviceData.objects.create(doctor_id="1", patient_mobile_number="9900000001",
+                                             device_serial_number="VALUES-SN", co=None, co2=Decimal("7"),
+                                             o2=Decimal("20.9"), spo2=Decimal("99.995"), formaldehyde=Decimal("0.1")),
+        ]
+        created = [datetime(2024, 3, 31, 23, 59, 59, 999999, tzinfo=timezone.utc),
+                   datetime(2024, 6, 1, 4, 0, tzinfo=timezone(timedelta(hours=-7)))]
+        for reading, created_at in zip(readings, created):
+            PatientDeviceData.objects.filter(id=reading.id).update(created_at=created_at)
+
+    def rows(self):
+        return list(PatientDeviceData.objects.annotate(
+            patient_name=Value("Zoë"), patient_age=Value(None, output_field=IntegerField()),
+            model_generated=Value(True, output_field=BooleanField()),
+            model_output_id=Value(None, output_field=IntegerField()),
+        ).order_by("id").values())
+
+    def assertSerializesIdentically(self, rows):
+        expected = JSONRenderer().render(PatientDeviceDataSerializer(rows, many=True).data)
+        self.assertEqual(JSONRenderer().render(PATIENT_LIST_SERIALIZER.to_representation(rows)), expected)
+
+    def test_matches_the_model_serializer(self):
+        rows = self.rows()
+        self.assertIsNone(rows[1]["co"])
+        self.assertSerializesIdentically(rows)
+
+    @override_settings(TIME_ZONE="Asia/Kolkata")
+    def test_datetimes_are_shifted_like_the_model_serializer(self):
+        self.assertSerializesIdentically(self.rows())
+        self.assertEqual(PATIENT_LIST_SERIALIZER.to_representation(self.rows())[0]["created_at"],
+                         "2024-04-01T05:29:59.999999+05:30")
+
+    def test_rows_without_the_annotations(self):
+        # The serializer leaves out its read-only fields missing from the rows
+        rows = list(PatientDeviceData.objects.order_by("id").values())
+        self.assertSerializesIdentically(rows)
+        self.assertNotIn("patient_name", PATIENT_LIST_SERIALIZER.to_representation(rows)[0])
+        self.assertEqual(PATIENT_LIST_SERIALIZER.to_representation([]), [])
+
+class PatientTimelineTests(TestCase):
+    """
+    /patient/<id>/timeline: one entry per reading with its latest consultation,
+    paged by cursor.
+    """
+    phone = "9910000000"
+
+    def setUp(self):
+        self.doctor = create_doctor("timeline-doctor")
+        self.client = jwt_client(self.doctor)
+
+    def add_reading(self, created_at):
+        reading = PatientDeviceData.objects.create(doctor_id=str(self.doctor.id), patient_mobile_number=self.phone,
+                                                   device_serial_number="timeline-doctor-SN", **SENSOR_DATA)
+        PatientDeviceData.objects.filter(id=reading.id).update(created_at=created_at)
+        return reading
+
+    def add_output(self, reading, symptoms, created_at):
+        output = LLMOutput.objects.create(sensor_data=reading, patient_mobile_number=self.phone, symptoms=symptoms,
+                                          file_urls={})
+        LLMOutput.objects.filter(id=output.id).update(created_at=created_at)
+        return output
+
+    def test_reading_with_two_consultations_is_one_entry(self):
+        created = datetime(2024, 5, 1, 9, tzinfo=timezone.utc)
+        reading = self.add_reading(created)
+        self.add_output(reading, "Cough", created + timedelta(minutes=5))
+        latest = self.add_output(reading, "Fever", created + timedelta(minutes=30))
+        unconsulted = self.add_reading(created + timedelta(hours=1))
+
+        response = self.client.get(f"/patient/{self.phone}/timeline")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry["id"] for entry in response.data["results"]], [unconsulted.id, reading.id])
+        self.assertIsNone(response.data["results"][0]["consultation"])
+        consultation = response.data["results"][1]["consultation"]
+        self.assertEqual((consultation["id"], consultation["symptoms"]), (latest.id, "Fever"))
+
+    def test_cursor_walks_every_reading_once(self):
+        created = datetime(2024, 5, 1, 9, tzinfo=timezone.utc)
+        # The last four share a timestamp, their ids break the tie
+        readings = [self.add_reading(created + timedelta(minutes=min(n, 3))) for n in range(7)]
+        for reading in readings[::2]:
+            self.add_output(reading, "Cough", created)
+            self.add_output(reading, "Fever", created + timedelta(hours=1))
+
+        ids, pages = [], 0
+        url = f"/patient/{self.phone}/timeline?page_size=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            ids += [entry["id"] for entry in response.data["results"]]
+            url, pages = response.data["next"], pages + 1
+
+        expected = sorted(readings, key=lambda reading: (min(readings.index(reading), 3), reading.id), reverse=True)
+        self.assertEqual(ids, [reading.id for reading in expected])
+        self.assertEqual(pages, 4)
+
+class TriageTests(TestCase):
+    """
+    Readings scored against the seeded SensorReferenceRange rows, in Python
+    (pre_save) and in SQL (bulk scoring), and PatientView's filters on the score.
+    """
+    def setUp(self):
+        # Distinct weights so severity tells which values were out of range
+        SensorReferenceRange.objects.filter(sensor="heart_rate").update(weight=3)
+        clear_reference_ranges()
+        self.addCleanup(clear_reference_ranges)
+
+    def test_python_and_sql_scores_agree(self):
+        normal = {**SENSOR_DATA, "hydrogen": "0"}
+        # On and just past each bound, and a missing value
+        values = [
+            {}, {"co": "10.00"}, {"co": "10.01"}, {"o2": "13.00"}, {"o2": "12.99"}, {"o2": "18.00"}, {"o2": "18.01"},
+            {"spo2": "85.00"}, {"spo2": "84.99"}, {"spo2": "100.00"}, {"heart_rate": "60.00"},
+            {"heart_rate": "59.99"}, {"heart_rate": "100.00"}, {"heart_rate": "100.01"}, {"rq": "0.70"},
+            {"rq": "0.69"}, {"rq": "1.00"}, {"rq": "1.01"}, {"formaldehyde": "16.000"}, {"formaldehyde": "16.001"},
+            {"co2": None, "o2": None}, {"co": "11.00", "heart_rate": "120.00", "nh3": "2.01"},
+        ]
+        # bulk_create skips pre_save, the readings are left unscored
+        PatientDeviceData.objects.bulk_create([
+            PatientDeviceData(doctor_id="1", patient_mobile_number="9920000000", device_serial_number="TRIAGE-SN",
+                              **{**normal, **changes})
+            for changes in values
+        ])
+        readings = list(PatientDeviceData.objects.filter(device_serial_number="TRIAGE-SN").order_by("id"))
+        self.assertTrue(all(reading.abnormal_flags is None for reading in readings))
+        expected = [reading_score(reading) for reading in readings]
+
+        score_readings(PatientDeviceData.objects.filter(device_serial_number="TRIAGE-SN"))
+        scored = list(PatientDeviceData.objects.filter(device_serial_number="TRIAGE-SN").order_by("id")
+                      .values_list("abnormal_flags", "severity"))
+        self.assertEqual(scored, expected)
+        self.assertEqual([severity for _, severity in expected],
+                         [0, 0, 1, 0, 1, 0, 1, 0, 1, 0, 0, 3, 0, 3, 0, 1, 0, 1, 0, 1, 0, 5])
+
+    def test_patient_list_filters_and_sorts_by_severity(self):
+        doctor = create_doctor("triage-doctor")
+        created = datetime(2024, 5, 1, 9, tzinfo=timezone.utc)
+        # (patient, changes to a normal reading, minutes after `created`), the list shows each patient's latest
+        for phone, changes, minutes in [
+            ("9920000001", {}, 10),
+            ("9920000001", {"co": "20.00"}, 0),
+            ("9920000002", {"co": "20.00"}, 20),
+            ("9920000003", {"heart_rate": "130.00", "co": "20.00"}, 5),
+        ]:
+            reading = PatientDeviceData.objects.create(doctor_id=str(doctor.id), patient_mobile_number=phone,
+                                                       device_serial_number="triage-doctor-SN",
+                                                       **{**SENSOR_DATA, **changes})
+            PatientDeviceData.objects.filter(id=reading.id).update(created_at=created + timedelta(minutes=minutes))
+
+        client = jwt_client(doctor)
+
+        def patients(query):
+            response = client.get(f"/patient?{query}")
+            self.assertEqual(response.status_code, 200, response.data)
+            return [(row["patient_mobile_number"], row["severity"]) for row in response.data["results"]]
+
+        self.assertEqual(patients(""), [("9920000002", 1), ("9920000001", 0), ("9920000003", 4)])
+        self.assertEqual(patients("abnormal=true"), [("9920000002", 1), ("9920000003", 4)])
+        self.assertEqual(patients("min_severity=2"), [("9920000003", 4)])
+        self.assertEqual(patients("sort=severity"), [("9920000003", 4), ("9920000002", 1), ("9920000001", 0)])
+        self.assertEqual(client.get("/patient?min_severity=high").status_code, 400)
+
+    def test_rescore_reads_the_ranges_from_the_database(self):
+        reading = PatientDeviceData.objects.create(doctor_id="1", patient_mobile_number="9920000004",
+                                                   device_serial_number="TRIAGE-SN", **SENSOR_DATA)
+        self.assertEqual(reading.severity, 0)
+        reference_ranges()  # Cached before the change, as in a worker that did not save it
+        SensorReferenceRange.objects.filter(sensor="co").update(high=Decimal("3"))
+
+        rescore_readings()
+        reading.refresh_from_db()
+        self.assertEqual((reading.abnormal_flags, reading.severity), (1, 1))
+
+    @mock.patch.object(rescore_readings, "apply_async")
+    def test_range_change_rescores_once_caches_expire(self, apply_async):
+        with self.captureOnCommitCallbacks(execute=True):
+            reference = SensorReferenceRange.objects.get(sensor="co")
+            reference.high = Decimal("3")
+            reference.save()
+        apply_async.assert_called_once_with(countdown=settings.REFERENCE_RANGES_CACHE_TTL)
+        self.assertEqual(next(row["high"] for row in reference_ranges() if row["sensor"] == "co"), 3)
+
+    def test_base_prompt_lists_the_reference_ranges(self):
+        reference = SensorReferenceRange.objects.get(sensor="heart_rate")
+        reference.high = Decimal("110")
+        reference.save()
+        patient = PatientData.objects.create(name="Patient", patient_mobile_number="9920000005", age=40,
+                                             gender="Female")
+        reading = PatientDeviceData.objects.create(doctor_id="1", patient_mobile_number="9920000005",
+                                                   device_serial_number="TRIAGE-SN", **SENSOR_DATA)
+
+        base = consultation_base_prompt(patient, reading, "Cough", "Asthma", "Follow-up")
+        self.assertIn("Normal Range:\n● Carbon Monoxide (CO): 0 to 10 ppm\n"
+                      "● Carbon Dioxide (CO2): 20,000 to 50,000 ppm\n", base)
+        self.assertIn("● Blood Oxygen Saturation (SpO2): 85 % or more\n● Heart Rate: 60 to 110 bpm\n", base)
+
+@mock.patch("api.tasks.chord")
+class SectionPriorityTests(SimpleTestCase):
+    """
+    Broker priorities of the background sections, from SECTION_PRIORITY_ORDER.
+    """
+    def header(self, chord):
+        return [(signature.args[1], signature.options["priority"]) for signature in chord.call_args.args[0]]
+
+    @override_settings(SECTION_PRIORITY_ORDER=[4, 6, 2, 5, 7, 3, 8, 9, 10])
+    def test_priority_follows_the_order(self, chord):
+        self.assertEqual([section_priority(prompt_id) for prompt_id in (4, 6, 2, 9, 10)], [0, 1, 2, 7, 8])
+
+    @override_settings(SECTION_PRIORITY_ORDER=[4, 6, 2, 5, 7, 3, 8, 9, 10, 11, 1])
+    def test_missing_and_late_sections_go_last(self, chord):
+        self.assertEqual([section_priority(prompt_id) for prompt_id in (11, 1, 12)], [9, 9, 9])
+
+    @override_settings(SECTION_PRIORITY_ORDER=[])
+    def test_empty_order_queues_sections_alike(self, chord):
+        self.assertIsNone(section_priority(4))
+        dispatch_sections(7, pending_ids=[10, 2, 4])
+        self.assertEqual(self.header(chord), [(10, None), (2, None), (4, None)])
+
+    @override_settings(SECTION_PRIORITY_ORDER=[4, 6, 2, 5, 7, 3, 8, 9, 10])
+    def test_chord_sends_sections_in_priority_order(self, chord):
+        dispatch_sections(7, pending_ids=[2, 3, 4, 10, 6], done_ids=[5])
+        self.assertEqual(self.header(chord), [(4, 0), (6, 1), (2, 2), (3, 5), (10, 8)])
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class SectionReadYourWritesTests(TestCase):
+    """
+    A section saved by a Celery task must be visible to the doctor's next
+    reads, even with replicas lagging behind.
+    """
+    @mock.patch("api.tasks.send_to_jivi", return_value="Summary")
+    def test_finished_section_keeps_the_doctor_on_the_primary(self, send_to_jivi):
+        doctor = create_doctor("sticky-doctor")
+        output = create_consultation(doctor, "9500000002", output_text_2=None)
+        REDIS_CONN.delete(sticky_key(doctor.id))
+
+        generate_prompt_in_background(output.id, 2)
+        self.assertEqual(REDIS_CONN.get(redis_key(output.id, 2)), b"done")
+        self.assertTrue(0 < REDIS_CONN.ttl(sticky_key(doctor.id)) <= settings.DB_PRIMARY_STICKY_SECONDS)
+
+        # The doctor's status request is then answered from the primary
+        reads = []
+
+        def view(request):
+            reads.append(ReplicaRouter().db_for_read(LLMOutput))
+            return HttpResponse()
+
+        authorization = f"JWT {AccessToken.for_user(doctor)}"
+        ReplicaRoutingMiddleware(view)(RequestFactory().get(f"/status/{output.id}", HTTP_AUTHORIZATION=authorization))
+        self.assertEqual(reads, ["default"])
@@ -0,0 +1,112 @@
+import math
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from .idempotency import has_stored_response
+from .models import LLMOutput, PatientDeviceData
+from .ratelimit import TokenBucket, consume_all
+from .redis_client import REDIS_CONN
+from .tasks import SECTION_PROMPT_IDS, redis_key
+
+THROTTLE_KEY_PREFIX = "throttle"
+
+def throttle_bucket(scope, kind, identifier):
+    """
+    Bucket for one doctor (kind="doctor") or one device serial (kind="device")
+    on the "generate" or "reload" scope.
+    """
+    limits = settings.LLM_THROTTLE_RATES[scope]
+    return TokenBucket(f"{THROTTLE_KEY_PREFIX}:{scope}:{kind}:{identifier}", limits["rate"], limits["capacity"])
+
+def throttle_levels():
+    """
+    Current tokens left in every active throttle bucket, for ops.
+    """
+    levels = []
+    for key in REDIS_CONN.scan_iter(match=f"ratelimit:{THROTTLE_KEY_PREFIX}:*", count=500):
+        _, _, scope, kind, identifier = key.decode().split(":", 4)
+        if scope not in settings.LLM_THROTTLE_RATES:
+            continue
+        bucket = throttle_bucket(scope, kind, identifier)
+        levels.append({
+            "scope": scope,
+            "kind": kind,
+            "id": identifier,
+            "tokens": round(bucket.level(), 2),
+            "capacity": bucket.capacity,
+        })
+    return sorted(levels, key=lambda level: (level["scope"], level["kind"], level["id"]))
+
+class LLMGenerationThrottle(BaseThrottle):
+    """
+    Token-bucket throttle for endpoints that trigger LLM generation. Every request
+    takes a token from the doctor's bucket and from the device's bucket, a denied
+    request takes none from either. POST
+    (new consultation) and PUT (section reload) use separate buckets. A PUT only
+    takes tokens when it generates: with reload set, or for an empty section,
+    and not while the section is pending in the background.
+    """
+    scopes = {"POST": "generate", "PUT": "reload"}
+
+    def __init__(self):
+        self.retry_after = None
+
+    def get_device_serial(self, request):
+        return PatientDeviceData.objects.filter(
+            id=request.data.get("id"),
+            device_serial_number__in=request.user.device_serial_numbers or [],
+        ).values_list("device_serial_number", flat=True).first()
+
+    def get_reload_device_serial(self, request):
+        """
+        Device serial of the section a PUT generates, None when it will not be
+        generated: an invalid prompt_id, a consultation of another device, a
+        stored text that is not being reloaded, or a section still pending.
+        """
+        output_id, prompt_id = request.data.get("output_id"), int(request.data.get("prompt_id"))
+        if prompt_id not in SECTION_PROMPT_IDS:
+            return None
+        section = LLMOutput.objects.filter(
+            id=output_id,
+            sensor_data__device_serial_number__in=request.user.device_serial_numbers or [],
+        ).values_list("sensor_data__device_serial_number", f"output_text_{prompt_id}").first()
+        if section is None:
+            return None
+        device_serial, text = section
+        if not request.data.get("reload", False) and text is not None and str(text).strip() != "":
+            return None
+        if REDIS_CONN.get(redis_key(output_id, prompt_id)) in (b"pending", b"processing"):
+            return None  # Answered with a 202 until the background task finishes
+        return device_serial
+
+    def allow_request(self, request, view):
+        scope = self.scopes.get(request.method)
+        if scope is None or not request.user.is_authenticated:
+            return True
+        if scope == "generate" and has_stored_response(request):
+            return True  # A retry, answered from the stored response without generating anything
+
+        buckets = [throttle_bucket(scope, "doctor", request.user.pk)]
+        try:
+            if scope == "reload":
+                device_serial = self.get_reload_device_serial(request)
+                if device_serial is None:
+                    return True  # Answered without generating anything, or rejected by the view
+            else:
+                device_serial = self.get_device_serial(request)
+        except (ValueError, TypeError):
+            device_serial = None  # Malformed ids, the view rejects the request
+        if device_serial:
+            buckets.append(throttle_bucket(scope, "device", device_serial))
+
+        allowed, retry_after = consume_all(buckets)
+        if not allowed:
+            self.retry_after = retry_after
+        return allowed
+
+    def wait(self):
+        # Retry-After is sent in whole seconds
+        if self.retry_after is None:
+            return None
+        return max(1, math.ceil(self.retry_after))
@@ -0,0 +1,84 @@
+"""
+Abnormality scoring of sensor readings against SensorReferenceRange, so
+critical patients can be found with an indexed query instead of an LLM call.
+
+Each value outside its range sets the range's bit in
+PatientDeviceData.abnormal_flags and adds its weight to `severity`. Readings
+saved through the ORM are scored in pre_save (api.signals). Readings the
+devices insert directly, or bulk_create, are left with null abnormal_flags
+(and severity 0) and scored in bulk by api.tasks.score_unscored_readings: one
+UPDATE per batch, computed by the database.
+
+The ranges are cached per process for REFERENCE_RANGES_CACHE_TTL seconds. A
+change is seen at once by the process that saved it and by every other within
+the TTL, after which api.tasks.rescore_readings scores all readings again.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import SensorReferenceRange
+
+REFERENCE_RANGES_CACHE_KEY = "triage:reference_ranges"
+
+def load_reference_ranges():
+    """
+    The SensorReferenceRange rows from the database, in bit order.
+    """
+    return list(SensorReferenceRange.objects.order_by("bit").values(
+        "sensor", "label", "unit", "low", "high", "bit", "weight"
+    ))
+
+def reference_ranges():
+    ranges = cache.get(REFERENCE_RANGES_CACHE_KEY)
+    if ranges is None:
+        ranges = load_reference_ranges()
+        cache.set(REFERENCE_RANGES_CACHE_KEY, ranges, timeout=settings.REFERENCE_RANGES_CACHE_TTL)
+    return ranges
+
+def clear_reference_ranges():
+    cache.delete(REFERENCE_RANGES_CACHE_KEY)
+
+def reading_score(reading):
+    """
+    (abnormal_flags, severity) of an unsaved or saved reading.
+    """
+    flags = severity = 0
+    for reference in reference_ranges():
+        value = getattr(reading, reference["sensor"])
+        if value is None:
+            continue
+        value = Decimal(str(value))
+        low, high = reference["low"], reference["high"]
+        if (low is not None and value < low) or (high is not None and value > high):
+            flags |= 1 << reference["bit"]
+            severity += reference["weight"]
+    return flags, severity
+
+def score_expressions(ranges):
+    """
+    abnormal_flags and severity as SQL expressions, for queryset.update().
+    """
+    flags, severity = Value(0), Value(0)
+    for reference in ranges:
+        out_of_range = Q()
+        if reference["low"] is not None:
+            out_of_range |= Q(**{f"{reference['sensor']}__lt": reference["low"]})
+        if reference["high"] is not None:
+            out_of_range |= Q(**{f"{reference['sensor']}__gt": reference["high"]})
+        if not out_of_range:
+            continue
+        flags += Case(When(out_of_range, then=Value(1 << reference["bit"])), default=Value(0),
+                      output_field=IntegerField())
+        severity += Case(When(out_of_range, then=Value(reference["weight"])), default=Value(0),
+                         output_field=IntegerField())
+    return {"abnormal_flags": flags, "severity": severity}
+
+def score_readings(queryset, ranges=None):
+    """
+    Scores the readings in one UPDATE, against `ranges` (from
+    load_reference_ranges) or the cached ranges.
+    """
+    return queryset.update(**score_expressions(reference_ranges() if ranges is None else ranges))
@@ -1,15 +1,25 @@
+from django.conf import settings
 from django.urls import path
 from .views import (GenerateJiviResponse, PatientView, StatusView,
                     SinglePatientView, LoginView, UserRegistrationUpdateAPIView, 
                     Check, DoctorRemark, RegisterDeviceView, LLMOutputCheck, DeviceLoginView,
                     TestEmail, VerifyEmailView, ResendVerificationEmailView, AdminDashboard,
-                    DoctorView, RequestOTPView, VerifyOTPView, PromptStatusView)
+                    DoctorView, RequestOTPView, VerifyOTPView, PromptStatusView, MetricsView,
+                    ThrottleStatusView, PatientTimelineView)
+
+if settings.ASYNC_VIEWS:
+    # I/O-bound endpoints as async views, only worth it under ASGI (gloport_backend/gunicorn_asgi.py)
+    from .async_views import (AsyncGenerateJiviResponse as GenerateJiviResponse,
+                              AsyncLLMOutputCheck as LLMOutputCheck,
+                              AsyncPromptStatusView as PromptStatusView,
+                              AsyncStatusView as StatusView)
 
 urlpatterns = [
     path("check", Check.as_view(), name="Check"),
     path("generate", GenerateJiviResponse.as_view(), name="Generate"),
     path("patient", PatientView.as_view(), name="Patient"),
     path("patient/<int:id>", SinglePatientView.as_view(), name="Patient"),
+    path("patient/<int:id>/timeline", PatientTimelineView.as_view(), name="Patient Timeline"),
     path("status/<int:id>", StatusView.as_view(), name="Status"),
     path("login", LoginView.as_view(), name="Login"),
     path("user", UserRegistrationUpdateAPIView.as_view(), name="Register/Update User"),
@@ -25,5 +35,7 @@ urlpatterns = [
     path('request-otp', RequestOTPView.as_view(), name='request-otp'),
     path('verify-otp', VerifyOTPView.as_view(), name='verify-otp'),
     path('prompt-status', PromptStatusView.as_view(), name='prompt_status'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    path('throttle-status', ThrottleStatusView.as_view(), name='throttle_status'),
     # path("patient-detail", PatientDetailView.as_view(), name="Patient"),
 ]
@@ -1,3 +1,4 @@
+import math
 import re
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -12,15 +13,16 @@ from django.db.utils import DatabaseError
 
 from datetime import datetime, timedelta
 
-from django.db.models import OuterRef, Subquery, Exists, Q, Count
+from django.db.models import OuterRef, Subquery, Exists, Q, Count, F, FilteredRelation
 from django.utils.timezone import make_aware
 from django.shortcuts import get_object_or_404
 
-from .pagination import StandardResultsSetPagination
+from .pagination import StandardResultsSetPagination, TimelinePagination
 
-from .models import PatientDeviceData, PatientData, LLMOutput, CustomUser, OneTimePassword
-from .serializer import (PatientDeviceDataSerializer, PatientDataSerializer, UserRegistrationSerializer, 
-                         UserUpdateSerializer, LLMOutputSerializer, EmailSerializer, OTPVerificationSerializer)
+from .models import PatientDeviceData, PatientData, LLMOutput, CustomUser
+from .serializer import (PatientDataSerializer, UserRegistrationSerializer, 
+                         UserUpdateSerializer, LLMOutputSerializer, EmailSerializer, OTPVerificationSerializer,
+                         PATIENT_LIST_SERIALIZER, TIMELINE_CONSULTATION_SERIALIZER)
 
 from .prompt_jivi import (generate_actions_prompt, generate_alerts_prompt, generate_analysis_prompt, 
                          generate_base_prompt, generate_insights_prompt, generate_medication_prompt,
@@ -28,25 +30,39 @@ from .prompt_jivi import (generate_actions_prompt, generate_alerts_prompt, gener
                          grok_image_prompt, generate_initial_prompt, generate_organ_prompt, generate_table_prompt)
 
 from .generate_jivi import send_to_jivi, send_to_grok
+from .resilience import ProviderUnavailableError
 
-from .permissions import DeviceRegisteredPermission
+from .permissions import DeviceRegisteredPermission, MetricsPermission
 
-from .tasks import generate_prompt_in_background, PROMPT_IDS, redis_key, REDIS_CONN
+from .metrics import render_prometheus
+from .throttling import LLMGenerationThrottle, throttle_levels
+
+from .tasks import (dispatch_sections, generate_section, save_section, consultation_base_prompt,
+                    generate_combined_sections, queue_email, PROMPT_IDS, SECTION_PROMPT_IDS, redis_key, REDIS_CONN)
+
+from .gcs import UPLOAD_PREFIX, upload_file
+from .archive import ARCHIVED_FIELDS, hydrate_consultation, load_archive
+from .idempotency import idempotent
+from .otp import OTP_LOCKED, OTP_MISSING, OTP_VALID, issue_otp, verify_otp
 
-from google.cloud import storage
 from django.utils.timezone import now
 from django.core.mail import send_mail
 from django.conf import settings
 
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
-from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode
+from django.utils.encoding import force_str
 from django.contrib.auth.tokens import default_token_generator
-from django.template.loader import render_to_string
-from django.core.mail import EmailMultiAlternatives
-from django.utils.html import strip_tags
+from django.http import HttpResponse
 
 User = get_user_model()
 
+def provider_unavailable_response(error):
+    """
+    503 for a provider whose circuit breaker is open, with Retry-After in whole seconds.
+    """
+    return Response({"message": str(error)}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))})
+
 class CustomLoginView(APIView):
     permission_classes = []
 
@@ -86,34 +102,75 @@ class CustomLoginView(APIView):
 class GenerateJiviResponse(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated, DeviceRegisteredPermission]
+    throttle_classes = [LLMGenerationThrottle]
 
     FILE_CATEGORIES = ['mri', 'ct_scan', 'xray', 'other']
 
     def post(self, request):
-        try:
-            user = request.user
-            sensor_data_id = request.data['id']
-            patientName = request.data['name']
-            phoneNumber = request.data['phone']
-            age = request.data['age']
-            gender = request.data['gender']
-            symptoms = request.data['majorsymptoms']
-            history = request.data['medicalHistory']
-            notes = request.data['notes']
+        # Retries with the same Idempotency-Key get the first request's response
+        return idempotent(request, lambda: self.generate(request))
+
+    def parse_consultation(self, request):
+        """
+        Reads and validates the consultation form. Returns (fields, None), or
+        (None, error response).
+        """
+        fields = {
+            "sensor_data_id": request.data['id'],
+            "patientName": request.data['name'],
+            "phoneNumber": request.data['phone'],
+            "age": request.data['age'],
+            "gender": request.data['gender'],
+            "symptoms": request.data['majorsymptoms'],
+            "history": request.data['medicalHistory'],
+            "notes": request.data['notes'],
+        }
+        patientName, phoneNumber = fields["patientName"], fields["phoneNumber"]
 
-            if not patientName or not isinstance(patientName, str) or not patientName.strip():
-                return Response({'error': 'Name is required and must be a valid string.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not patientName or not isinstance(patientName, str) or not patientName.strip():
+            return None, Response({'error': 'Name is required and must be a valid string.'}, status=status.HTTP_400_BAD_REQUEST)
 
-            if not phoneNumber or not re.fullmatch(r'\d{10}', str(phoneNumber)):
-                return Response({'error': 'Phone number must be exactly 10 digits.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not phoneNumber or not re.fullmatch(r'\d{10}', str(phoneNumber)):
+            return None, Response({'error': 'Phone number must be exactly 10 digits.'}, status=status.HTTP_400_BAD_REQUEST)
 
-            try:
-                age = int(age)
-                if age <= 0 or age > 150:
-                    return Response({'error': 'Age must be between 1 and 150.'}, status=status.HTTP_400_BAD_REQUEST)
-            except (ValueError, TypeError):
-                return Response({'error': 'Age must be a valid integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            fields["age"] = int(fields["age"])
+            if fields["age"] <= 0 or fields["age"] > 150:
+                return None, Response({'error': 'Age must be between 1 and 150.'}, status=status.HTTP_400_BAD_REQUEST)
+        except (ValueError, TypeError):
+            return None, Response({'error': 'Age must be a valid integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return fields, None
+
+    def upload_files(self, request, sensor_data_id, phoneNumber):
+        """
+        Uploads the attached scans to GCS, returns {category: object_path}.
+        """
+        uploaded_files = {}
+
+        for category in self.FILE_CATEGORIES:
+            file_obj = request.FILES.get(category)
+            if file_obj:
+                # Rename file using sensor_id, phone number, timestamp, and category
+                timestamp = now().strftime("%Y%m%d%H%M%S")
+                file_extension = file_obj.name.split('.')[-1]
+                new_file_name = f"{sensor_data_id}_{phoneNumber}_{timestamp}_{category}.{file_extension}"
+
+                # Upload to GCP, signed URLs are minted on demand from the stored path
+                uploaded_files[category] = upload_file(file_obj, f"{UPLOAD_PREFIX}{new_file_name}")
+
+        return uploaded_files
+
+    def generate(self, request):
+        try:
+            user = request.user
+            fields, error_response = self.parse_consultation(request)
+            if error_response is not None:
+                return error_response
 
+            sensor_data_id, phoneNumber = fields["sensor_data_id"], fields["phoneNumber"]
+            patientName, age, gender = fields["patientName"], fields["age"], fields["gender"]
+            symptoms, history, notes = fields["symptoms"], fields["history"], fields["notes"]
 
             # Create or get patient
             patient, created = PatientData.objects.get_or_create(
@@ -128,50 +185,33 @@ class GenerateJiviResponse(APIView):
             if not sensor_data:
                 return Response({"message": "Sensor Data Not Found"}, status=status.HTTP_404_NOT_FOUND)
             
-            patientDeviceData = PatientDeviceDataSerializer(sensor_data)
-
             # File Upload Handling
-            uploaded_files = {}
-            client = storage.Client(credentials=settings.GS_CREDENTIALS)
-            bucket = client.bucket(settings.GS_BUCKET_NAME)
-
-            for category in self.FILE_CATEGORIES:
-                file_obj = request.FILES.get(category)
-                if file_obj:
-                    # Rename file using sensor_id, phone number, timestamp, and category
-                    timestamp = now().strftime("%Y%m%d%H%M%S")
-                    file_extension = file_obj.name.split('.')[-1]
-                    new_file_name = f"{sensor_data_id}_{phoneNumber}_{timestamp}_{category}.{file_extension}"
-
-                    # Upload to GCP
-                    blob = bucket.blob(f"uploads/{new_file_name}")
-                    blob.upload_from_file(file_obj, content_type=file_obj.content_type)
-                    signed_url = blob.generate_signed_url(expiration=timedelta(hours=72))  # Expires in 72 hours
-
-                    uploaded_files[category] = signed_url
+            uploaded_files = self.upload_files(request, sensor_data_id, phoneNumber)
 
             # Check if any files were uploaded; if not, set output_text_10 accordingly
             output_text_10 = None
             if not uploaded_files:
                 output_text_10 = "No files were uploaded"
 
-            patient_data = {
-                "patientName": patientName,
-                "age": age,
-                "gender": gender,
-                "symptoms": symptoms,
-                "medicalHistory": history,
-                "notes": notes,
-            }
-
             system_prompt = generate_system_prompt()
-            base_prompt = generate_base_prompt(patient_data, patientDeviceData.data)
-            user_prompt = generate_initial_prompt(base_prompt)
-            table_prompt = generate_table_prompt(base_prompt)
-            jivi_response = send_to_jivi(system_prompt, user_prompt)
-            jivi_response_table = send_to_jivi(system_prompt, table_prompt)
+            base_prompt = consultation_base_prompt(patient, sensor_data, symptoms, history, notes)
+
+            # In combined mode all text sections come from one call, anything it misses is generated as usual
+            sections = {}
+            if settings.LLM_GENERATION_MODE == "combined":
+                sections = generate_combined_sections(system_prompt, base_prompt, user.medication, user.id)
+
+            jivi_response = sections.pop(1, None)
+            if jivi_response is None:
+                user_prompt = generate_initial_prompt(base_prompt)
+                jivi_response = send_to_jivi(system_prompt, user_prompt, prompt_id=1, doctor_id=user.id)
+
+            jivi_response_table = sections.pop(11, None)
+            if jivi_response_table is None:
+                table_prompt = generate_table_prompt(base_prompt)
+                jivi_response_table = send_to_jivi(system_prompt, table_prompt, prompt_id=11, doctor_id=user.id)
 
-            # Store LLM output and uploaded file URLs
+            # Store LLM output and uploaded file paths
             model_output = LLMOutput.objects.create(
                 output_text_1=jivi_response,
                 output_text_10=output_text_10,
@@ -182,16 +222,22 @@ class GenerateJiviResponse(APIView):
                 history=history,
                 notes=notes,
                 medication_type=user.medication,
-                file_urls=uploaded_files
+                file_urls=uploaded_files,
+                **{f"output_text_{prompt_id}": text for prompt_id, text in sections.items()}
             )
 
-            for prompt_id in PROMPT_IDS:
-                # Mark as pending in redis
-                REDIS_CONN.setex(redis_key(model_output.id, prompt_id), 300, "pending")  # expire in 15 min
-                generate_prompt_in_background.delay(model_output.id, prompt_id)
+            # Sections from the combined call are already done, the rest are generated in the background
+            dispatch_sections(
+                model_output.id,
+                pending_ids=[prompt_id for prompt_id in PROMPT_IDS if prompt_id not in sections],
+                done_ids=[prompt_id for prompt_id in PROMPT_IDS if prompt_id in sections],
+            )
 
             return Response({"model_output_id": model_output.id}, status=status.HTTP_200_OK)
 
+        except ProviderUnavailableError as e:
+            return provider_unavailable_response(e)
+
         except RuntimeError as e:
             return Response({"message": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
 
@@ -225,7 +271,7 @@ class GenerateJiviResponse(APIView):
                         "message": "Output is being generated. Please try again later.",
                     }, status=status.HTTP_202_ACCEPTED)
 
-            model_output = LLMOutput.objects.get(id=output_id)
+            model_output = hydrate_consultation(LLMOutput.objects.get(id=output_id))
 
             check_updated_text = getattr(model_output, f"output_text_{prompt_id}", None)
 
@@ -243,50 +289,19 @@ class GenerateJiviResponse(APIView):
             if sensor_data.device_serial_number not in user.device_serial_numbers:
                   return Response({"message": "Data Does Not Match Your Device"}, status=status.HTTP_403_FORBIDDEN)
             
-            patient_device_data = PatientDeviceDataSerializer(sensor_data).data
-
             patient = PatientData.objects.get(patient_mobile_number=model_output.patient_mobile_number)
 
-            patient_data = {
-                "patientName": patient.name,
-                "age": patient.age,
-                "gender": patient.gender,
-                "symptoms": model_output.symptoms,
-                "medicalHistory": model_output.history,
-            }
-            
             system_prompt = generate_system_prompt()
-            base_prompt = generate_base_prompt(patient_data, patient_device_data)
-
-            # Running different prompts and updating different output_text_n fields based on prompt_id
-            if prompt_id == 1:
-                model_output.output_text_1 = send_to_jivi(system_prompt, generate_initial_prompt(base_prompt))
-            elif prompt_id == 2:
-                model_output.output_text_2 = send_to_jivi(system_prompt, generate_diagnosis_prompt(base_prompt))
-            elif prompt_id == 3:
-                model_output.output_text_3 = send_to_jivi(system_prompt, generate_organ_prompt(base_prompt))
-            elif prompt_id == 4:
-                model_output.output_text_4 = send_to_jivi(system_prompt, generate_summary_prompt(base_prompt))
-            elif prompt_id == 5:
-                model_output.output_text_5 = send_to_jivi(system_prompt, generate_analysis_prompt(base_prompt))
-            elif prompt_id == 6:
-                model_output.output_text_6 = send_to_jivi(system_prompt, generate_alerts_prompt(base_prompt))
-            elif prompt_id == 7:
-                model_output.output_text_7 = send_to_jivi(system_prompt, generate_actions_prompt(base_prompt))
-            elif prompt_id == 8:
-                if model_output.medication_type:
-                    model_output.output_text_8 = send_to_jivi(system_prompt, generate_medication_prompt(base_prompt, model_output.medication_type))
-            elif prompt_id == 9:
-                model_output.output_text_9 = send_to_jivi(system_prompt, generate_insights_prompt(base_prompt))
-            elif prompt_id == 10:
-                if not model_output.file_urls:
-                    model_output.output_text_10 = "No files were uploaded"
-                else:
-                    model_output.output_text_10 = send_to_grok(grok_image_prompt(base_prompt), model_output.file_urls)
-            else:
+            base_prompt = consultation_base_prompt(
+                patient, sensor_data, model_output.symptoms, model_output.history, model_output.notes
+            )
+
+            if prompt_id not in SECTION_PROMPT_IDS:
                 return Response({"message": "Invalid prompt_id"}, status=status.HTTP_400_BAD_REQUEST)
-            
-            model_output.save()
+
+            updated_text = generate_section(model_output, prompt_id, system_prompt, base_prompt, reload=bool(reload))
+            if updated_text is not None:
+                save_section(model_output, prompt_id, updated_text)
 
             serializer = LLMOutputSerializer(model_output)
 
@@ -303,6 +318,9 @@ class GenerateJiviResponse(APIView):
         except LLMOutput.DoesNotExist:
             return Response({"message": "Invalid prompt_id"}, status=status.HTTP_404_NOT_FOUND)
         
+        except ProviderUnavailableError as e:
+            return provider_unavailable_response(e)
+
         except RuntimeError as e:
             return Response({"message": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
         
@@ -318,7 +336,74 @@ class SinglePatientView(APIView):
         patient = get_object_or_404(PatientData, patient_mobile_number=id)
         serializer = PatientDataSerializer(patient)
         return Response(serializer.data, status=status.HTTP_200_OK)
-   
+
+TIMELINE_READING_FIELDS = ["id", "device_serial_number", "co", "co2", "o2", "heart_rate", "spo2", "nh3",
+                           "o2_delta", "rq", "hydrogen", "formaldehyde", "created_at"]
+# Consultation fields a timeline entry has unless ?fields= asks for others (output_text_4 is the summary)
+TIMELINE_DEFAULT_FIELDS = ["symptoms", "doctor_remark", "output_text_4"]
+TIMELINE_TEXT_FIELDS = ["symptoms", "history", "notes", "doctor_remark", "doctor_comment", "doctor_note",
+                        *[f"output_text_{prompt_id}" for prompt_id in range(1, 12)]]
+
+class PatientTimelineView(APIView):
+    """
+    A patient's readings on the doctor's devices, newest first, each with its
+    latest consultation (or null) in the same entry. One query per page: the
+    readings LEFT JOIN their latest consultation, selecting only the text
+    fields asked for with ?fields=symptoms,output_text_1
+    (TIMELINE_DEFAULT_FIELDS otherwise).
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated, DeviceRegisteredPermission]
+
+    def get(self, request, id):
+        user = request.user
+
+        fields = TIMELINE_DEFAULT_FIELDS
+        if "fields" in request.GET:
+            fields = [name for name in request.GET["fields"].split(",") if name]
+            unknown = [name for name in fields if name not in TIMELINE_TEXT_FIELDS]
+            if unknown:
+                return Response({"message": f"Unknown fields: {', '.join(unknown)}"},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        consultation_fields = ["id", "created_at", *fields]
+        archived_fields = [name for name in fields if name in ARCHIVED_FIELDS]
+        # A reading can have several consultations, join only its latest so it is one entry
+        latest_output = LLMOutput.objects.filter(sensor_data=OuterRef("pk")).order_by("-created_at", "-id")
+        readings = PatientDeviceData.objects.filter(
+            patient_mobile_number=id,
+            device_serial_number__in=user.device_serial_numbers,
+        ).annotate(
+            consultation=FilteredRelation(
+                "llmoutput", condition=Q(llmoutput__id=Subquery(latest_output.values("id")[:1])),
+            ),
+        ).values(
+            *TIMELINE_READING_FIELDS,
+            **{f"consultation_{name}": F(f"consultation__{name}")
+               for name in [*consultation_fields, *(["archive_path"] if archived_fields else [])]},
+        )
+
+        paginator = TimelinePagination()
+        page = paginator.paginate_queryset(readings, request, view=self)
+
+        # Section texts of archived consultations come from the archive
+        for row in page if archived_fields else []:
+            if row["consultation_archive_path"]:
+                archive = load_archive(row["consultation_id"], row["consultation_archive_path"])
+                for name in archived_fields:
+                    if row[f"consultation_{name}"] is None:
+                        row[f"consultation_{name}"] = archive.get(name)
+
+        entries = PATIENT_LIST_SERIALIZER.to_representation(page, fields=TIMELINE_READING_FIELDS)
+        consultations = TIMELINE_CONSULTATION_SERIALIZER.to_representation(
+            [{name: row[f"consultation_{name}"] for name in consultation_fields} for row in page],
+            fields=consultation_fields,
+        )
+        for entry, consultation in zip(entries, consultations):
+            entry["consultation"] = consultation if consultation["id"] is not None else None
+
+        return paginator.get_paginated_response(entries)
+
 class PatientView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated, DeviceRegisteredPermission]
@@ -329,6 +414,14 @@ class PatientView(APIView):
             user = request.user
             date_filter = request.GET.get("date_filter")  # e.g., "today", "yesterday", "last_week", "last_month", "old"
             search = request.GET.get("search")  # Search text for patient_mobile_number or patient_name
+            abnormal = request.GET.get("abnormal")  # "true": only patients whose latest reading is out of range
+            min_severity = request.GET.get("min_severity")
+            sort = request.GET.get("sort")  # "severity": most severe first, otherwise newest first
+
+            try:
+                min_severity = int(min_severity) if min_severity else None
+            except ValueError:
+                return Response({"error": "min_severity must be a number"}, status=status.HTTP_400_BAD_REQUEST)
 
             # Define time boundaries
             today = make_aware(datetime.now())
@@ -357,6 +450,12 @@ class PatientView(APIView):
                     Q(patient_mobile_number__in=PatientData.objects.filter(name__icontains=search).values("patient_mobile_number"))
                 )
 
+            # Abnormality of the reading as scored against SensorReferenceRange (api.triage)
+            if abnormal == "true":
+                filter_conditions &= Q(severity__gt=0)
+            if min_severity is not None:
+                filter_conditions &= Q(severity__gte=min_severity)
+
             # Build a subquery to get the latest created_at for each patient (by mobile number)
             latest_records = PatientDeviceData.objects.filter(
                 device_serial_number__in = user.device_serial_numbers,
@@ -407,20 +506,26 @@ class PatientView(APIView):
                 "spo2",
                 "nh3",
                 "created_at",
+                "abnormal_flags",
+                "severity",
                 "patient_name",
                 "patient_age",
                 "patient_gender",
                 "model_generated",
                 "model_output_id",
-            ).order_by("-created_at")
+            )
+            if sort == "severity":
+                queryset = queryset.order_by("-severity", "-created_at")
+            else:
+                queryset = queryset.order_by("-created_at")
 
             # Set up pagination
             paginator = StandardResultsSetPagination()
             paginated_queryset = paginator.paginate_queryset(queryset, request)
 
             # Serialize the paginated data
-            serializer = PatientDeviceDataSerializer(paginated_queryset, many=True)
-            return paginator.get_paginated_response(serializer.data)
+            data = PATIENT_LIST_SERIALIZER.to_representation(paginated_queryset)
+            return paginator.get_paginated_response(data)
 
         except Exception as e:
             # Optionally log the error here.
@@ -429,6 +534,55 @@ class PatientView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+def consultation_status_data(model_output, patient_data, previous_visits):
+    """
+    Response body of StatusView, shared with its async version.
+    """
+    sensor_data = model_output.sensor_data
+
+    return {
+        "model_output": {
+            "id": model_output.id,
+            "symptoms" : model_output.symptoms,
+            "history" : model_output.history,
+            "output_text_1": model_output.output_text_1,
+            "output_text_2": model_output.output_text_2,
+            "output_text_3": model_output.output_text_3,
+            "output_text_4": model_output.output_text_4,
+            "output_text_5": model_output.output_text_5,
+            "output_text_6": model_output.output_text_6,
+            "output_text_7": model_output.output_text_7,
+            "output_text_8": model_output.output_text_8,
+            "output_text_9": model_output.output_text_9,
+            "output_text_10": model_output.output_text_10,
+            "output_text_11": model_output.output_text_11,
+            "doctor_remark": model_output.doctor_remark,
+            "doctor_comment": model_output.doctor_comment,
+            "doctor_note": model_output.doctor_note,
+            "patient_mobile_number": model_output.patient_mobile_number,
+            "created_at": model_output.created_at,
+            "updated_at": model_output.updated_at,
+        },
+        "sensor_data": {
+            "id": sensor_data.id,
+            "doctor_id": sensor_data.doctor_id,
+            "patient_mobile_number": sensor_data.patient_mobile_number,
+            "device_serial_number": sensor_data.device_serial_number,
+            "co": sensor_data.co,
+            "co2": sensor_data.co2,
+            "o2": sensor_data.o2,
+            "heart_rate": sensor_data.heart_rate,
+            "spo2": sensor_data.spo2,
+            "nh3": sensor_data.nh3,
+            "rq": sensor_data.rq,
+            "hydrogen": sensor_data.hydrogen,
+            "formaldehyde": sensor_data.formaldehyde,
+            "created_at": sensor_data.created_at,
+        },
+        "patient_data" : patient_data,
+        "previous_visits" : previous_visits
+    }
+
 class StatusView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated, DeviceRegisteredPermission]
@@ -441,6 +595,8 @@ class StatusView(APIView):
         if model_output.sensor_data.device_serial_number not in user.device_serial_numbers:
             return Response({"message": "Data Does Not Match Your Device"}, status=status.HTTP_403_FORBIDDEN)
 
+        hydrate_consultation(model_output)
+
         patient = PatientData.objects.get(patient_mobile_number=model_output.patient_mobile_number)
         
         previous_visits = LLMOutput.objects.filter(
@@ -451,50 +607,7 @@ class StatusView(APIView):
 
         serializer = PatientDataSerializer(patient)
 
-        sensor_data = model_output.sensor_data
-
-        response_data = {
-            "model_output": {
-                "id": model_output.id,
-                "symptoms" : model_output.symptoms,
-                "history" : model_output.history,
-                "output_text_1": model_output.output_text_1,
-                "output_text_2": model_output.output_text_2,
-                "output_text_3": model_output.output_text_3,
-                "output_text_4": model_output.output_text_4,
-                "output_text_5": model_output.output_text_5,
-                "output_text_6": model_output.output_text_6,
-                "output_text_7": model_output.output_text_7,
-                "output_text_8": model_output.output_text_8,
-                "output_text_9": model_output.output_text_9,
-                "output_text_10": model_output.output_text_10,
-                "output_text_11": model_output.output_text_11,
-                "doctor_remark": model_output.doctor_remark,
-                "doctor_comment": model_output.doctor_comment,
-                "doctor_note": model_output.doctor_note,
-                "patient_mobile_number": model_output.patient_mobile_number,
-                "created_at": model_output.created_at,
-                "updated_at": model_output.updated_at,
-            },
-            "sensor_data": {
-                "id": sensor_data.id,
-                "doctor_id": sensor_data.doctor_id,
-                "patient_mobile_number": sensor_data.patient_mobile_number,
-                "device_serial_number": sensor_data.device_serial_number,
-                "co": sensor_data.co,
-                "co2": sensor_data.co2,
-                "o2": sensor_data.o2,
-                "heart_rate": sensor_data.heart_rate,
-                "spo2": sensor_data.spo2,
-                "nh3": sensor_data.nh3,
-                "rq": sensor_data.rq,
-                "hydrogen": sensor_data.hydrogen,
-                "formaldehyde": sensor_data.formaldehyde,
-                "created_at": sensor_data.created_at,
-            },
-            "patient_data" : serializer.data,
-            "previous_visits" : visits_serializer.data
-        }
+        response_data = consultation_status_data(model_output, serializer.data, visits_serializer.data)
 
         return Response(response_data,status=status.HTTP_200_OK)
 
@@ -682,25 +795,7 @@ class TestEmail(APIView):
             return Response({"error": str(e)}, status=500)
 
 def send_verification_email(self, user):
-    token = default_token_generator.make_token(user)
-    uid = urlsafe_base64_encode(force_bytes(user.pk))
-    link = f"{settings.FRONTEND_URL}/verify-email/{uid}/{token}/"
-
-    subject = "Verify your email address"
-    html_content = render_to_string('verify_email.html', {
-        'username': user.username,
-        'verify_url': link,
-    })
-    plain_text_content = strip_tags(html_content)  # Fallback for email clients that don't support HTML
-
-    email = EmailMultiAlternatives(
-        subject=subject,
-        body=plain_text_content,
-        from_email=settings.EMAIL_HOST_USER,
-        to=[user.email],
-    )
-    email.attach_alternative(html_content, "text/html")
-    email.send()
+    queue_email("verification", user.id)
        
 class VerifyEmailView(APIView):
     authentication_classes = []
@@ -726,7 +821,7 @@ class ResendVerificationEmailView(APIView):
     def post(self, request):
         user = request.user  # or identify from session/cookie/context
         if not user.email_verified:
-            send_verification_email(user)  # Your email sending logic
+            send_verification_email(self, user)  # Queued, sent by the housekeeping workers
             return Response({"message": "Verification email resent."}, status=200)
         return Response({"message": "User already verified."}, status=400)
     
@@ -839,9 +934,9 @@ class RequestOTPView(APIView):
         if not user.email_verified:
             return Response({"message": "Kindly verify your email first"}, status=461)
         
-        otp_instance = OneTimePassword.generate_otp(user)
+        otp = issue_otp(user.email)
 
-        send_otp_email(self, user, otp_instance.otp)
+        send_otp_email(self, user, otp)
 
         return Response({"message": "OTP sent to email."}, status=status.HTTP_200_OK)
 
@@ -862,20 +957,17 @@ class VerifyOTPView(APIView):
         except User.DoesNotExist:
             return Response({"message": "User not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        latest_otp = OneTimePassword.objects.filter(user=user, is_expired=False).order_by('-created_at').first()
+        result = verify_otp(user.email, otp)
 
-        if not latest_otp:
+        if result == OTP_MISSING:
             return Response({"message": "No active OTP found. Please request a new one."}, status=status.HTTP_400_BAD_REQUEST)
 
-        if latest_otp.has_expired():
-            return Response({"message": "OTP has expired. Please request a new one."}, status=status.HTTP_400_BAD_REQUEST)
+        if result == OTP_LOCKED:
+            return Response({"message": "Too many attempts. Please try again later."}, status=status.HTTP_429_TOO_MANY_REQUESTS)
 
-        if latest_otp.otp != otp:
+        if result != OTP_VALID:
             return Response({"message": "Invalid OTP."}, status=status.HTTP_400_BAD_REQUEST)
 
-        latest_otp.is_expired = True
-        latest_otp.save(update_fields=['is_expired'])
-
         refresh = RefreshToken.for_user(user)
 
         return Response({
@@ -885,21 +977,7 @@ class VerifyOTPView(APIView):
         }, status=status.HTTP_200_OK)
     
 def send_otp_email(self, user, otp):
-    subject = "One Time Password (OTP) for login"
-    html_content = render_to_string('otp_login.html', {
-        'username': user.username,
-        'otp': otp,
-    })
-    plain_text_content = strip_tags(html_content)  # Fallback for email clients that don't support HTML
-
-    email = EmailMultiAlternatives(
-        subject=subject,
-        body=plain_text_content,
-        from_email=settings.EMAIL_HOST_USER,
-        to=[user.email],
-    )
-    email.attach_alternative(html_content, "text/html")
-    email.send()
+    queue_email("otp", user.id, otp=otp)
 
 class PromptStatusView(APIView):
     authentication_classes = [JWTAuthentication]
@@ -913,4 +991,27 @@ class PromptStatusView(APIView):
         status_val = REDIS_CONN.get(redis_key(output_id, prompt_id))
         if status_val:
             return Response({"status": status_val.decode()})
-        return Response({"status": "not_started"})
\ No newline at end of file
+        return Response({"status": "not_started"})
+
+class MetricsView(APIView):
+    """
+    Prometheus scrape endpoint for LLM call latency, token usage and outcomes.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [MetricsPermission]
+
+    def get(self, request):
+        return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+class ThrottleStatusView(APIView):
+    """
+    Tokens left in the per-doctor and per-device generation buckets.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "rates": settings.LLM_THROTTLE_RATES,
+            "buckets": throttle_levels(),
+        }, status=status.HTTP_200_OK)
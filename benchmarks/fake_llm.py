@@ -0,0 +1,161 @@
+"""
+OpenAI-compatible /chat/completions server for load tests, so they don't spend
+real OpenAI or Grok credits. Serves both clients (GPT_URL and GROK_URL).
+
+    python benchmarks/fake_llm.py --port 18080 --latency 4 --jitter 2
+
+Latency is drawn uniformly from latency ± jitter seconds per call. Streaming
+requests (stream=true) get their first chunk after --ttft seconds, then the
+reply in --chunks pieces spread over the rest of the latency. Requests with a
+json_schema response_format get an object with every property of the schema.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = (
+    "**Assessment**\n"
+    "Findings are consistent with the reported symptoms and the breath analysis. "
+    "Values outside the normal range are highlighted below with suggested follow-up.\n"
+)
+
+class Stats:
+    lock = threading.Lock()
+    calls = 0
+    streamed = 0
+    errors = 0
+
+def _schema_reply(response_format):
+    schema = response_format.get("json_schema", {}).get("schema", {})
+    return json.dumps({name: REPLY for name in schema.get("properties", {})})
+
+def _usage(body, content):
+    prompt_chars = sum(len(str(message.get("content", ""))) for message in body.get("messages", []))
+    prompt_tokens = prompt_chars // 4
+    completion_tokens = len(content) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        # The shared system + report prefix is what the provider would cache
+        "prompt_tokens_details": {"cached_tokens": int(prompt_tokens * 0.8) // 128 * 128},
+    }
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    options = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            return self._send_json(200, {"calls": Stats.calls, "streamed": Stats.streamed, "errors": Stats.errors})
+        self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": "Not found"}})
+
+        options = self.options
+        latency = max(0.0, random.uniform(options.latency - options.jitter, options.latency + options.jitter))
+        with Stats.lock:
+            Stats.calls += 1
+
+        if random.random() < options.error_rate:
+            time.sleep(latency)
+            with Stats.lock:
+                Stats.errors += 1
+            return self._send_json(503, {"error": {"message": "Fake provider overloaded", "type": "server_error"}})
+
+        response_format = body.get("response_format") or {}
+        content = _schema_reply(response_format) if response_format.get("type") == "json_schema" else REPLY
+        model = body.get("model") or "fake-model"
+
+        if body.get("stream"):
+            return self._stream(model, content, latency, body)
+
+        time.sleep(latency)
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": _usage(body, content),
+        })
+
+    def _stream(self, model, content, latency, body):
+        with Stats.lock:
+            Stats.streamed += 1
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        pieces = max(1, self.options.chunks)
+        size = -(-len(content) // pieces)
+        chunks = [content[i:i + size] for i in range(0, len(content), size)]
+        gap = max(0.0, latency - self.options.ttft) / max(1, len(chunks))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def event(delta, finish_reason=None, usage=None):
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            if usage is not None:
+                payload["usage"] = usage
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode())
+            self.wfile.flush()
+
+        time.sleep(min(self.options.ttft, latency))
+        event({"role": "assistant", "content": ""})
+        for chunk in chunks:
+            event({"content": chunk})
+            time.sleep(gap)
+        event({}, finish_reason="stop", usage=_usage(body, content))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=4.0, help="Mean seconds per call")
+    parser.add_argument("--jitter", type=float, default=2.0, help="Latency varies by up to this many seconds")
+    parser.add_argument("--ttft", type=float, default=0.8, help="Seconds to the first streamed chunk")
+    parser.add_argument("--chunks", type=int, default=20, help="Chunks per streamed reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with a 503")
+    options = parser.parse_args()
+
+    Handler.options = options
+    server = ThreadingHTTPServer((options.host, options.port), Handler)
+    server.daemon_threads = True
+    print(f"Fake LLM listening on http://{options.host}:{options.port}/v1 "
+          f"(latency {options.latency}±{options.jitter}s, error rate {options.error_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Measures how long a fresh process takes to load the app, the cost every
+gunicorn boot, Celery worker fork and manage.py command pays before doing any
+work. Each run is a new interpreter that sets up Django and imports what the
+web and worker processes load (URLconf, views, tasks).
+
+    set -a; . benchmarks/bench.env; set +a
+    python benchmarks/import_time.py --runs 10
+
+Add -X importtime output for the slowest modules with --modules.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+STARTUP = """
+import time
+started = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter()
+import api.urls, api.tasks
+loaded = time.perf_counter()
+print(f"{setup - started} {loaded - setup}")
+"""
+
+def run_once(python):
+    output = subprocess.run([python, "-c", STARTUP], capture_output=True, text=True, check=True).stdout
+    setup, app = map(float, output.split())
+    return setup, app
+
+def slowest_modules(python, count):
+    stderr = subprocess.run([python, "-X", "importtime", "-c", STARTUP], capture_output=True, text=True,
+                            check=True).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            modules.append((int(cumulative), name.rstrip()))
+    return sorted(modules, reverse=True)[:count]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--modules", type=int, default=0, help="Also list this many slowest imports")
+    options = parser.parse_args()
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gloport_backend.settings")
+
+    run_once(options.python)  # Warm the bytecode and filesystem caches
+    runs = [run_once(options.python) for _ in range(options.runs)]
+    for label, values in (("django.setup()", [setup for setup, _ in runs]),
+                          ("api urls and tasks", [app for _, app in runs]),
+                          ("total", [setup + app for setup, app in runs])):
+        print(f"{label:<20} median {statistics.median(values) * 1000:7.1f} ms   "
+              f"min {min(values) * 1000:7.1f} ms")
+
+    if options.modules:
+        print(f"\n{'cumulative ms':>14}  module")
+        for cumulative, name in slowest_modules(options.python, options.modules):
+            print(f"{cumulative / 1000:>14.1f}  {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Drives concurrent doctor sessions against a running server and reports
+latency percentiles and throughput per endpoint.
+
+Each virtual doctor loops over:
+  GET  /patient                       browse the patient list
+  POST /generate                      start a consultation on an unused reading
+  GET  /prompt-status (per section)   poll until every background section is done
+  GET  /status/<id>                   open the finished report
+  GET  /patient?page=2                browse on
+
+    python benchmarks/loadtest.py --base-url http://localhost:8000 --concurrency 20 --duration 120 \
+        --json bench_output.json --compare previous.json
+
+"consultation" in the report is the time from POST /generate to the last
+section being done, as the doctor sees it, and "first section" the time until
+the first of the sections the app shows first (--first-sections, summary and
+alerts) is done.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+PROMPT_IDS = [2, 3, 4, 5, 6, 7, 8, 9, 10]
+FINAL_STATUSES = ("done", "invalid")
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, endpoint, seconds, ok=True):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+def percentile(values, pct):
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+class Client:
+    def __init__(self, base_url, access, recorder, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"Authorization": f"JWT {access}", "Content-Type": "application/json"}
+        self.recorder = recorder
+        self.timeout = timeout
+
+    def request(self, endpoint, method, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method, headers=self.headers)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            body, status = e.read(), e.code
+        except (urllib.error.URLError, TimeoutError, ConnectionError):
+            body, status = b"", 0
+        self.recorder.add(endpoint, time.perf_counter() - start, ok=200 <= status < 300)
+        try:
+            return status, json.loads(body or b"null")
+        except ValueError:
+            return status, None
+
+def run_session(session, options, recorder, stop_at):
+    client = Client(options.base_url, session["access"], recorder, options.timeout)
+    readings = list(session["readings"])
+    random.shuffle(readings)
+
+    while time.monotonic() < stop_at and readings:
+        client.request("GET /patient", "GET", "/patient?page=1")
+
+        reading = readings.pop()
+        started = time.perf_counter()
+        status, body = client.request("POST /generate", "POST", "/generate", {
+            "id": reading["id"],
+            "name": f"Patient {reading['phone']}",
+            "phone": reading["phone"],
+            "age": random.randint(18, 90),
+            "gender": random.choice(["Male", "Female"]),
+            "majorsymptoms": "Shortness of breath on exertion",
+            "medicalHistory": "Asthma",
+            "notes": "Load test consultation",
+        })
+        if status != 200 or not body:
+            continue
+        output_id = body["model_output_id"]
+
+        pending = set(PROMPT_IDS)
+        first_pending = True
+        deadline = time.monotonic() + options.consultation_timeout
+        while pending and time.monotonic() < deadline:
+            time.sleep(options.poll_interval)
+            for prompt_id in sorted(pending):
+                _, result = client.request("GET /prompt-status", "GET",
+                                           f"/prompt-status?output_id={output_id}&prompt_id={prompt_id}")
+                section_status = (result or {}).get("status", "")
+                if section_status in FINAL_STATUSES or section_status.startswith("error"):
+                    pending.discard(prompt_id)
+            if first_pending and not pending.issuperset(options.first_sections):
+                recorder.add("first section", time.perf_counter() - started)
+                first_pending = False
+        if first_pending:
+            recorder.add("first section", time.perf_counter() - started, ok=False)
+        recorder.add("consultation", time.perf_counter() - started, ok=not pending)
+
+        client.request("GET /status/<id>", "GET", f"/status/{output_id}")
+        client.request("GET /patient", "GET", "/patient?page=2")
+
+def report(recorder, elapsed, baseline=None):
+    rows = {}
+    for endpoint, values in sorted(recorder.latencies.items()):
+        rows[endpoint] = {
+            "count": len(values),
+            "errors": recorder.errors[endpoint],
+            "rps": len(values) / elapsed,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+        }
+
+    header = f"{'endpoint':<22}{'count':>8}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for endpoint, row in rows.items():
+        line = (f"{endpoint:<22}{row['count']:>8}{row['errors']:>8}{row['rps']:>9.2f}"
+                f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+        previous = (baseline or {}).get("endpoints", {}).get(endpoint)
+        if previous:
+            change = (row["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100 if previous["p95_ms"] else 0
+            line += f"   p95 {change:+.1f}% vs baseline"
+        print(line)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--sessions", default="benchmarks/.sessions.json", help="Written by seed.py")
+    parser.add_argument("--concurrency", type=int, default=20, help="Virtual doctors")
+    parser.add_argument("--duration", type=float, default=120, help="Seconds to keep starting consultations")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--consultation-timeout", type=float, default=300)
+    parser.add_argument("--first-sections", default="4,6",
+                        help="Sections the app shows first, \"first section\" waits for one of them")
+    parser.add_argument("--timeout", type=float, default=120, help="Per request")
+    parser.add_argument("--json", help="Write the results here")
+    parser.add_argument("--compare", help="Results of an earlier run to compare against")
+    options = parser.parse_args()
+    options.first_sections = {int(prompt_id) for prompt_id in options.first_sections.split(",")}
+
+    with open(options.sessions) as f:
+        sessions = json.load(f)
+    if options.concurrency > len(sessions):
+        parser.error(f"Only {len(sessions)} seeded doctors, re-run seed.py with --doctors {options.concurrency}")
+
+    baseline = None
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+
+    recorder = Recorder()
+    stop_at = time.monotonic() + options.duration
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(target=run_session, args=(session, options, recorder, stop_at), daemon=True)
+        for session in sessions[:options.concurrency]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    rows = report(recorder, elapsed, baseline)
+    if options.json:
+        with open(options.json, "w") as f:
+            json.dump({
+                "concurrency": options.concurrency,
+                "duration": elapsed,
+                "endpoints": rows,
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
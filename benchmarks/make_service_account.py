@@ -0,0 +1,33 @@
+"""
+Writes a throwaway service account key for benchmark runs. Signed URLs are
+signed locally with it; the GCS emulator accepts any credentials.
+
+    python benchmarks/make_service_account.py benchmarks/.service_account.json
+"""
+import json
+import sys
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+def main(path):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    ).decode()
+
+    with open(path, "w") as f:
+        json.dump({
+            "type": "service_account",
+            "project_id": "gloport-bench",
+            "private_key_id": "bench",
+            "private_key": pem,
+            "client_email": "bench@gloport-bench.iam.gserviceaccount.com",
+            "client_id": "0",
+            "token_uri": "https://oauth2.googleapis.com/token",
+        }, f, indent=2)
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else "benchmarks/.service_account.json")
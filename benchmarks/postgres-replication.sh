@@ -0,0 +1,3 @@
+#!/bin/sh
+# Run by the postgres image on first start: lets postgres-replica stream from this server
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -0,0 +1,38 @@
+#!/bin/sh
+# Runs the whole load test locally: backing services, fake LLM, gunicorn, Celery
+# workers, seeding, then loadtest.py. Extra arguments go to loadtest.py, e.g.
+#   benchmarks/run.sh --concurrency 20 --duration 120 --json benchmarks/results/$(git rev-parse --short HEAD).json
+set -e
+cd "$(dirname "$0")/.."
+
+set -a
+. benchmarks/bench.env
+set +a
+
+mkdir -p benchmarks/results
+if [ -n "$BENCH_REPLICA" ]; then
+    # Reads go to the streaming replica on 5434 (api/db_router.py)
+    export DB_REPLICA_HOSTS=localhost:5434
+    docker compose -f benchmarks/docker-compose.yml --profile replica up -d --wait
+else
+    docker compose -f benchmarks/docker-compose.yml up -d --wait
+fi
+[ -f "$GS_SERVICE_ACCOUNT_FILE" ] || python benchmarks/make_service_account.py "$GS_SERVICE_ACCOUNT_FILE"
+
+python manage.py migrate --noinput
+python benchmarks/seed.py --doctors "${BENCH_DOCTORS:-50}" --readings "${BENCH_READINGS:-40}"
+
+python benchmarks/fake_llm.py --latency "${FAKE_LLM_LATENCY:-4}" --jitter "${FAKE_LLM_JITTER:-2}" > benchmarks/fake_llm.log 2>&1 &
+PIDS=$!
+gunicorn gloport_backend.wsgi -w "${BENCH_WEB_WORKERS:-4}" -b 127.0.0.1:8000 > benchmarks/gunicorn.log 2>&1 &
+PIDS="$PIDS $!"
+celery -A gloport_backend worker -Q llm_text -c 16 -n text@%h > benchmarks/celery_text.log 2>&1 &
+PIDS="$PIDS $!"
+celery -A gloport_backend worker -Q llm_vision -c 4 -n vision@%h > benchmarks/celery_vision.log 2>&1 &
+PIDS="$PIDS $!"
+celery -A gloport_backend worker -Q housekeeping -c 2 -n housekeeping@%h > benchmarks/celery_housekeeping.log 2>&1 &
+PIDS="$PIDS $!"
+trap 'kill $PIDS 2>/dev/null' EXIT
+
+sleep 5
+python benchmarks/loadtest.py "$@"
@@ -0,0 +1,157 @@
+"""
+Seeds the benchmark database with doctors, their devices, sensor readings,
+patients and past consultations, creates the bucket in the GCS emulator and
+writes the virtual doctors' sessions (JWT + readings to consult on) for
+loadtest.py.
+
+    python benchmarks/seed.py --doctors 50 --readings 40 --out benchmarks/.sessions.json
+
+Access tokens last ACCESS_TOKEN_LIFETIME (60 minutes), re-seed with --keep
+to refresh them without touching the data.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gloport_backend.settings")
+
+import django
+
+django.setup()
+
+from django.conf import settings
+from django.utils import timezone
+from google.api_core.exceptions import Conflict
+from google.cloud import storage
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import CustomUser, LLMOutput, PatientData, PatientDeviceData
+
+PASSWORD = "bench-password"
+SYMPTOMS = ["Shortness of breath", "Fatigue", "Chest tightness", "Persistent cough", "Dizziness"]
+HISTORY = ["Asthma", "Type 2 diabetes", "Hypertension", "None", "COPD"]
+
+def create_bucket():
+    client = storage.Client(credentials=settings.GS_CREDENTIALS, project="gloport-bench")
+    try:
+        client.create_bucket(settings.GS_BUCKET_NAME)
+    except Conflict:
+        pass
+
+def reading(doctor, serial, mobile, created_at):
+    return PatientDeviceData(
+        doctor_id=str(doctor.id),
+        patient_mobile_number=mobile,
+        device_serial_number=serial,
+        co=Decimal(random.randint(100, 600)) / 100,
+        co2=Decimal(random.randint(2500000, 4500000)) / 100,
+        o2=Decimal(random.randint(1300, 1800)) / 100,
+        heart_rate=Decimal(random.randint(5500, 11000)) / 100,
+        spo2=Decimal(random.randint(9000, 10000)) / 100,
+        nh3=Decimal(random.randint(10, 200)) / 100,
+        o2_delta=Decimal(random.randint(300, 700)) / 100,
+        rq=Decimal(random.randint(70, 100)) / 100,
+        hydrogen=Decimal(random.randint(0, 4000)) / 100,
+        formaldehyde=Decimal(random.randint(0, 20)) / 1000,
+    ), created_at
+
+def seed(doctors, readings, history_ratio):
+    now = timezone.now()
+    users = []
+    for i in range(doctors):
+        serial = f"BENCH-{i:04d}"
+        user, created = CustomUser.objects.get_or_create(
+            username=f"bench-doctor-{i}",
+            defaults={
+                "email": f"bench-doctor-{i}@example.com",
+                "full_name": f"Bench Doctor {i}",
+                "email_verified": True,
+                "medication": "Allopathy",
+                "device_serial_number": serial,
+                "device_serial_numbers": [serial],
+            },
+        )
+        if created:
+            user.set_password(PASSWORD)
+            user.save(update_fields=["password"])
+        users.append(user)
+
+    for user in users:
+        serial = user.device_serial_numbers[0]
+        rows = []
+        for j in range(readings):
+            mobile = f"9{user.id:04d}{j:05d}"[:10]
+            rows.append(reading(user, serial, mobile, now - timedelta(days=random.randint(0, 90))))
+
+        patients = [
+            PatientData(patient_mobile_number=row.patient_mobile_number, name=f"Patient {row.patient_mobile_number}",
+                        age=random.randint(18, 90), gender=random.choice(["Male", "Female"]))
+            for row, _ in rows
+        ]
+        PatientData.objects.bulk_create(patients, ignore_conflicts=True)
+        created_rows = PatientDeviceData.objects.bulk_create([row for row, _ in rows])
+        # created_at is auto_now_add, spread the readings over the last 90 days afterwards
+        for row, (_, created_at) in zip(created_rows, rows):
+            row.created_at = created_at
+        PatientDeviceData.objects.bulk_update(created_rows, ["created_at"])
+
+        past = [
+            LLMOutput(
+                sensor_data=row,
+                patient_mobile_number=row.patient_mobile_number,
+                symptoms=random.choice(SYMPTOMS),
+                history=random.choice(HISTORY),
+                notes="Seeded consultation",
+                medication_type="Allopathy",
+                doctor_remark=random.choice(["Normal", "Needs follow-up", "Critical", None]),
+                file_urls={},
+                **{f"output_text_{prompt_id}": "Seeded section text" for prompt_id in range(1, 12)},
+            )
+            for row in created_rows[:int(len(created_rows) * history_ratio)]
+        ]
+        LLMOutput.objects.bulk_create(past)
+    return users
+
+def sessions(users):
+    result = []
+    for user in users:
+        serial = user.device_serial_numbers[0]
+        free_readings = list(
+            PatientDeviceData.objects.filter(device_serial_number=serial)
+            .exclude(id__in=LLMOutput.objects.values("sensor_data_id"))
+            .values_list("id", "patient_mobile_number")
+        )
+        result.append({
+            "doctor_id": user.id,
+            "access": str(RefreshToken.for_user(user).access_token),
+            "readings": [{"id": reading_id, "phone": phone} for reading_id, phone in free_readings],
+        })
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doctors", type=int, default=50)
+    parser.add_argument("--readings", type=int, default=40, help="Sensor readings per doctor")
+    parser.add_argument("--history-ratio", type=float, default=0.5,
+                        help="Fraction of readings that already have a consultation")
+    parser.add_argument("--keep", action="store_true", help="Only refresh the sessions file")
+    parser.add_argument("--out", default="benchmarks/.sessions.json")
+    options = parser.parse_args()
+
+    create_bucket()
+    if options.keep:
+        users = list(CustomUser.objects.filter(username__startswith="bench-doctor-").order_by("id"))
+    else:
+        users = seed(options.doctors, options.readings, options.history_ratio)
+
+    with open(options.out, "w") as f:
+        json.dump(sessions(users), f)
+    print(f"Wrote {len(users)} sessions to {options.out}")
+
+if __name__ == "__main__":
+    main()
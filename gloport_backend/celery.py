@@ -1,7 +1,35 @@
 import os
 from celery import Celery
+from kombu import Queue
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gloport_backend.settings')
 app = Celery('gloport_backend')
 app.config_from_object('django.conf:settings', namespace='CELERY')
+
+# Text sections, Grok vision and housekeeping (emails, maintenance) get their
+# own queues so a slow provider can't take worker slots from the others.
+# Run one worker pool per queue, e.g.
+#   celery -A gloport_backend worker -Q llm_text -c 16
+#   celery -A gloport_backend worker -Q llm_vision -c 4
+#   celery -A gloport_backend worker -Q housekeeping -c 2
+LLM_TEXT_QUEUE = 'llm_text'
+LLM_VISION_QUEUE = 'llm_vision'
+HOUSEKEEPING_QUEUE = 'housekeeping'
+
+GROK_PROMPT_ID = 10  # Image analysis section, sent to Grok
+
+app.conf.task_queues = (
+    Queue(LLM_TEXT_QUEUE),
+    Queue(LLM_VISION_QUEUE),
+    Queue(HOUSEKEEPING_QUEUE),
+)
+app.conf.task_default_queue = HOUSEKEEPING_QUEUE
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    if name == 'api.tasks.generate_prompt_in_background':
+        prompt_id = kwargs.get('prompt_id', args[1] if len(args) > 1 else None)
+        return {'queue': LLM_VISION_QUEUE if prompt_id == GROK_PROMPT_ID else LLM_TEXT_QUEUE}
+    return None
+
+app.conf.task_routes = (route_task,)
 app.autodiscover_tasks()
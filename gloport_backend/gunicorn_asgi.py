@@ -0,0 +1,22 @@
+"""
+Gunicorn profile for serving the app over ASGI with uvicorn workers, so the
+async views (ASYNC_VIEWS=true) can hold many concurrent requests that are
+waiting on the database, Redis or an LLM provider:
+
+    ASYNC_VIEWS=true gunicorn -c gloport_backend/gunicorn_asgi.py gloport_backend.asgi:application
+
+The sync profile stays as it was: gunicorn gloport_backend.wsgi
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+# One event loop per worker, a couple per core is plenty
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2))
+# Generation requests wait on two LLM calls before responding
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 180))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 5000))
+max_requests_jitter = 500
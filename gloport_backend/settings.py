@@ -13,7 +13,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 import os
-from google.oauth2 import service_account
+from django.utils.functional import SimpleLazyObject
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -61,6 +61,15 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 SIMPLE_JWT = {
@@ -76,6 +85,7 @@ DJOSER = {
 }
 
 MIDDLEWARE = [
+    "api.profiling.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     'corsheaders.middleware.CorsMiddleware',
@@ -84,6 +94,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "api.db_router.ReplicaRoutingMiddleware",
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -107,6 +118,12 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "gloport_backend.wsgi.application"
+ASGI_APPLICATION = "gloport_backend.asgi.application"
+
+# Serve the I/O-bound endpoints (generate, status, prompt status, output check) from the
+# async views in api/async_views.py. Only turn on when running under ASGI, see
+# gloport_backend/gunicorn_asgi.py; under WSGI every async view would run in its own event loop.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'false').lower() in ('1', 'true')
 
 
 # Database
@@ -123,6 +140,31 @@ DATABASES = {
     }
 }
 
+# Read replicas of the primary (api/db_router.py): DB_REPLICA_HOSTS=host[:port],... with the
+# primary's database name and credentials. Unset, everything reads from the primary.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+# Seconds a doctor's reads stay on the primary after they changed something, longer than the replication lag
+DB_PRIMARY_STICKY_SECONDS = int(os.environ.get('DB_PRIMARY_STICKY_SECONDS', 10))
+
+# Per-request profiling (api/profiling.py): Server-Timing headers and a log line with the SQL,
+# Redis and LLM time of a PROFILING_SAMPLE_RATE share of requests (0 to 1), and of requests
+# sent with an X-Profile: <PROFILING_HEADER_SECRET> header. Empty secret, no header profiling.
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_HEADER_SECRET = os.environ.get('PROFILING_HEADER_SECRET', '')
+# Profiled requests slower than this many ms also log a sampling trace (needs pyinstrument)
+PROFILING_TRACE_MS = int(os.environ['PROFILING_TRACE_MS']) if os.environ.get('PROFILING_TRACE_MS') else None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -167,11 +209,22 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = 'api.CustomUser'
 
-GS_CREDENTIALS = service_account.Credentials.from_service_account_file(
-    os.path.join(BASE_DIR, "gloport_backend/config/gcp_service_account.json")
+# GS_SERVICE_ACCOUNT_FILE points elsewhere for local runs, e.g. the benchmark suite's throwaway
+# key (set STORAGE_EMULATOR_HOST as well to talk to a GCS emulator instead of Google)
+GS_SERVICE_ACCOUNT_FILE = os.environ.get(
+    'GS_SERVICE_ACCOUNT_FILE', os.path.join(BASE_DIR, "gloport_backend/config/gcp_service_account.json")
 )
 
+def _gs_credentials():
+    from google.oauth2 import service_account
+    return service_account.Credentials.from_service_account_file(GS_SERVICE_ACCOUNT_FILE)
+
+# Read on first use (api/clients.py), not every time settings are imported
+GS_CREDENTIALS = SimpleLazyObject(_gs_credentials)
+
 GS_BUCKET_NAME = os.environ.get('GS_BUCKET_NAME')
+GS_SIGNED_URL_EXPIRY_HOURS = int(os.environ.get('GS_SIGNED_URL_EXPIRY_HOURS', 72))
+GS_SIGNED_URL_REFRESH_MARGIN_MINUTES = int(os.environ.get('GS_SIGNED_URL_REFRESH_MARGIN_MINUTES', 60))
 
 EMAIL_PORT = 465
 # EMAIL_BACKEND = 'django_smtp_ssl.SSLEmailBackend'
@@ -181,13 +234,135 @@ EMAIL_HOST = os.environ.get('EMAIL_HOST')
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', 20))
+
+# Emails are queued in Redis and sent by the housekeeping workers (api.tasks.deliver_queued_emails)
+EMAIL_BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE', 50))
+EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', 5))
+EMAIL_RETRY_DELAY = int(os.environ.get('EMAIL_RETRY_DELAY', 30))  # Seconds, doubled on each attempt
+
+# Login OTPs live in Redis (api.otp), they are never written to the database
+OTP_LENGTH = 6
+OTP_VALIDITY_MINUTES = int(os.environ.get('OTP_VALIDITY_MINUTES', 10))
+OTP_MAX_ATTEMPTS = int(os.environ.get('OTP_MAX_ATTEMPTS', 5))  # Wrong codes before the OTP is discarded
+# Wrong codes are counted per email for this long after the first one, across re-issued OTPs
+OTP_LOCKOUT_MINUTES = int(os.environ.get('OTP_LOCKOUT_MINUTES', 30))
+
+# Section texts of consultations older than this many days are moved to the bucket (api/archive.py),
+# LLM_OUTPUT_ARCHIVE_AFTER_DAYS= (empty) keeps them all in the database
+LLM_OUTPUT_ARCHIVE_AFTER_DAYS = int(os.environ.get('LLM_OUTPUT_ARCHIVE_AFTER_DAYS', '90') or 0) or None
+LLM_OUTPUT_ARCHIVE_BATCH_SIZE = int(os.environ.get('LLM_OUTPUT_ARCHIVE_BATCH_SIZE', 200))  # Consultations per task run
+# Seconds an archived consultation fetched from the bucket stays in the cache
+LLM_OUTPUT_ARCHIVE_CACHE_SECONDS = int(os.environ.get('LLM_OUTPUT_ARCHIVE_CACHE_SECONDS', 60 * 60))
+
+# Readings scored per UPDATE by api.tasks.score_unscored_readings and rescore_readings
+READING_SCORE_BATCH_SIZE = int(os.environ.get('READING_SCORE_BATCH_SIZE', 5000))
+# Seconds each process caches the SensorReferenceRange rows (api/triage.py)
+REFERENCE_RANGES_CACHE_TTL = int(os.environ.get('REFERENCE_RANGES_CACHE_TTL', 60))
+# Monthly partitions of the readings table on Postgres (api/partitions.py), created this many months ahead
+READING_PARTITIONS_AHEAD = int(os.environ.get('READING_PARTITIONS_AHEAD', 3))
+# Months of readings to keep, older months are detached from the table. Unset keeps everything.
+READING_RETENTION_MONTHS = int(os.environ['READING_RETENTION_MONTHS']) if os.environ.get('READING_RETENTION_MONTHS') else None
+# Drop detached months instead of leaving them as standalone tables to dump to cold storage
+READING_RETENTION_DROP = os.environ.get('READING_RETENTION_DROP', 'false').lower() in ('1', 'true')
 
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL')
-REDIS_URL = os.environ.get('REDIS_URL')
+# Needed for the chord that runs api.tasks.finalize_consultation after a consultation's sections
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', os.environ.get('REDIS_URL'))
+CELERY_RESULT_EXPIRES = int(os.environ.get('CELERY_RESULT_EXPIRES', 60 * 60))
+# Tasks spend most of their time waiting on LLM providers: reserve one task at a
+# time per worker process and acknowledge only once it finishes, so queued work
+# is never stuck behind a slow task on a busy worker.
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.environ.get('CELERY_WORKER_PREFETCH_MULTIPLIER', 1))
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+# Redis keeps a list per priority and workers drain them in order (0 first), see SECTION_PRIORITY_ORDER
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+# Periodic tasks, run by a single `celery -A gloport_backend beat` process
+CELERY_BEAT_SCHEDULE = {
+    'score-unscored-readings': {
+        'task': 'api.tasks.score_unscored_readings',
+        'schedule': int(os.environ.get('READING_SCORE_INTERVAL', 60)),
+    },
+    'manage-reading-partitions': {
+        'task': 'api.tasks.manage_reading_partitions',
+        'schedule': 24 * 60 * 60,
+    },
+    'archive-old-consultations': {
+        'task': 'api.tasks.archive_old_consultations',
+        'schedule': 60 * 60,
+    },
+}
+REDIS_URL = os.environ.get('REDIS_URL')  # Redis 6.2 or newer
 
 GROK_KEY = os.environ.get('GROK_KEY')
 GROK_MODEL = os.environ.get('GROK_MODEL')
 GROK_URL = os.environ.get('GROK_URL')
 
 GPT_KEY = os.environ.get('GPT_KEY')
-GPT_MODEL = os.environ.get('GPT_MODEL')
\ No newline at end of file
+GPT_MODEL = os.environ.get('GPT_MODEL')
+GPT_URL = os.environ.get('GPT_URL')  # Optional, e.g. a local OpenAI-compatible fake for testing
+# "fanout": one completion per section. "combined": all text sections in one structured-output completion.
+LLM_GENERATION_MODE = os.environ.get('LLM_GENERATION_MODE', 'fanout')
+# Background sections in the order the app shows them, the first is worked on first when the
+# workers are busy: summary, alerts, diagnosis, ... and the Grok image analysis last. Empty
+# (SECTION_PRIORITY_ORDER=) queues them all alike.
+SECTION_PRIORITY_ORDER = [
+    int(prompt_id) for prompt_id in os.environ.get('SECTION_PRIORITY_ORDER', '4,6,2,5,7,3,8,9,10').split(',')
+    if prompt_id.strip()
+]
+
+# LLM resilience (api/resilience.py). Timeouts are total budgets per section in seconds.
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 60))
+LLM_SECTION_TIMEOUTS = {
+    1: float(os.environ.get('LLM_TIMEOUT_SECTION_1', 45)),     # Generated inside the request
+    11: float(os.environ.get('LLM_TIMEOUT_SECTION_11', 45)),   # Generated inside the request
+    10: float(os.environ.get('LLM_TIMEOUT_SECTION_10', 120)),  # Grok vision
+    0: float(os.environ.get('LLM_TIMEOUT_COMBINED', 180)),      # All text sections in one call
+}
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 2))
+LLM_RETRY_BACKOFF = float(os.environ.get('LLM_RETRY_BACKOFF', 1.0))
+LLM_RETRY_BACKOFF_MAX = float(os.environ.get('LLM_RETRY_BACKOFF_MAX', 8.0))
+# Seconds before a hedged second request is sent, unset to disable hedging
+LLM_HEDGE_AFTER = float(os.environ['LLM_HEDGE_AFTER']) if os.environ.get('LLM_HEDGE_AFTER') else None
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('LLM_BREAKER_FAILURE_THRESHOLD', 5))
+LLM_BREAKER_RESET_TIMEOUT = float(os.environ.get('LLM_BREAKER_RESET_TIMEOUT', 30))
+# Seconds a coalesced section result stays readable for callers that just missed it (api/coalesce.py)
+LLM_COALESCE_RESULT_TTL = int(os.environ.get('LLM_COALESCE_RESULT_TTL', 10))
+
+# Token buckets for calls from Celery workers to each provider: `rate` requests per second, bursts up to `capacity`
+LLM_PROVIDER_RATE_LIMITS = {
+    'openai': {
+        'rate': float(os.environ.get('OPENAI_RATE_LIMIT', 5)),
+        'capacity': int(os.environ.get('OPENAI_RATE_LIMIT_BURST', 20)),
+    },
+    'grok': {
+        'rate': float(os.environ.get('GROK_RATE_LIMIT', 1)),
+        'capacity': int(os.environ.get('GROK_RATE_LIMIT_BURST', 5)),
+    },
+}
+
+# Token buckets per doctor and per device serial on the LLM endpoints (api/throttling.py):
+# "generate" for new consultations (POST /generate), "reload" for regenerating a section (PUT /generate)
+LLM_THROTTLE_RATES = {
+    'generate': {
+        'rate': float(os.environ.get('GENERATE_THROTTLE_RATE', 0.05)),
+        'capacity': int(os.environ.get('GENERATE_THROTTLE_BURST', 5)),
+    },
+    'reload': {
+        'rate': float(os.environ.get('RELOAD_THROTTLE_RATE', 0.2)),
+        'capacity': int(os.environ.get('RELOAD_THROTTLE_BURST', 20)),
+    },
+}
+
+# POST /generate responses are kept this long (seconds) for retries with the same Idempotency-Key
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+# How long a retry waits for the original request that is still running
+IDEMPOTENCY_WAIT_TIMEOUT = int(os.environ.get('IDEMPOTENCY_WAIT_TIMEOUT', 300))
+
+# Bearer token for the Prometheus scraper on /metrics, admins can always read it
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
\ No newline at end of file